@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from framing import TYPE_INIT, TYPE_AGREE, TYPE_REQ, TYPE_RESP
+
+# 并发连接基准测试：启动单核的协程模式 reversetcpserver，
+# 让 N 个客户端同时保持连接并各自完成 INIT/AGREE/REQ/RESP 交互
+# 用法示例：python bench_concurrency.py --clients 10000 --engine asyncio
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def raise_fd_limit(needed):
+    # 尽量把文件描述符上限提高到 needed（服务端和客户端各占一半连接）
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def start_server(port, engine, backlog, max_connections, workers=1, pin=True):
+    # 在子进程中启动服务器
+    # - workers: 工作进程数，不为 1 时使用预分叉模式
+    # - pin: 是否把服务器绑定到单个 CPU 核心
+    if workers != 1:
+        call = f"s.serve_prefork('127.0.0.1', {port}, '{engine}', {backlog}, {max_connections}, {workers or os.cpu_count()})"
+    elif engine == 'thread':
+        call = f"s.serve_threaded('127.0.0.1', {port}, {backlog}, {max_connections})"
+    else:
+        call = f"s.run_async_server('127.0.0.1', {port}, {backlog}, {max_connections}, use_uvloop={engine == 'uvloop'})"
+    proc = subprocess.Popen([sys.executable, '-c', "import reversetcpserver as s;" + call], cwd=HERE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if pin and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(proc.pid, {min(os.sched_getaffinity(0))})
+
+    # 等待端口可连接
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("服务器启动超时")
+
+
+def server_usage(pid):
+    # 读取服务器进程的常驻内存（KB）和 CPU 时间（秒），仅 Linux 可用
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return rss, cpu
+    except (OSError, StopIteration, ValueError):
+        return None, None
+
+
+async def exchange(reader, writer, payload):
+    # 发送一个 ReverseRequest 并校验 ReverseAnswer
+    writer.write(struct.pack('!BI', TYPE_REQ, len(payload)) + payload)
+    packet_type, length = struct.unpack('!BI', await reader.readexactly(5))
+    data = await reader.readexactly(length)
+    if packet_type != TYPE_RESP or data != payload[::-1]:
+        raise ValueError("响应内容错误")
+
+
+async def one_client(port, payload, connect_slots, all_connected, counters):
+    # 单个客户端：建立连接后等待所有客户端就绪，再完成第二次交互
+    async with connect_slots:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(struct.pack('!BI', TYPE_INIT, 2))
+        if (await reader.readexactly(1))[0] != TYPE_AGREE:
+            raise ValueError("未收到 AGREE 报文")
+        await exchange(reader, writer, payload)
+    counters['connected'] += 1
+    if counters['connected'] == counters['target']:
+        all_connected.set()
+    try:
+        await all_connected.wait()# 所有连接同时保持打开
+        await exchange(reader, writer, payload)
+    finally:
+        writer.close()
+
+
+async def run_clients(clients, port, payload, connect_concurrency, hold_timeout, server_pid):
+    connect_slots = asyncio.Semaphore(connect_concurrency)
+    all_connected = asyncio.Event()
+    counters = {'connected': 0, 'target': clients}
+    start = time.perf_counter()
+    tasks = [asyncio.ensure_future(one_client(port, payload, connect_slots, all_connected, counters))
+             for _ in range(clients)]
+
+    # 等待全部客户端建立连接，失败的客户端会让目标数减一
+    def on_done(task):
+        if task.exception() is not None and not all_connected.is_set():
+            counters['target'] -= 1
+            if counters['connected'] == counters['target']:
+                all_connected.set()
+    for task in tasks:
+        task.add_done_callback(on_done)
+    try:
+        await asyncio.wait_for(all_connected.wait(), hold_timeout)
+    except asyncio.TimeoutError:
+        all_connected.set()
+    connect_time = time.perf_counter() - start
+    held = counters['connected']
+    peak_rss, _ = server_usage(server_pid)# 所有连接保持打开时的服务器内存
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    total_time = time.perf_counter() - start
+    failures = [r for r in results if isinstance(r, BaseException)]
+    return held, connect_time, total_time, failures, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reversetcpserver 并发连接基准测试")
+    parser.add_argument('--clients', type=int, default=10000, help="并发客户端数")
+    parser.add_argument('--port', type=int, default=23456, help="服务器端口")
+    parser.add_argument('--engine', choices=['thread', 'asyncio', 'uvloop'], default='asyncio', help="服务器模式")
+    parser.add_argument('--backlog', type=int, default=4096, help="服务器监听队列大小")
+    parser.add_argument('--max-connections', type=int, default=0, help="服务器最大并发连接数")
+    parser.add_argument('--chunk-size', type=int, default=64, help="每次请求的数据块长度")
+    parser.add_argument('--connect-concurrency', type=int, default=512, help="同时发起的连接数")
+    parser.add_argument('--timeout', type=float, default=120.0, help="等待全部连接建立的超时（秒）")
+    args = parser.parse_args()
+
+    raise_fd_limit(2 * args.clients + 256)
+    proc = start_server(args.port, args.engine, args.backlog, args.max_connections)
+    try:
+        payload = b'0123456789abcdef' * (args.chunk_size // 16) + b'x' * (args.chunk_size % 16)
+        rss_before, _ = server_usage(proc.pid)
+        held, connect_time, total_time, failures, peak_rss = asyncio.run(
+            run_clients(args.clients, args.port, payload, args.connect_concurrency, args.timeout, proc.pid))
+        _, cpu = server_usage(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(f"服务器模式: {args.engine}（单核）")
+    print(f"客户端数: {args.clients}，同时保持的连接数: {held}，失败: {len(failures)}")
+    print(f"全部连接建立耗时: {connect_time:.2f} s，总耗时: {total_time:.2f} s")
+    print(f"完成请求数: {2 * (args.clients - len(failures))}，"
+          f"请求速率: {2 * (args.clients - len(failures)) / total_time:.0f} 次/s")
+    if peak_rss is not None:
+        print(f"服务器常驻内存: 空闲 {rss_before} KB，连接全部保持时 {peak_rss} KB，"
+              f"每连接约 {(peak_rss - rss_before) / max(held, 1):.1f} KB，CPU 时间: {cpu:.2f} s")
+    if failures:
+        print(f"首个错误: {failures[0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import hashlib
+import struct
+import zlib
+
+# 报文类型
+TYPE_INIT = 1  # 初始化报文，客户端发送总块数
+TYPE_AGREE = 2  # 同意报文，服务器确认初始化
+TYPE_REQ = 3   # 请求报文，客户端发送数据块
+TYPE_RESP = 4  # 响应报文，服务器返回反转后的数据块
+TYPE_INIT_EXT = 5   # 扩展初始化报文：总块数 + 4 字节能力位
+TYPE_AGREE_EXT = 6  # 扩展同意报文：服务器接受的能力位
+TYPE_BREQ = 7   # 批量请求报文，一帧携带多个数据块
+TYPE_BRESP = 8  # 批量响应报文，按请求顺序携带多个反转数据块
+TYPE_DREQ = 9   # 去重请求报文：只携带数据块的摘要
+TYPE_DMISS = 10  # 去重未命中报文：服务器没有缓存该摘要，请客户端补发数据（无数据部分）
+TYPE_DFILL = 11  # 去重补发报文：摘要 + 数据块，服务器反转后写入缓存，按 RESP 响应
+FLAG_COMPRESSED = 0x80  # 类型字节的最高位：报文体经过 zlib 压缩（需已协商 CAP_COMPRESS），其余 7 位为原类型
+
+# 能力位，在 INIT_EXT/AGREE_EXT 握手中协商；旧版本对端只使用基本报文
+CAP_BATCH = 0x01  # 支持 BREQ/BRESP 批量报文
+CAP_DEDUP = 0x02  # 支持 DREQ/DMISS/DFILL 去重报文
+CAP_COMPRESS = 0x04  # 支持压缩报文体；能力字的第 8-11 位为客户端选择的压缩级别，双方都按该级别压缩
+CAP_COMPRESS_STREAM = 0x08  # 压缩时每个方向整条连接共用一个 deflate 流，后面的帧可以引用前面帧的内容
+COMPRESS_LEVEL_SHIFT = 8
+COMPRESS_LEVEL_MASK = 0xF << COMPRESS_LEVEL_SHIFT
+COMPRESS_LEVEL_MAX = 9  # zlib 支持的最高压缩级别；级别字段可表示 0-15，更高的级别 zlib 会抛出 ValueError
+
+# 报文首部：1 字节类型 + 4 字节无符号整数（总块数、数据长度或能力位），大端序
+HEADER = struct.Struct('!BI')
+UINT = struct.Struct('!I')
+
+# 报文体的长度上限：长度字段来自对端，不加限制时一个首部就能让接收方分配最多 4 GiB 的缓冲区
+MAX_FRAME = 1 << 28
+
+# 单次 sendmsg 的最大缓冲区个数（Linux 的 IOV_MAX）
+IOV_MAX = 1024
+
+# 去重用的数据块摘要长度（字节）
+DIGEST_SIZE = 16
+
+# 报文体短于该长度时不压缩：zlib 的固定开销使短报文压缩后反而可能变长
+COMPRESS_MIN = 128
+# 解压后报文体的长度上限，防止很小的压缩数据解压出巨大的报文；与未压缩的报文相同
+MAX_DECOMPRESSED = MAX_FRAME
+
+
+def chunk_digest(data):
+    # 数据块的内容摘要（BLAKE2b，16 字节），作为去重缓存的键，客户端和服务器共用
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def send_buffers(sock, buffers):
+    # 用 sendmsg 分散/聚集发送多个缓冲区，首部和数据无需拼接
+    # 不支持 sendmsg 的平台（如 Windows）退化为拼接后 sendall
+    # 参数：
+    # - sock: TCP 套接字
+    # - buffers: bytes/bytearray/memoryview 列表
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(b) for b in buffers]
+    i = 0
+    while i < len(views):
+        if not len(views[i]):
+            i += 1  # 跳过空缓冲区
+            continue
+        sent = sock.sendmsg(views[i:i + IOV_MAX])
+        # 根据实际发送的字节数前移，处理部分发送
+        while sent:
+            n = len(views[i])
+            if sent >= n:
+                sent -= n
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
+
+
+def pack_batch(frame_type, chunks):
+    # 构造批量报文的缓冲区列表：首部 + 块数与各块长度表 + 各数据块
+    # 报文体格式：4 字节块数 n + n 个 4 字节长度 + 按顺序排列的数据
+    # 返回：可直接交给 send_buffers 的列表
+    lengths = [len(c) for c in chunks]
+    table = struct.pack(f'!I{len(lengths)}I', len(lengths), *lengths)
+    return [HEADER.pack(frame_type, len(table) + sum(lengths)), table] + list(chunks)
+
+
+def unpack_batch(body):
+    # 解析批量报文体，返回 (各块长度元组, 数据区 memoryview)
+    count = UINT.unpack_from(body, 0)[0]
+    lengths = struct.unpack_from(f'!{count}I', body, UINT.size)
+    data = body[UINT.size * (count + 1):]
+    if sum(lengths) != len(data):
+        raise ValueError("批量报文长度表与数据长度不一致")
+    return lengths, data
+
+
+def split_batch(lengths, data):
+    # 按长度表把数据区切分为各块的 memoryview 切片
+    chunks = []
+    offset = 0
+    for length in lengths:
+        chunks.append(data[offset:offset + length])
+        offset += length
+    return chunks
+
+
+class FrameReader:
+    # 带预分配缓冲区的报文读取器，客户端和服务器共用
+    # 用 recv_into 把数据直接读入缓冲区，一次 recv 可同时取到首部和数据，
+    # 返回的是缓冲区上的 memoryview 切片，不复制数据
+    # 注意：返回的切片只在下一次读取之前有效，需要保留时应复制为 bytes
+
+    def __init__(self, sock, capacity=65536):
+        # 参数：
+        # - sock: TCP 套接字
+        # - capacity: 缓冲区初始容量（字节），报文超过容量时按倍数扩容
+        self.sock = sock
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.start = 0  # 未消费数据的起点
+        self.end = 0    # 已接收数据的终点
+
+    def _make_room(self, need):
+        # 保证从 start 开始有 need 字节的空间
+        pending = self.end - self.start
+        if need > len(self.buf):
+            # 扩容为至少两倍，分配次数随报文长度对数增长
+            new_buf = bytearray(max(need, 2 * len(self.buf)))
+            new_buf[:pending] = self.view[self.start:self.end]
+            self.buf = new_buf
+            self.view = memoryview(new_buf)
+        else:
+            # 把未消费数据移到缓冲区开头
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start = 0
+        self.end = pending
+
+    def _fill(self, need):
+        # 接收数据，直到缓冲区中至少有 need 字节未消费数据
+        if self.start == self.end:
+            self.start = self.end = 0  # 缓冲区已全部消费，从头开始使用
+        if self.start + need > len(self.buf):
+            self._make_room(need)
+        while self.end - self.start < need:
+            n = self.sock.recv_into(self.view[self.end:])  # 尽可能多地读入，减少系统调用
+            if n == 0:
+                raise EOFError('意外关闭')  # 连接意外关闭
+            self.end += n
+
+    def read_exact(self, length):
+        # 读取 length 字节，返回 memoryview 切片
+        self._fill(length)
+        data = self.view[self.start:self.start + length]
+        self.start += length
+        return data
+
+    def read_header(self):
+        # 读取 5 字节首部，返回 (类型, 整数字段)
+        self._fill(HEADER.size)
+        packet_type, value = HEADER.unpack_from(self.buf, self.start)
+        self.start += HEADER.size
+        return packet_type, value
+
+    def read_frame(self):
+        # 读取完整报文（首部 + 数据），返回 (类型, 数据的 memoryview)
+        # 首部和数据一起确保到位，数据通常与首部在同一次 recv 中到达
+        # 首部声明的长度超过 MAX_FRAME 时抛出 ValueError，不为其分配缓冲区，调用者应断开连接
+        self._fill(HEADER.size)
+        packet_type, length = HEADER.unpack_from(self.buf, self.start)
+        if length > MAX_FRAME:
+            raise ValueError(f"报文长度 {length} 超过上限 {MAX_FRAME}")
+        self._fill(HEADER.size + length)
+        body_start = self.start + HEADER.size
+        self.start = body_start + length
+        return packet_type, self.view[body_start:self.start]
+
+
+def compress_caps(level, stream=False):
+    # 请求压缩时的能力位：CAP_COMPRESS + 压缩级别（1-9），stream 为 True 时加 CAP_COMPRESS_STREAM
+    # level 为 0 时返回 0，即不请求压缩
+    if not level:
+        return 0
+    return CAP_COMPRESS | (CAP_COMPRESS_STREAM if stream else 0) | (level << COMPRESS_LEVEL_SHIFT)
+
+
+class FrameCodec:
+    # 协商了 CAP_COMPRESS 的连接上的报文体压缩与解压，每个连接一个，客户端和服务器共用
+    # - 逐帧模式：每帧独立用 zlib 压缩，压缩后不比原来短时按原样发送
+    # - 流模式（CAP_COMPRESS_STREAM）：每个方向共用一个 deflate 流，每帧以 Z_SYNC_FLUSH 结束，
+    #   帧之间重复的内容（例如日志中相同的行）也能被压缩；依赖 TCP 按序交付，
+    #   发送方必须按实际发送的顺序调用 encode，接收方按接收顺序调用 decode
+    # 统计两个方向报文体的逻辑字节数（压缩前）和线上字节数（实际传输），不含 5 字节首部
+
+    def __init__(self, caps, threshold=COMPRESS_MIN):
+        # 参数：
+        # - caps: 协商后的能力位，从中取压缩级别和是否为流模式
+        # - threshold: 报文体短于该长度时不压缩
+        self.level = (caps & COMPRESS_LEVEL_MASK) >> COMPRESS_LEVEL_SHIFT or zlib.Z_DEFAULT_COMPRESSION
+        self.stream = bool(caps & CAP_COMPRESS_STREAM)
+        self.threshold = threshold
+        self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if self.stream else None
+        self.decompressor = zlib.decompressobj(-15) if self.stream else None
+        self.sent_logical = 0
+        self.sent_wire = 0
+        self.received_logical = 0
+        self.received_wire = 0
+
+    def encode(self, buffers):
+        # 压缩一帧：buffers 为 [首部, 报文体的各个缓冲区...]
+        # 返回：要发送的缓冲区列表，压缩后首部的类型字节置 FLAG_COMPRESSED，长度为压缩后的长度
+        size = sum(len(b) for b in buffers) - HEADER.size
+        self.sent_logical += size
+        if size < self.threshold:
+            self.sent_wire += size
+            return buffers
+        body = b''.join(buffers[1:])
+        if self.stream:
+            # 已送入流中的数据必须发送，否则接收方的解压状态会与发送方不一致
+            data = self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            data = zlib.compress(body, self.level)
+            if len(data) >= size:
+                self.sent_wire += size
+                return buffers
+        self.sent_wire += len(data)
+        return [HEADER.pack(buffers[0][0] | FLAG_COMPRESSED, len(data)), data]
+
+    def decode(self, packet_type, body):
+        # 解压一帧，返回 (原报文类型, 报文体)；未压缩的帧原样返回
+        # 解压后过长时抛出 ValueError，压缩数据损坏时抛出 zlib.error
+        self.received_wire += len(body)
+        if not packet_type & FLAG_COMPRESSED:
+            self.received_logical += len(body)
+            return packet_type, body
+        decompressor = self.decompressor if self.stream else zlib.decompressobj()
+        data = decompressor.decompress(body, MAX_DECOMPRESSED)
+        if decompressor.unconsumed_tail or not (self.stream or decompressor.eof):
+            raise ValueError("压缩报文不完整或解压后过长")
+        self.received_logical += len(data)
+        return packet_type & ~FLAG_COMPRESSED, memoryview(data)
+
+    def stats(self):
+        # 返回统计信息字典
+        return {
+            'level': self.level,
+            'stream': self.stream,
+            'sent_logical': self.sent_logical,
+            'sent_wire': self.sent_wire,
+            'received_logical': self.received_logical,
+            'received_wire': self.received_wire,
+        }
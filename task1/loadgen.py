@@ -0,0 +1,163 @@
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+from reversetcpclient import (ALLOWED_BYTES, CAP_BATCH, open_session, chunk_sizes, iter_frames,
+                              transfer_pipelined)
+from bench_concurrency import start_server, raise_fd_limit
+
+# 反转协议的负载生成与基准测试工具（非交互）
+# 复用 reversetcpclient 的握手、分块和流水线传输逻辑，模拟 M 个并发客户端，
+# 统计块速率、字节速率和每块时延分位数，并把结果保存为 JSON 以便比较不同服务器模式
+# 用法示例：
+#   python loadgen.py --engine asyncio --clients 50 --file-size 1000000 --lmin 50 --lmax 500
+#   python loadgen.py --engine none --port 12345 --output results.json   # 测试已运行的服务器
+
+
+def make_input_file(path, size, seed):
+    # 生成 size 字节的随机 ASCII 文本（可打印字符 + 换行），内容由 seed 决定
+    rng = random.Random(seed)
+    alphabet = ALLOWED_BYTES.replace(b'\r', b'')
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            n = min(remaining, 1 << 20)
+            f.write(bytes(rng.choices(alphabet, k=n)))
+            remaining -= n
+
+
+def percentile(sorted_values, q):
+    # 最近秩法求分位数，q 取 0-100
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_client(args, input_file, file_size, client_id, barrier, result):
+    # 单个模拟客户端：按顺序完成 args.sessions 次完整的 INIT/AGREE/REQ/RESP 会话
+    latencies = []
+    chunks = nbytes = 0
+    barrier.wait()# 所有客户端同时开始
+    for session in range(args.sessions):
+        seed = args.seed * 1000003 + client_id * 1009 + session# 每个会话不同的分块方案
+        total = sum(1 for _ in chunk_sizes(file_size, args.lmin, args.lmax, random.Random(seed)))
+        sock, reader, caps = open_session(args.host, args.port, total, CAP_BATCH if args.batch > 1 else 0)
+        try:
+            batch_size = args.batch if caps & CAP_BATCH else 1
+            with open(input_file, 'rb') as f:
+                frames = iter_frames(f, chunk_sizes(file_size, args.lmin, args.lmax, random.Random(seed)), batch_size)
+                transfer_pipelined(sock, reader, frames, total, args.depth, lambda i, o, d: None,
+                                   latencies=latencies)
+        finally:
+            sock.close()
+        chunks += total
+        nbytes += file_size
+    result.update(chunks=chunks, bytes=nbytes, latencies=latencies)
+
+
+def run_load(args, input_file, file_size):
+    # 启动所有模拟客户端并等待结束，返回汇总结果
+    # 有客户端出错时中止屏障，其余客户端和主线程不再等待；错误记录在结果的 errors 中
+    barrier = threading.Barrier(args.clients + 1)
+    results = [{} for _ in range(args.clients)]
+    errors = []
+
+    def worker(k):
+        try:
+            run_client(args, input_file, file_size, k, barrier, results[k])
+        except threading.BrokenBarrierError:
+            pass# 其他客户端出错中止了屏障，原因已记录在 errors 中
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=worker, args=(k,), daemon=True) for k in range(args.clients)]
+    for t in threads:
+        t.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass# 有客户端在开始前出错，等待其余客户端结束后照常汇总
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for r in results for l in r.get('latencies', ()))
+    chunks = sum(r.get('chunks', 0) for r in results)
+    nbytes = sum(r.get('bytes', 0) for r in results)
+    return {
+        'elapsed_s': elapsed,
+        'chunks': chunks,
+        'bytes': nbytes,
+        'chunks_per_s': chunks / elapsed,
+        'mb_per_s': nbytes / elapsed / 1e6,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'p999': percentile(latencies, 99.9) * 1000,
+            'max': (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        'errors': [repr(e) for e in errors],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reversetcpserver 负载生成与基准测试")
+    parser.add_argument('--host', default='127.0.0.1', help="服务器地址")
+    parser.add_argument('--port', type=int, default=23500, help="服务器端口")
+    parser.add_argument('--engine', choices=['thread', 'asyncio', 'uvloop', 'none'], default='thread',
+                        help="在本机启动的服务器模式，none 表示使用已运行的服务器")
+    parser.add_argument('--workers', type=int, default=1, help="服务器工作进程数（预分叉模式，0 为每核一个）")
+    parser.add_argument('--clients', type=int, default=10, help="并发客户端数 M")
+    parser.add_argument('--sessions', type=int, default=1, help="每个客户端依次完成的会话数")
+    parser.add_argument('--file-size', type=int, default=1 << 20, help="每个会话发送的文件大小（字节）")
+    parser.add_argument('--lmin', type=int, default=5, help="块最小长度 Lmin")
+    parser.add_argument('--lmax', type=int, default=10, help="块最大长度 Lmax")
+    parser.add_argument('--depth', type=int, default=16, help="流水线深度（在途帧数）")
+    parser.add_argument('--batch', type=int, default=1, help="每帧批量块数")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子（文件内容和分块方案）")
+    parser.add_argument('--output', help="保存 JSON 结果的文件路径")
+    args = parser.parse_args()
+    if args.lmin <= 0 or args.lmax < args.lmin:
+        parser.error("Lmin 必须大于 0 且不大于 Lmax")
+
+    raise_fd_limit(4 * args.clients + 256)
+    proc = None
+    if args.engine != 'none':
+        proc = start_server(args.port, args.engine, 4096, 0, args.workers, pin=False)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_file = os.path.join(tmp, 'input.txt')
+            make_input_file(input_file, args.file_size, args.seed)
+            results = run_load(args, input_file, args.file_size)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    latency = results['latency_ms']
+    print(f"服务器模式: {args.engine}，工作进程: {args.workers}，客户端: {args.clients}，"
+          f"每客户端会话: {args.sessions}，深度: {args.depth}，批量: {args.batch}")
+    print(f"用时 {results['elapsed_s']:.3f} s，块数 {results['chunks']}，字节 {results['bytes']}")
+    print(f"吞吐量: {results['chunks_per_s']:.0f} 块/s，{results['mb_per_s']:.2f} MB/s")
+    print(f"每块时延: p50 {latency['p50']:.3f} ms，p99 {latency['p99']:.3f} ms，"
+          f"p999 {latency['p999']:.3f} ms，最大 {latency['max']:.3f} ms")
+    if results['errors']:
+        print(f"错误 {len(results['errors'])} 个，首个: {results['errors'][0]}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'config': vars(args), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import bisect
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 服务器监控：计数器、仪表、时延直方图，以及分级、可采样的日志
+# - Registry 汇总本进程的所有指标，导出为 Prometheus 文本格式或 JSON
+# - MetricsServer 在后台线程中提供 HTTP 接口：/metrics（Prometheus）和 /metrics.json
+# - setup_logging 返回标准库 logger；DEBUG 级别用于逐包/逐块日志，可按 1/N 采样或整体关闭
+# 指标的更新都是 O(1)（直方图为 O(log 桶数)），只在导出时遍历
+# 两个任务共用这一份代码：task2/metrics.py 只按路径加载本文件，修改只需在这里进行
+
+# 默认时延桶（秒）：50 微秒到约 13 秒，按 2 倍递增
+DEFAULT_BUCKETS = tuple(0.00005 * 2 ** i for i in range(19))
+
+
+class Counter:
+    # 只增不减的计数器；fn 不为 None 时导出时调用 fn() 取值（用于已有的计数）
+    kind = 'counter'
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    # 可增可减的当前值，例如活动连接数
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+
+class Histogram:
+    # 固定桶直方图（Prometheus 语义：le 为桶的上界）
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # 按桶内线性插值估计分位数（q 取 0-1），没有样本时为 None
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else low
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def get(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'p999': self.quantile(0.999),
+        }
+
+
+class Registry:
+    def __init__(self, prefix=''):
+        # prefix: 所有指标名的前缀，例如 'tcp_'
+        self.prefix = prefix
+        self.metrics = []
+        self.started = time.time()
+
+    def add(self, metric):
+        # 注册一个已创建的指标
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, fn=None):
+        return self.add(Counter(self.prefix + name, help_text, fn))
+
+    def gauge(self, name, help_text, fn=None):
+        return self.add(Gauge(self.prefix + name, help_text, fn))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(self.prefix + name, help_text, buckets))
+
+    def to_prometheus(self):
+        # Prometheus 文本格式（version 0.0.4）
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            if m.kind != 'histogram':
+                lines.append(f"{m.name} {m.get()}")
+                continue
+            cumulative = 0
+            for bound, n in zip(m.buckets, m.counts):
+                cumulative += n
+                lines.append(f'{m.name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{m.name}_bucket{{le="+Inf"}} {m.count}')
+            lines.append(f"{m.name}_sum {m.sum}")
+            lines.append(f"{m.name}_count {m.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        result = {'uptime_s': time.time() - self.started}
+        for m in self.metrics:
+            result[m.name] = m.get()
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+class MetricsServer:
+    # 在后台线程中提供指标的 HTTP 接口
+    def __init__(self, registry, host='127.0.0.1', port=0):
+        # 参数：
+        # - registry: 要导出的 Registry
+        # - host, port: 监听地址，端口为 0 时由系统分配，实际端口见 self.address
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body, content_type = registry.to_json(), 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # 不输出每个请求的访问日志
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SampleFilter(logging.Filter):
+    # DEBUG 级别的记录每 n 条只保留 1 条，其他级别全部保留
+    def __init__(self, n):
+        super().__init__()
+        self.n = max(1, n)
+        self.seen = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.n == 1:
+            return True
+        self.seen += 1
+        return self.seen % self.n == 1
+
+
+def setup_logging(name, level='info', sample=1):
+    # 创建输出到标准输出的 logger，格式与原来的 print 相同（只有消息本身）
+    # 参数：
+    # - level: debug/info/warning/error；debug 才输出逐包/逐块日志
+    # - sample: debug 日志每 sample 条输出 1 条
+    # 过滤器装在 logger 上，被级别或采样丢弃的记录不会格式化消息
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, level.upper()))
+    logger.propagate = False
+    for f in list(logger.filters):
+        logger.removeFilter(f)
+    if sample > 1:
+        logger.addFilter(SampleFilter(sample))
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    return logger
@@ -1,135 +1,594 @@
+import argparse
+import json
+import sys
 import socket
-import struct
 import random
 import os
+import mmap
+import threading
+import queue
+import time
 
-# 定义报文类型常量
-TYPE_INIT = 1  # 初始化报文，发送总块数
-TYPE_AGREE = 2  # 同意报文，服务器确认
-TYPE_REQ = 3   # 请求报文，发送数据块
-TYPE_RESP = 4  # 响应报文，接收反转数据块
+from framing import (FrameReader, HEADER, UINT, TYPE_INIT, TYPE_AGREE, TYPE_REQ, TYPE_RESP,
+                     TYPE_INIT_EXT, TYPE_AGREE_EXT, TYPE_BREQ, TYPE_BRESP, TYPE_DREQ, TYPE_DMISS, TYPE_DFILL,
+                     CAP_BATCH, CAP_DEDUP, CAP_COMPRESS, DIGEST_SIZE, FrameCodec, send_buffers, pack_batch,
+                     unpack_batch, split_batch, chunk_digest, compress_caps, COMPRESS_LEVEL_MAX, MAX_FRAME)
 
-def recv_all(sock, length):
-    # 接收指定长度的数据，确保完整接收
+def open_session(server_ip, server_port, total_chunks, caps):
+    # 建立 TCP 连接并完成 INIT/AGREE 握手
+    # 请求了能力位时先尝试扩展握手；旧版服务器不认识 INIT_EXT 会直接断开，
+    # 此时重新连接并使用基本握手
     # 参数：
-    # - sock: TCP 套接字
-    # - length: 期望接收的字节数
-    # 返回：接收到的字节数据
-    data = b''
-    while len(data) < length:
-        more = sock.recv(length - len(data))  # 接收剩余字节
-        if not more:
-            raise EOFError('意外关闭')  # 连接意外关闭
-        data += more
-    return data
-
-def main():
+    # - server_ip, server_port: 服务器地址
+    # - total_chunks: 总块数
+    # - caps: 希望使用的能力位，0 表示只用基本协议
+    # 返回：(套接字, FrameReader, 服务器接受的能力位)
+    if caps:
+        sock = socket.create_connection((server_ip, server_port))
+        reader = FrameReader(sock)
+        # 发送扩展初始化报文（5 字节首部 + 4 字节能力位）
+        sock.sendall(HEADER.pack(TYPE_INIT_EXT, total_chunks) + UINT.pack(caps))
+        try:
+            resp_type, accepted = reader.read_header()
+            if resp_type == TYPE_AGREE_EXT:
+                return sock, reader, accepted
+        except (EOFError, ConnectionError):
+            pass
+        sock.close()
+        print("服务器不支持扩展握手，改用基本协议")
+
+    sock = socket.create_connection((server_ip, server_port))
+    reader = FrameReader(sock)
+    # 发送初始化报文（1 字节类型 + 4 字节总块数）
+    sock.sendall(HEADER.pack(TYPE_INIT, total_chunks))
+    # 接收服务器的 AGREE 报文
+    resp_type = reader.read_exact(1)
+    if resp_type[0] != TYPE_AGREE:
+        sock.close()
+        raise ConnectionError("未收到 AGREE 报文")
+    return sock, reader, 0
+
+# 允许的字节：ASCII 可打印字符、换行符（\n）和回车符（\r）
+ALLOWED_BYTES = bytes(range(32, 127)) + b'\n\r'
+# 块数不超过该值时才逐块打印内容，避免大文件刷屏
+PRINT_LIMIT = 100
+# 去重模式下不短于该长度的单块帧先只发送摘要；更短的块直接发送数据比摘要往返更省
+DEDUP_MIN_CHUNK = 64
+# 多条连接并行时保护共用的统计字典
+STATS_LOCK = threading.Lock()
+
+def validate_ascii_file(path, block_size=1 << 20):
+    # 分块读取文件并验证只含允许的字节，内存占用与文件大小无关
+    # 用 bytes.translate 删除允许的字节，剩下的就是非法字节，整个检查在 C 层完成
+    # 返回：文件大小（字节）
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return size
+            bad = block.translate(None, ALLOWED_BYTES)
+            if bad:
+                raise ValueError(f"文件包含非 ASCII 可打印字符 (字节值: {bad[0]})")
+            size += len(block)
+
+def chunk_sizes(file_size, Lmin, Lmax, rng, start=0, stop=None):
+    # 按 Lmin 和 Lmax 随机生成各块长度（生成器，不读取文件内容）
+    # 使用同一种子（或同一随机数状态）总是得到相同的分块方案，
+    # 因此可以先计数、再重新生成一遍发送
+    # 参数：
+    # - file_size: 文件大小
+    # - rng: random.Random 实例
+    # - start, stop: 只生成从 start 开始、到 stop 为止的块（stop 默认为文件末尾）
+    index = start
+    stop = file_size if stop is None else stop
+    while index < stop:
+        remaining = file_size - index # 剩余字节数
+        max_size = min(Lmax, remaining)  # 最大块大小
+        min_size = min(Lmin, remaining) # 最小块大小
+        # 随机选择块大小
+        length = rng.randint(min_size, max_size) if min_size < max_size else max_size
+        yield length
+        index += length
+
+def split_plan(file_size, Lmin, Lmax, seed, parts):
+    # 生成一遍分块方案，统计总块数，并按字节大致均分为 parts 段，供多连接并行发送
+    # 每段记录起点处的随机数状态，各连接据此只重新生成自己那一段的块长度
+    # 返回：(总块数, [(首块序号, 块数, 起始偏移, 结束偏移, 随机数状态), ...])
+    rng = random.Random(seed)
+    sizes = chunk_sizes(file_size, Lmin, Lmax, rng)
+    ranges = []
+    count = offset = 0
+    for k in range(1, parts + 1):
+        target = file_size * k // parts# 本段的目标结束位置
+        first, start, state = count, offset, rng.getstate()
+        while offset < target:
+            offset += next(sizes)
+            count += 1
+        if count > first:
+            ranges.append((first, count - first, start, offset, state))
+    if not ranges:
+        ranges.append((0, 0, 0, 0, rng.getstate()))# 空文件也需要一次握手
+    return count, ranges
+
+def iter_frames(f, sizes, batch_size):
+    # 按分块方案惰性读取文件，每次产出一帧要发送的数据块
+    # 一帧的数据一次读入，各块是其上的 memoryview 切片
+    # 参数：
+    # - f: 以二进制方式打开的输入文件
+    # - sizes: 各块长度的可迭代对象
+    # - batch_size: 每帧块数
+    group = []
+    for length in sizes:
+        group.append(length)
+        if len(group) == batch_size:
+            yield read_group(f, group)
+            group = []
+    if group:
+        yield read_group(f, group)
+
+def read_group(f, lengths):
+    # 读取 sum(lengths) 字节并按长度切分
+    data = memoryview(f.read(sum(lengths)))
+    if len(data) != sum(lengths):
+        raise IOError("读取文件时数据不足，文件可能被修改")
+    chunks = []
+    offset = 0
+    for length in lengths:
+        chunks.append(data[offset:offset + length])
+        offset += length
+    return chunks
+
+class ReversedFileWriter:
+    # 把服务器返回的反转块直接写入输出文件：原文件 [offset, offset+len) 的块
+    # 反转后正好位于输出文件 [size-offset-len, size-offset)，输出文件预先扩展到
+    # 与输入相同的大小并做内存映射，收到一块写一块，内存占用与文件大小无关
+    # 为保持行结构，原文中的 \r\n 反转后仍写为 \r\n：块内的在写入前替换，
+    # 跨块边界的在两侧都写入后交换，两侧先后到达的情况记录在 edges 中
+
+    def __init__(self, path, size):
+        # 参数：
+        # - path: 输出文件路径
+        # - size: 输入文件大小（字节）
+        self.size = size
+        self.file = open(path, 'w+b')
+        self.file.truncate(size)# 预分配输出文件
+        self.map = mmap.mmap(self.file.fileno(), size) if size else None
+        self.edges = {}# 块边界位置 -> 先写入一侧是否构成 \r\n 的一半
+        self.lock = threading.Lock()
+
+    def write(self, offset, reversed_data):
+        # 写入一块反转数据，可被多个线程并发调用
+        # 参数：
+        # - offset: 该块在输入文件中的起始位置
+        # - reversed_data: 服务器返回的反转数据
+        data = bytes(reversed_data)
+        if b'\n\r' in data:
+            data = data.replace(b'\n\r', b'\r\n')
+        end = self.size - offset
+        start = end - len(data)
+        self.map[start:end] = data
+        with self.lock:
+            # 左边界：本块首字节是原块末尾的 \r，需与左侧块末尾的 \n 配对
+            if start > 0:
+                self._join_edge(start, reversed_data[0] == 13)
+            # 右边界：本块末字节是原块开头的 \n，需与右侧块开头的 \r 配对
+            if end < self.size:
+                self._join_edge(end, reversed_data[-1] == 10)
+
+    def _join_edge(self, pos, half):
+        # 处理位置 pos 左右两块之间的边界，另一侧尚未写入时先记录
+        other = self.edges.pop(pos, None)
+        if other is None:
+            self.edges[pos] = half
+        elif other and half:
+            self.map[pos - 1:pos + 1] = b'\r\n'
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.file.close()
+
+def send_requests(sock, frames, window, pending, errors, fills, start_index=0, start_offset=0, dedup=False,
+                  codec=None):
+    # 发送线程：连续发送请求报文，不等待对应的响应；套接字只由该线程写入
+    # 参数：
+    # - sock: 已完成握手的 TCP 套接字
+    # - frames: 产出数据块分组的迭代器，每组发送为一帧
+    # - window: 信号量，限制在途（已发送未收到响应）的帧数
+    # - pending: 队列，按发送顺序记录每帧的 (首块序号, 首块偏移, 数据块列表, 发送时刻, 摘要)，
+    #   供接收方核对、计算时延和补发数据；摘要只有去重请求帧才有，其余为 None
+    # - errors: 列表，用于把发送线程中的异常交给主线程
+    # - fills: 队列，接收方收到 DMISS 时放入该帧的 pending 记录并释放一个在途名额，
+    #   由本线程补发 DFILL（补发占用该名额）；接收方结束时放入 None
+    #   接收方自己不发送：服务器正在写一个大响应时，只有接收方在读，它若阻塞在发送上两端的缓冲区都会填满
+    # - start_index, start_offset: 第一块的序号和在文件中的偏移
+    # - dedup: 是否已协商 CAP_DEDUP
+    # - codec: 协商了压缩时为该连接的 FrameCodec，只在本线程中压缩，保证流模式下的顺序
+    def emit(entry, buffers):
+        pending.put(entry)  # 先入队再发送，接收方取出的记录一定早于对应的响应
+        send_buffers(sock, codec.encode(buffers) if codec is not None else buffers)
+
+    def emit_fill(entry):
+        index, offset, group, sent_at, digest = entry
+        emit((index, offset, group, sent_at, None),
+             [HEADER.pack(TYPE_DFILL, DIGEST_SIZE + len(group[0])), digest, group[0]])
+
+    index = start_index
+    offset = start_offset
+    groups = iter(frames)
+    try:
+        while True:
+            window.acquire()  # 在途帧数达到上限时阻塞，直到收到一个响应或需要补发
+            try:
+                fill = fills.get_nowait()
+            except queue.Empty:
+                fill = ()
+            if fill is None:
+                return  # 接收方已结束（出错）
+            if fill:
+                emit_fill(fill)
+                continue
+            group = next(groups, None)
+            if group is None:
+                break
+            digest = None
+            if len(group) == 1 and dedup and len(group[0]) >= DEDUP_MIN_CHUNK:
+                # 去重请求：只发送摘要，服务器未缓存时由接收方补发数据
+                digest = chunk_digest(group[0])
+                buffers = [HEADER.pack(TYPE_DREQ, DIGEST_SIZE), digest]
+            elif len(group) == 1:
+                # ReverseRequest 报文（1 字节类型 + 4 字节长度 + 数据），首部与数据分散发送
+                buffers = [HEADER.pack(TYPE_REQ, len(group[0])), group[0]]
+            else:
+                buffers = pack_batch(TYPE_BREQ, group)
+            emit((index, offset, group, time.perf_counter(), digest), buffers)
+            index += len(group)
+            offset += sum(len(c) for c in group)
+        # 请求已全部发出，之后的未命中仍需补发，直到接收方放入 None
+        for fill in iter(fills.get, None):
+            emit_fill(fill)
+    except Exception as e:
+        errors.append(e)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)  # 让阻塞在接收上的主线程退出
+        except OSError:
+            pass
+
+def transfer_pipelined(sock, reader, frames, total_chunks, depth, on_answer, start_index=0, start_offset=0,
+                       latencies=None, dedup=None, codec=None):
+    # 流水线传输：发送线程连续发出请求，当前线程按序接收响应
+    # 服务器按接收顺序逐帧处理，因此第 i 个响应一定对应第 i 个发出的请求帧
+    # 参数：
+    # - sock: 已完成握手的 TCP 套接字
+    # - reader: 该套接字上的 FrameReader
+    # - frames: 产出数据块分组的迭代器（见 iter_frames），多块分组需已协商 CAP_BATCH
+    # - total_chunks: 总块数
+    # - depth: 最大在途帧数（为 1 时等价于逐帧停等）
+    # - on_answer: 回调 on_answer(块序号, 原块在文件中的偏移, 反转数据)，
+    #   数据为 memoryview，只在回调内有效；去重未命中的块补发后才回调，因此回调不一定按块序号顺序
+    # - start_index, start_offset: 第一块的序号和在文件中的偏移
+    # - latencies: 不为 None 时，把每块从发送到收到响应的时延（秒）追加到该列表
+    # - dedup: 不为 None 时使用去重请求（需已协商 CAP_DEDUP），统计累加到该字典的
+    #   'hits'、'misses'（去重请求的命中和未命中数）和 'saved_bytes'（命中而不必上传的字节数）
+    # - codec: 协商了 CAP_COMPRESS 时为该连接的 FrameCodec，压缩请求、解压响应
+    window = threading.Semaphore(depth)
+    pending = queue.Queue()
+    errors = []
+    fills = queue.Queue()
+    sender = threading.Thread(target=send_requests, daemon=True,
+                              args=(sock, frames, window, pending, errors, fills, start_index, start_offset,
+                                    dedup is not None, codec))
+    sender.start()
+
+    done = 0
+    hits = misses = saved = 0
     try:
-        # 用户输入参数
-        server_ip = input("请输入服务器IP地址（如127.0.0.1）：").strip()
-        server_port = int(input("请输入服务器端口号（如12345）：").strip())
-        input_file = input("请输入要发送的ASCII文本文件名（如test.txt）：").strip()
-        Lmin = int(input("请输入每块最小长度Lmin（如5）：").strip())
-        Lmax = int(input("请输入每块最大长度Lmax（如10）：").strip())
-
-        # 验证输入
-        if not os.path.exists(input_file):
-            print(f"错误：文件 {input_file} 不存在")
-            return
-        if Lmin <= 0 or Lmax < Lmin:
-            print("错误：Lmin 必须大于 0 且不大于 Lmax")
-            return
-        if server_port < 1024 or server_port > 65535:
-            print("错误：端口号必须在 1024-65535 之间")
-            return
-
-        # 读取文件并验证 ASCII 可打印字符
+        while done < total_chunks:
+            # 接收 ReverseAnswer 报文，一次读取首部和反转数据
+            resp_type, body = reader.read_frame()
+            if codec is not None:
+                resp_type, body = codec.decode(resp_type, body)
+            index, offset, group, sent_at, digest = pending.get()
+            expected = len(group)
+            if resp_type == TYPE_DMISS and digest is not None:
+                # 服务器没有缓存该块：交给发送线程补发摘要和数据，响应按补发的顺序到达
+                # 先入队再释放名额，发送线程醒来时一定能取到该补发
+                misses += 1
+                fills.put((index, offset, group, sent_at, digest))
+                window.release()
+                continue
+            if resp_type == TYPE_RESP and expected == 1:
+                answers = [body]
+            elif resp_type == TYPE_BRESP:
+                answers = split_batch(*unpack_batch(body))
+            else:
+                raise ValueError(f"块 {index+1} 未收到正确的 ReverseAnswer 报文")
+            if len(answers) != expected:
+                raise ValueError(f"块 {index+1} 起的批量响应块数不符")
+            window.release()  # 释放一个在途名额，允许发送线程继续发送
+            if digest is not None:
+                hits += 1
+                saved += len(group[0])# 去重命中：数据块没有上传
+            if latencies is not None:
+                latencies.extend([time.perf_counter() - sent_at] * expected)# 同一帧的块时延相同
+            for reversed_data in answers:
+                on_answer(index, offset, reversed_data)
+                index += 1
+                offset += len(reversed_data)
+            done += expected
+    except (EOFError, OSError):
+        if errors:
+            raise errors[0]  # 接收失败由发送线程的异常引起时报告原始原因
+        raise
+    finally:
+        fills.put(None)  # 结束发送线程的补发循环
+        window.release()  # 发送线程可能正阻塞在在途名额上
+
+    sender.join()
+    if errors:
+        raise errors[0]
+    if dedup is not None:
+        with STATS_LOCK:# 多条连接并行时共用同一个统计字典
+            dedup['hits'] += hits
+            dedup['misses'] += misses
+            dedup['saved_bytes'] += saved
+
+def transfer_part(server_ip, server_port, input_file, plan, part, depth, batch_size, on_answer, verbose=True,
+                  dedup=None, compress=0, compression=None):
+    # 用一条独立的 TCP 连接（独立的 INIT/AGREE 会话）发送分块方案中的一段
+    # 参数：
+    # - plan: (文件大小, Lmin, Lmax)
+    # - part: split_plan 返回的一段
+    # - depth, batch_size, on_answer, dedup: 同 transfer_pipelined
+    # - verbose: 是否打印连接信息
+    # - compress: 请求压缩的能力位（见 compress_caps），0 为不压缩
+    # - compression: 不为 None 时把本连接的压缩统计（FrameCodec.stats 中的字节数）累加到该字典
+    # 返回：(块数, 字节数, 用时秒数)
+    file_size, Lmin, Lmax = plan
+    first, count, start, stop, state = part
+    begin = time.perf_counter()
+    # 建立 TCP 连接并握手，需要批量时协商 CAP_BATCH，需要去重时协商 CAP_DEDUP，需要压缩时协商 CAP_COMPRESS
+    try:
+        sock, reader, caps = open_session(server_ip, server_port, count,
+                                          (CAP_BATCH if batch_size > 1 else 0) | (CAP_DEDUP if dedup is not None else 0)
+                                          | compress)
+    except ConnectionError:
+        raise
+    except socket.error as e:
+        raise ConnectionError(e)
+    try:
+        if not caps & CAP_BATCH:
+            batch_size = 1# 服务器不支持批量报文时逐块发送
+        if dedup is not None and not caps & CAP_DEDUP:
+            dedup = None# 服务器不支持去重时直接发送数据
+            if verbose:
+                print("服务器不支持去重，直接发送数据")
+        codec = FrameCodec(caps) if caps & CAP_COMPRESS else None
+        if compress and codec is None and verbose:
+            print("服务器不支持压缩，发送原始数据")
+        if verbose:
+            print(f"已与服务器建立通信，共有 {count} 块（第 {first+1}-{first+count} 块）")
+
+        rng = random.Random()
+        rng.setstate(state)
         with open(input_file, 'rb') as f:
-            content = f.read()
-            for b in content:
-                if b < 32 or b > 126:
-                    if b not in (10, 13):   # 允许换行符（\n）和回车符（\r）
-                        raise ValueError(f"文件包含非 ASCII 可打印字符 (字节值: {b})")
-
-        # 按 Lmin 和 Lmax 分块
-        chunks = []
-        index = 0
-        while index < len(content):
-            remaining = len(content) - index # 剩余字节数
-            max_size = min(Lmax, remaining)  # 最大块大小
-            min_size = min(Lmin, remaining) # 最小块大小
-            if min_size > max_size:
-                min_size = max_size
-            # 随机选择块大小
-            length = random.randint(min_size, max_size) if min_size < max_size else min_size
-            chunk = content[index:index + length]# 提取块
-            chunks.append(chunk)
-            index += length
-
-        total_chunks = len(chunks)# 总块数
-        print(f"分块完成，共 {total_chunks} 块，块大小: {[len(c) for c in chunks]}")
-        for i, chunk in enumerate(chunks):
-            print(f"块 {i+1}: {chunk.decode('ascii', errors='replace')}")# 打印每块内容
-
-        # 建立 TCP 连接
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            f.seek(start)
+            frames = iter_frames(f, chunk_sizes(file_size, Lmin, Lmax, rng, start, stop), batch_size)
+            transfer_pipelined(sock, reader, frames, count, depth, on_answer, first, start, dedup=dedup, codec=codec)
+    finally:
+        sock.close()# 关闭套接字
+    if codec is not None and compression is not None:
+        with STATS_LOCK:
+            for key in ('sent_logical', 'sent_wire', 'received_logical', 'received_wire'):
+                compression[key] += getattr(codec, key)
+    return count, stop - start, time.perf_counter() - begin
+
+def transfer_parallel(server_ip, server_port, input_file, plan, parts, depth, batch_size, on_answer, verbose=True,
+                      dedup=None, compress=0, compression=None):
+    # 每段各用一条连接并行发送；结果按偏移写入，无需额外排序
+    # 返回：各连接的 (块数, 字节数, 用时秒数) 列表，顺序与 parts 相同
+    if len(parts) == 1:
+        return [transfer_part(server_ip, server_port, input_file, plan, parts[0], depth, batch_size, on_answer, verbose,
+                              dedup, compress, compression)]
+
+    results = [None] * len(parts)
+    errors = []
+
+    def worker(k):
         try:
-            sock.connect((server_ip, server_port))# 连接服务器
-        except socket.error as e:
-            print(f"连接服务器失败: {e}")
-            return
-
-        # 发送初始化报文（1 字节类型 + 4 字节总块数）
-        init_packet = struct.pack('!BI', TYPE_INIT, total_chunks)
-        sock.sendall(init_packet)
-
-        # 接收服务器的 AGREE 报文
-        resp_type = recv_all(sock, 1)
-        if resp_type[0] != TYPE_AGREE:
-            print("未收到 AGREE 报文")
-            sock.close()
-            return
-
-        print(f"已与服务器建立通信，共有 {total_chunks} 块")
-
-        # 逐块发送请求并接收反转响应
-        for i, chunk in enumerate(chunks):
-            # 发送 ReverseRequest 报文（1 字节类型 + 4 字节长度 + 数据）
-            packet = struct.pack('!BI', TYPE_REQ, len(chunk)) + chunk
-            sock.sendall(packet)
-
-            # 接收 ReverseAnswer 报文
-            resp_type = recv_all(sock, 1)
-            if resp_type[0] != TYPE_RESP:
-                print(f"块 {i+1} 未收到正确的 ReverseAnswer 报文")
-                break
-            length = struct.unpack('!I', recv_all(sock, 4))[0] # 接收数据长度
-            reversed_data = recv_all(sock, length)# 接收反转数据
-            print(f"{i+1}: {reversed_data.decode('ascii', errors='replace')}")# 打印反转结果
-
-        # 生成反转文件（整体反转，保持行结构）
-        with open(input_file, 'r', encoding='ascii') as f:
-            lines = f.readlines()
-        # 反转整个文件内容（按字符反转）
-        reversed_content = ''.join(lines)[::-1]
-        reversed_lines = reversed_content.splitlines()# 按行分割反转内容
-        # 写入反转文件，确保每行之间只有一个换行符
-        with open("reversed.txt", "w", encoding='ascii', newline='\n') as f:
-            for i, line in enumerate(reversed_lines):
-                f.write(line.rstrip())# 去除行尾空白
-                if i < len(reversed_lines) - 1:  # 避免最后多余换行
-                    f.write('\n')
-
-        print("客户端结束，反转结果保存在 reversed.txt")
+            results[k] = transfer_part(server_ip, server_port, input_file, plan, parts[k], depth, batch_size, on_answer,
+                                       verbose, dedup, compress, compression)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(len(parts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def print_throughput(stats, elapsed):
+    # 打印每条连接和总体的吞吐量
+    for k, (count, nbytes, seconds) in enumerate(stats):
+        print(f"连接 {k+1}: {count} 块，{nbytes} 字节，用时 {seconds:.3f} s，"
+              f"吞吐量 {nbytes / max(seconds, 1e-9) / 1e6:.2f} MB/s")
+    total_bytes = sum(s[1] for s in stats)
+    print(f"总计: {len(stats)} 条连接，{total_bytes} 字节，用时 {elapsed:.3f} s，"
+          f"总吞吐量 {total_bytes / max(elapsed, 1e-9) / 1e6:.2f} MB/s")
+
+def reverse_file(server_ip, server_port, input_file, output_file="reversed.txt", Lmin=5, Lmax=10, depth=1,
+                 batch_size=1, seed=None, connections=1, verbose=None, dedup=False, compress=0, compress_stream=False):
+    # 把文件按随机长度分块发送给服务器，反转结果边收边写入 output_file，可在其他程序中直接调用
+    # 参数：
+    # - Lmin, Lmax: 每块的最小、最大长度
+    # - depth: 流水线深度（最大在途块数），1 为逐块停等
+    # - batch_size: 每帧批量块数
+    # - seed: 分块随机种子，None 时自动生成
+    # - connections: 并行连接数
+    # - verbose: 是否逐块打印内容，None 时块数不超过 PRINT_LIMIT 才打印，False 时不打印任何信息
+    # - dedup: 是否请求去重：不短于 DEDUP_MIN_CHUNK 的单块帧先发送摘要，服务器已缓存时不上传数据
+    # - compress: 请求的 zlib 压缩级别（1-9），0 为不压缩；报文体短于 COMPRESS_MIN 的帧不压缩，
+    #   逐块发送时块通常很短，与批量发送或流模式配合才有效果
+    # - compress_stream: 是否请求流模式：整条连接共用一个 deflate 流，短帧之间的重复内容也能压缩
+    # 返回：结果字典（总块数、字节数、用时、吞吐量、随机种子、各连接的统计；去重、压缩时还有相应统计）
+    # 参数不合法时抛出 ValueError，连接失败时抛出 ConnectionError
+    if not os.path.exists(input_file):
+        raise ValueError(f"文件 {input_file} 不存在")
+    if Lmin <= 0 or Lmax < Lmin:
+        raise ValueError("Lmin 必须大于 0 且不大于 Lmax")
+    if server_port < 1024 or server_port > 65535:
+        raise ValueError("端口号必须在 1024-65535 之间")
+    if depth <= 0:
+        raise ValueError("流水线深度必须大于 0")
+    if batch_size <= 0 or batch_size > 1000:
+        raise ValueError("批量块数必须在 1-1000 之间")
+    if batch_size * (Lmax + UINT.size) + UINT.size > MAX_FRAME:
+        raise ValueError(f"单帧报文可能超过 {MAX_FRAME} 字节，请减小 Lmax 或批量块数")# 服务器会断开超长报文的连接
+    if connections <= 0:
+        raise ValueError("并行连接数必须大于 0")
+    if not 0 <= compress <= COMPRESS_LEVEL_MAX:
+        raise ValueError("压缩级别必须在 0-9 之间")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    # 流式验证文件只含 ASCII 可打印字符
+    file_size = validate_ascii_file(input_file)
+
+    # 按 Lmin 和 Lmax 生成分块方案：只生成块长度，不读取内容，
+    # 统计总块数并按连接数分段，发送时各连接从记录的随机数状态重新生成
+    total_chunks, parts = split_plan(file_size, Lmin, Lmax, seed, connections)
+    quiet = verbose is False
+    if not quiet:
+        print(f"分块完成，共 {total_chunks} 块，随机种子: {seed}，分为 {len(parts)} 段")
+    if verbose is None:
+        verbose = total_chunks <= PRINT_LIMIT
+    if verbose:
+        sizes = list(chunk_sizes(file_size, Lmin, Lmax, random.Random(seed)))
+        print(f"块大小: {sizes}")
+        with open(input_file, 'rb') as f:
+            for i, chunk in enumerate(read_group(f, sizes)):
+                print(f"块 {i+1}: {str(chunk, 'ascii', errors='replace')}")# 打印每块内容
+
+    # 反转结果边收边写入输出文件
+    writer = ReversedFileWriter(output_file, file_size)
+
+    def on_answer(index, offset, reversed_data):
+        if verbose:
+            print(f"{index+1}: {str(reversed_data, 'ascii', errors='replace')}")# 打印反转结果
+        writer.write(offset, reversed_data)
+
+    # 发送请求并接收反转响应（depth 为 1 时逐帧停等，大于 1 时流水线发送）
+    dedup_stats = {'hits': 0, 'misses': 0, 'saved_bytes': 0} if dedup else None
+    compression = dict.fromkeys(('sent_logical', 'sent_wire', 'received_logical', 'received_wire'), 0)
+    begin = time.perf_counter()
+    try:
+        stats = transfer_parallel(server_ip, server_port, input_file, (file_size, Lmin, Lmax),
+                                  parts, depth, batch_size, on_answer, not quiet, dedup_stats,
+                                  compress_caps(compress, compress_stream), compression)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - begin
+    result = {
+        'chunks': total_chunks,
+        'bytes': file_size,
+        'elapsed_s': elapsed,
+        'mb_per_s': file_size / max(elapsed, 1e-9) / 1e6,
+        'seed': seed,
+        'connections': stats,
+    }
+    if dedup_stats is not None:
+        result['dedup'] = dedup_stats
+    if compress:
+        result['compression'] = dict(compression, level=compress, stream=compress_stream)
+    return result
+
+def parse_args(argv):
+    # 解析命令行参数；--config 指定的 JSON 文件提供默认值（键为选项名），命令行参数优先
+    parser = argparse.ArgumentParser(description="反转协议 TCP 客户端（不带参数运行时交互式输入配置）")
+    parser.add_argument('--config', help="JSON 配置文件，例如 {\"input\": \"test.txt\", \"lmin\": 5}")
+    parser.add_argument('--host', default='127.0.0.1', help="服务器地址")
+    parser.add_argument('--port', type=int, default=12345, help="服务器端口")
+    parser.add_argument('--input', default='test.txt', help="要发送的 ASCII 文本文件")
+    parser.add_argument('--output', default='reversed.txt', help="保存反转结果的文件")
+    parser.add_argument('--lmin', type=int, default=5, help="每块最小长度 Lmin")
+    parser.add_argument('--lmax', type=int, default=10, help="每块最大长度 Lmax")
+    parser.add_argument('--depth', type=int, default=1, help="流水线深度，即最大在途块数")
+    parser.add_argument('--batch', type=int, default=1, help="每帧批量块数")
+    parser.add_argument('--seed', type=int, help="分块随机种子，不指定则自动生成")
+    parser.add_argument('--connections', type=int, default=1, help="并行连接数")
+    parser.add_argument('--dedup', action='store_true', help="请求去重：大块先发送摘要，服务器已缓存时不上传数据")
+    parser.add_argument('--compress', type=int, default=0, metavar='LEVEL', help="请求 zlib 压缩，级别 1-9，0 为不压缩")
+    parser.add_argument('--compress-stream', action='store_true', help="压缩使用流模式：整条连接共用一个 deflate 流")
+    parser.add_argument('--quiet', action='store_true', help="不逐块打印内容")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            parser.set_defaults(**{k.replace('-', '_'): v for k, v in json.load(f).items()})
+        args = parser.parse_args(argv)
+    return args
+
+def prompt_args():
+    # 交互式输入配置，返回与 parse_args 相同的参数对象
+    server_ip = input("请输入服务器IP地址（如127.0.0.1）：").strip()
+    server_port = int(input("请输入服务器端口号（如12345）：").strip())
+    input_file = input("请输入要发送的ASCII文本文件名（如test.txt）：").strip()
+    Lmin = int(input("请输入每块最小长度Lmin（如5）：").strip())
+    Lmax = int(input("请输入每块最大长度Lmax（如10）：").strip())
+    depth_text = input("请输入流水线深度，即最大在途块数（直接回车为1，逐块停等）：").strip()
+    depth = int(depth_text) if depth_text else 1
+    batch_text = input("请输入每帧批量块数（直接回车为1，不批量）：").strip()
+    batch_size = int(batch_text) if batch_text else 1
+    seed_text = input("请输入分块随机种子（直接回车自动生成）：").strip()
+    seed = int(seed_text) if seed_text else None
+    conn_text = input("请输入并行连接数（直接回车为1）：").strip()
+    connections = int(conn_text) if conn_text else 1
+    dedup = input(f"是否请求去重（不短于{DEDUP_MIN_CHUNK}字节的块先发送摘要）？(y/N)：").strip().lower() == 'y'
+    compress_text = input("请输入 zlib 压缩级别 1-9（直接回车为0，不压缩）：").strip()
+    compress = int(compress_text) if compress_text else 0
+    stream = bool(compress) and input("是否使用流模式压缩（整条连接共用一个 deflate 流）？(y/N)：").strip().lower() == 'y'
+    return argparse.Namespace(host=server_ip, port=server_port, input=input_file, output="reversed.txt",
+                              lmin=Lmin, lmax=Lmax, depth=depth, batch=batch_size, seed=seed,
+                              connections=connections, dedup=dedup, compress=compress, compress_stream=stream,
+                              quiet=False, json=False)
+
+def main(argv=None):
+    # 带命令行参数时按参数（和配置文件）运行，否则交互式输入配置
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        args = parse_args(argv) if argv else prompt_args()
+        result = reverse_file(args.host, args.port, args.input, args.output, args.lmin, args.lmax, args.depth,
+                              args.batch, args.seed, args.connections, verbose=False if args.quiet else None,
+                              dedup=args.dedup, compress=args.compress, compress_stream=args.compress_stream)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print_throughput(result['connections'], result['elapsed_s'])
+            if 'dedup' in result:
+                d = result['dedup']
+                lookups = d['hits'] + d['misses']
+                print(f"去重: 摘要请求 {lookups} 次，命中 {d['hits']} 次"
+                      f"（命中率 {d['hits'] / lookups * 100 if lookups else 0:.1f}%），节省上传 {d['saved_bytes']} 字节")
+            if 'compression' in result:
+                c = result['compression']
+                print(f"压缩: 发送 {c['sent_logical']} -> {c['sent_wire']} 字节，"
+                      f"接收 {c['received_wire']} -> {c['received_logical']} 字节，"
+                      f"压缩比 {(c['sent_logical'] + c['received_logical']) / max(c['sent_wire'] + c['received_wire'], 1):.2f}")
+            print(f"客户端结束，反转结果保存在 {args.output}")
 
     except ValueError as e:
         print(f"输入错误: {e}")
+    except ConnectionError as e:
+        print(f"连接服务器失败: {e}")
     except IOError as e:
         print(f"文件错误: {e}")
     except Exception as e:
         print(f"运行错误: {e}")
-    finally:
-        sock.close()# 关闭套接字
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,85 +1,736 @@
+import argparse
+import json
+import sys
 import socket
 import struct
 import threading
+import asyncio
+import os
+import signal
+import time
+import multiprocessing
+import logging
+from collections import OrderedDict
 
-# 报文类型
-TYPE_INIT = 1# 初始化报文，客户端发送总块数
-TYPE_AGREE = 2 # 同意报文，服务器确认初始化
-TYPE_REQ = 3  # 请求报文，客户端发送数据块
-TYPE_RESP = 4# 响应报文，服务器返回反转后的数据块
+from framing import (FrameReader, HEADER, UINT, TYPE_INIT, TYPE_AGREE, TYPE_REQ, TYPE_RESP,
+                     TYPE_INIT_EXT, TYPE_AGREE_EXT, TYPE_BREQ, TYPE_BRESP, TYPE_DREQ, TYPE_DMISS, TYPE_DFILL,
+                     CAP_BATCH, CAP_DEDUP, CAP_COMPRESS, CAP_COMPRESS_STREAM, COMPRESS_LEVEL_MASK, DIGEST_SIZE,
+                     COMPRESS_LEVEL_SHIFT, COMPRESS_LEVEL_MAX, MAX_FRAME, FrameCodec, send_buffers, unpack_batch,
+                     chunk_digest)
+from metrics import Histogram, Registry, MetricsServer, setup_logging
 
+SERVER_CAPS = CAP_BATCH | CAP_DEDUP | CAP_COMPRESS | CAP_COMPRESS_STREAM  # 本服务器支持的能力位（没有去重缓存时不接受 CAP_DEDUP）
+STOP_GRACE = 5.0  # 停止时等待已有连接处理完毕的最长时间（秒）
+DEDUP_CACHE_BYTES = 64 << 20  # 去重缓存默认大小（字节）
+DEDUP_ENTRY_OVERHEAD = 160  # 每个缓存条目除数据外的内存（摘要对象、字典项、链表节点）估计值
 
-def recv_all(sock, length):
-    # 接收指定长度的数据，确保完整接收
+# 日志：连接事件为 INFO，逐帧处理为 DEBUG；未调用 setup_logging 时（作为模块导入）只输出警告和错误
+log = logging.getLogger('reversetcpserver')
+
+# 导出的计数指标：(ServerStats 字段, 指标名, 类型, 说明)
+METRIC_FIELDS = (
+    ('connections', 'connections_total', 'counter', "累计接受的连接数"),
+    ('active', 'active_connections', 'gauge', "当前活动连接数"),
+    ('chunks', 'chunks_total', 'counter', "累计处理的数据块数"),
+    ('bytes', 'bytes_total', 'counter', "累计反转的数据字节数（请求与响应相同）"),
+    ('frames', 'frames_total', 'counter', "累计处理的请求帧数（批量帧含多个数据块）"),
+    ('rejected', 'rejected_total', 'counter', "因并发连接数达到上限被拒绝的连接数"),
+    ('errors', 'errors_total', 'counter', "因协议错误或连接异常结束的连接数"),
+    ('rx_logical', 'compressed_rx_logical_bytes_total', 'counter', "压缩连接上收到的报文体解压后的字节数"),
+    ('rx_wire', 'compressed_rx_wire_bytes_total', 'counter', "压缩连接上收到的报文体线上字节数"),
+    ('tx_logical', 'compressed_tx_logical_bytes_total', 'counter', "压缩连接上发送的报文体压缩前的字节数"),
+    ('tx_wire', 'compressed_tx_wire_bytes_total', 'counter', "压缩连接上发送的报文体线上字节数"),
+)
+
+
+class ServerStats:
+    # 服务器计数器：累计连接数、活动连接数、处理块数、请求字节数、请求帧数、拒绝数、错误数，
+    # 以及协商了压缩的连接上两个方向报文体的逻辑字节数和线上字节数（连接结束时累加）
+    # values 可以是普通列表，也可以是多进程共享的 RawArray，
+    # 预分叉模式下主进程直接读取各工作进程的计数并汇总
+    # 时延直方图只在本进程内统计
+    FIELDS = ('connections', 'active', 'chunks', 'bytes', 'frames', 'rejected', 'errors',
+              'rx_logical', 'rx_wire', 'tx_logical', 'tx_wire')
+
+    def __init__(self, values=None):
+        self.values = values if values is not None else [0] * len(self.FIELDS)
+        self.lock = threading.Lock()
+        self.request_seconds = Histogram('tcp_request_seconds', "从收到完整请求帧到响应发出的时间（秒）")
+        self.connection_seconds = Histogram('tcp_connection_seconds', "连接持续时间（秒）")
+
+    def connection_opened(self):
+        with self.lock:
+            self.values[0] += 1
+            self.values[1] += 1
+
+    def connection_closed(self):
+        with self.lock:
+            self.values[1] -= 1
+
+    def add_chunks(self, count, nbytes):
+        with self.lock:
+            self.values[2] += count
+            self.values[3] += nbytes
+            self.values[4] += 1
+
+    def rejected(self):
+        with self.lock:
+            self.values[5] += 1
+
+    def error(self):
+        with self.lock:
+            self.values[6] += 1
+
+    def add_compression(self, codec):
+        # 累加一个压缩连接的 FrameCodec 统计
+        with self.lock:
+            self.values[7] += codec.received_logical
+            self.values[8] += codec.received_wire
+            self.values[9] += codec.sent_logical
+            self.values[10] += codec.sent_wire
+
+    def active(self):
+        return self.values[1]
+
+    def snapshot(self):
+        return dict(zip(self.FIELDS, self.values[:]))
+
+    def registry(self):
+        # 导出本进程计数和时延直方图的 Registry
+        registry = build_registry(self.snapshot)
+        registry.add(self.request_seconds)
+        registry.add(self.connection_seconds)
+        return registry
+
+
+class DedupCache:
+    # 去重缓存：数据块摘要 -> 反转后的数据，按占用内存限制大小的 LRU，所有连接和线程共享
+    # 协商了 CAP_DEDUP 的客户端先发送摘要（DREQ），命中时直接返回缓存的反转结果，
+    # 未命中时回复 DMISS，客户端再发送摘要和数据（DFILL），服务器校验摘要后反转并写入缓存
+    # 预分叉模式下每个工作进程各有一个缓存
+    def __init__(self, max_bytes=DEDUP_CACHE_BYTES):
+        # 参数：
+        # - max_bytes: 缓存占用内存的上限（字节），超过时淘汰最久未使用的条目
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0  # 写入缓存的条目数
+        self.evictions = 0
+        self.mismatches = 0  # 摘要与数据不符、没有写入缓存的补发数
+        self.saved_bytes = 0  # 命中而不必上传的数据字节数
+
+    def get(self, digest):
+        # 查找摘要，命中时返回反转后的数据（bytes），否则返回 None
+        with self.lock:
+            value = self.entries.get(digest)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            self.saved_bytes += len(value)
+            return value
+
+    def put(self, digest, data, reversed_data):
+        # 校验摘要后写入缓存；缓存由所有客户端共享，摘要与数据不符时不写入，
+        # 以免一个客户端的错误数据被返回给其他客户端
+        # 返回：是否写入
+        if chunk_digest(data) != digest:
+            with self.lock:
+                self.mismatches += 1
+            return False
+        cost = len(reversed_data) + DEDUP_ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return False
+        with self.lock:
+            if digest in self.entries:
+                return False
+            self.entries[digest] = reversed_data
+            self.size += cost
+            self.fills += 1
+            while self.size > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old) + DEDUP_ENTRY_OVERHEAD
+                self.evictions += 1
+        return True
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def register(self, registry):
+        # 把缓存统计加入 Registry
+        registry.counter('dedup_hits_total', "去重缓存命中次数", fn=lambda: self.hits)
+        registry.counter('dedup_misses_total', "去重缓存未命中次数", fn=lambda: self.misses)
+        registry.counter('dedup_fills_total', "写入去重缓存的条目数", fn=lambda: self.fills)
+        registry.counter('dedup_evictions_total', "去重缓存淘汰的条目数", fn=lambda: self.evictions)
+        registry.counter('dedup_mismatches_total', "摘要与数据不符的补发数", fn=lambda: self.mismatches)
+        registry.counter('dedup_saved_bytes_total', "缓存命中而不必上传的数据字节数", fn=lambda: self.saved_bytes)
+        registry.gauge('dedup_entries', "去重缓存条目数", fn=lambda: len(self.entries))
+        registry.gauge('dedup_bytes', "去重缓存占用内存估计（字节）", fn=lambda: self.size)
+        registry.gauge('dedup_hit_ratio', "去重缓存命中率", fn=self.hit_rate)
+
+    def summary(self):
+        return (f"[去重] 命中 {self.hits} 次，未命中 {self.misses} 次，命中率 {self.hit_rate() * 100:.1f}%，"
+                f"节省上传 {self.saved_bytes} 字节，缓存 {len(self.entries)} 条（约 {self.size} 字节），"
+                f"淘汰 {self.evictions} 条")
+
+
+def negotiate_caps(requested, cache):
+    # 扩展握手中服务器接受的能力位：双方都支持的部分，没有去重缓存时不接受 CAP_DEDUP；
+    # 接受压缩时回送客户端选择的压缩级别，超过 COMPRESS_LEVEL_MAX 的按最高级别回送，
+    # 双方都按回送的级别建立 FrameCodec，不会在会话中途因级别无效而出错
+    caps = requested & SERVER_CAPS
+    if caps & CAP_COMPRESS:
+        level = min((requested & COMPRESS_LEVEL_MASK) >> COMPRESS_LEVEL_SHIFT, COMPRESS_LEVEL_MAX)
+        caps |= level << COMPRESS_LEVEL_SHIFT
+    return caps if cache is not None else caps & ~CAP_DEDUP
+
+
+def build_registry(snapshot):
+    # 按 METRIC_FIELDS 创建 Registry，导出时调用 snapshot() 读取当前计数
+    registry = Registry('tcp_')
+    for field, name, kind, help_text in METRIC_FIELDS:
+        make = registry.counter if kind == 'counter' else registry.gauge
+        make(name, help_text, fn=lambda field=field: snapshot()[field])
+    return registry
+
+
+def start_metrics_server(registry, port):
+    # 在本机启动指标 HTTP 接口，port 为 0 时由系统分配
+    server = MetricsServer(registry, '127.0.0.1', port)
+    host, port = server.start()
+    log.info(f"[监控] 指标接口: http://{host}:{port}/metrics（JSON: /metrics.json）")
+    return server
+
+
+def reverse_batch(body):
+    # 处理批量请求报文体，返回 BRESP 的缓冲区列表
+    # 整个数据区只反转一次：反转后第 i 块的结果恰好位于末尾倒数第 i 段，
+    # 按请求顺序取出这些切片即可，不再逐块复制
+    lengths, data = unpack_batch(body)
+    reversed_all = memoryview(bytes(data[::-1]))
+    table_size = len(body) - len(data)
+    buffers = [HEADER.pack(TYPE_BRESP, len(body)), body[:table_size]]# 长度表与请求相同，直接复用
+    end = len(reversed_all)
+    for length in lengths:
+        buffers.append(reversed_all[end - length:end])
+        end -= length
+    return buffers, len(lengths)
+
+def build_response(packet_type, body, caps, cache=None):
+    # 处理一个请求报文，线程模式和协程模式共用
     # 参数：
-    # - sock: TCP 套接字
-    # - length: 期望接收的字节数
-    # 返回：接收到的字节数据
-    data = b''
-    while len(data) < length:
-        more = sock.recv(length - len(data)) # 接收剩余字节
-        if not more:
-            raise EOFError('Socket closed unexpectedly') # 连接意外关闭
-        data += more
-    return data
-
-
-def handle_client(conn, addr):
+    # - packet_type, body: 请求报文类型和数据
+    # - caps: 本连接协商后的能力位
+    # - cache: 去重缓存，协商了 CAP_DEDUP 时不为 None
+    # 返回：(响应缓冲区列表, 完成的块数, 反转的字节数)，报文类型错误时返回 (None, 0, 0)
+    # 去重请求未命中时完成的块数为 0：该块在客户端补发数据后才完成
+    if packet_type == TYPE_REQ:
+        reversed_data = bytes(body[::-1])# 反转数据块内容（唯一一次复制）
+        # 响应报文（1 字节类型 + 4 字节长度 + 反转数据），首部和数据分开发送
+        return [HEADER.pack(TYPE_RESP, len(reversed_data)), reversed_data], 1, len(body)
+    if packet_type == TYPE_BREQ and caps & CAP_BATCH:
+        buffers, count = reverse_batch(body)
+        return buffers, count, len(body)
+    if packet_type == TYPE_DREQ and caps & CAP_DEDUP and len(body) == DIGEST_SIZE:
+        reversed_data = cache.get(bytes(body))
+        if reversed_data is None:
+            return [HEADER.pack(TYPE_DMISS, 0)], 0, 0
+        return [HEADER.pack(TYPE_RESP, len(reversed_data)), reversed_data], 1, len(reversed_data)
+    if packet_type == TYPE_DFILL and caps & CAP_DEDUP and len(body) >= DIGEST_SIZE:
+        data = body[DIGEST_SIZE:]
+        reversed_data = bytes(data[::-1])
+        cache.put(bytes(body[:DIGEST_SIZE]), data, reversed_data)
+        return [HEADER.pack(TYPE_RESP, len(reversed_data)), reversed_data], 1, len(data)
+    return None, 0, 0
+
+def handle_client(conn, addr, stats, cache=None):
     # 处理单个客户端连接，运行在独立线程中
     # 参数：
     # - conn: 客户端的 TCP 套接字
     # - addr: 客户端地址（IP 和端口）
+    # - stats: ServerStats 计数器
+    # - cache: 共享的 DedupCache，为 None 时不支持去重
+    stats.connection_opened()
+    opened = time.perf_counter()
+    codec = None
     try:
-        print(f"[连接] 来自 {addr}")
+        log.info(f"[连接] 来自 {addr}")
+        # 关闭 Nagle 算法：流水线模式下客户端连续发送请求，响应需要立即发出
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
         # 接收初始化报文（5 字节：1 字节类型 + 4 字节总块数）
-        header = recv_all(conn, 5)
-        packet_type, total_chunks = struct.unpack('!BI', header) # 大端序解包
-        if packet_type != TYPE_INIT:
-            print("收到错误类型的初始化报文")
+        reader = FrameReader(conn)
+        packet_type, total_chunks = reader.read_header() # 大端序解包
+        if packet_type == TYPE_INIT:
+            # 基本握手：发送 AGREE 报文（1 字节类型）
+            caps = 0
+            conn.sendall(struct.pack('!B', TYPE_AGREE))
+        elif packet_type == TYPE_INIT_EXT:
+            # 扩展握手：读取客户端请求的能力位，回复双方都支持的部分
+            caps = negotiate_caps(UINT.unpack(reader.read_exact(UINT.size))[0], cache)
+            conn.sendall(HEADER.pack(TYPE_AGREE_EXT, caps))
+        else:
+            log.warning("收到错误类型的初始化报文")
+            stats.error()
             return
 
-        print(f"[{addr}] 任务总块数: {total_chunks}")
-        # 发送 AGREE 报文（1 字节类型）
-        conn.sendall(struct.pack('!B', TYPE_AGREE))
-
-        # 发送 AGREE 报文（1 字节类型）
-        for i in range(total_chunks):
-            # 接收请求报文头部（5 字节：1 字节类型 + 4 字节数据长度）
-            head = recv_all(conn, 5)
-            packet_type, length = struct.unpack('!BI', head)
-            if packet_type != TYPE_REQ:
-                print("收到错误类型的数据请求")
-                return
+        log.info(f"[{addr}] 任务总块数: {total_chunks}，能力位: {caps:#x}")
+        codec = FrameCodec(caps) if caps & CAP_COMPRESS else None# 协商了压缩时解压请求、压缩响应
 
-            # 接收数据块
-            data = recv_all(conn, length)
-            reversed_data = data[::-1]# 反转数据块内容
-            # 构造响应报文（1 字节类型 + 4 字节长度 + 反转数据）
-            response = struct.pack('!BI', TYPE_RESP, len(reversed_data)) + reversed_data
-            conn.sendall(response)# 发送响应
+        # 逐帧处理请求：严格按接收顺序处理并响应，
+        # 流水线模式下客户端依赖这一顺序把响应与请求对应起来
+        done = 0
+        while done < total_chunks:
+            # 接收请求报文（5 字节首部 + 数据），数据为缓冲区上的切片
+            packet_type, body = reader.read_frame()
+            started = time.perf_counter()
+            if codec is not None:
+                packet_type, body = codec.decode(packet_type, body)
+            buffers, count, nbytes = build_response(packet_type, body, caps, cache)
+            if buffers is None:
+                log.warning("收到错误类型的数据请求")
+                stats.error()
+                return
+            if codec is not None:
+                buffers = codec.encode(buffers)
+            send_buffers(conn, buffers)# 发送响应（在下一次读取前完成，切片仍然有效）
+            stats.request_seconds.observe(time.perf_counter() - started)
+            done += count
+            stats.add_chunks(count, nbytes)
+            log.debug("[%s] 已处理 %d 个数据块（%d 字节），进度 %d/%d", addr, count, nbytes, done, total_chunks)
 
     except Exception as e:
-        print(f"[错误] {e}")
+        log.warning(f"[错误] {e}")
+        stats.error()
     finally:
         conn.close()# 关闭客户端连接
-        print(f"[断开] {addr}")
+        stats.connection_closed()
+        if codec is not None:
+            stats.add_compression(codec)
+        stats.connection_seconds.observe(time.perf_counter() - opened)
+        log.info(f"[断开] {addr}")
 
-def main():
-    # 主函数，启动 TCP 服务器
-    # 获取用户输入的监听端口
-    port = int(input("请输入服务端监听端口号（如12345）：").strip())
-    host = '0.0.0.0' # 监听所有 IP 地址
+def run_client_thread(conn, addr, slots, stats, cache=None):
+    # 线程入口：处理完客户端后归还连接名额
+    # 参数：
+    # - conn, addr, stats, cache: 同 handle_client
+    # - slots: 连接名额信号量，不限制连接数时为 None
+    try:
+        handle_client(conn, addr, stats, cache)
+    finally:
+        if slots is not None:
+            slots.release()
 
+def create_listener(host, port, backlog, reuse_port=False):
+    # 创建监听套接字
+    # - reuse_port: 设置 SO_REUSEPORT，允许多个进程绑定同一端口，由内核分配连接
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     server_socket.bind((host, port))# 绑定地址和端口
-    server_socket.listen(5)# 监听队列大小为 5
-    print(f"[启动] TCP服务端监听端口 {port}，等待客户端连接...")
+    server_socket.listen(backlog)# 设置监听队列大小
+    return server_socket
+
+def wait_for_idle(stats, timeout):
+    # 停止接受新连接后，等待活动连接处理完毕，最多等待 timeout 秒
+    deadline = time.monotonic() + timeout
+    while stats.active() > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+def serve_threaded(host, port, backlog, max_connections, stats=None, stop=None, reuse_port=False, listener=None,
+                   cache=None):
+    # 线程模式：每个客户端连接由一个独立线程处理
+    # 参数：
+    # - host, port: 监听地址和端口
+    # - backlog: 监听队列大小
+    # - max_connections: 最大并发连接数，0 表示不限制
+    # - stats: ServerStats 计数器，为 None 时新建
+    # - stop: threading.Event，置位后停止接受连接并等待已有连接结束，为 None 时一直运行
+    # - reuse_port: 是否设置 SO_REUSEPORT（预分叉模式）
+    # - listener: 已创建的监听套接字（例如绑定到临时端口），为 None 时按 host/port 创建
+    # - cache: 所有连接共享的 DedupCache，为 None 时不支持去重
+    stats = stats if stats is not None else ServerStats()
+    server_socket = listener if listener is not None else create_listener(host, port, backlog, reuse_port)
+    port = server_socket.getsockname()[1]
+    server_socket.settimeout(0.5)# 定期醒来检查 stop
+    slots = threading.BoundedSemaphore(max_connections) if max_connections else None
+    log.info(f"[启动] TCP服务端（线程模式）监听端口 {port}，等待客户端连接...")
 
     # 主循环，接受客户端连接
-    while True:
-        client_socket, addr = server_socket.accept() # 阻塞等待新连接
-        threading.Thread(target=handle_client, args=(client_socket, addr)).start()# 为每个客户端创建新线程处理
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                client_socket, addr = server_socket.accept() # 等待新连接
+            except socket.timeout:
+                continue
+            client_socket.settimeout(None)
+            if slots is not None and not slots.acquire(blocking=False):
+                log.warning(f"[拒绝] {addr}：并发连接数已达上限 {max_connections}")
+                stats.rejected()
+                client_socket.close()
+                continue
+            threading.Thread(target=run_client_thread, args=(client_socket, addr, slots, stats, cache),
+                             daemon=True).start()# 为每个客户端创建新线程处理
+    finally:
+        server_socket.close()
+    wait_for_idle(stats, STOP_GRACE)
+
+
+async def handle_client_async(reader, writer, stats, cache=None):
+    # 协程版本的 handle_client，协议与线程模式完全相同
+    # 参数：
+    # - reader: asyncio.StreamReader，用 readexactly 按长度接收报文
+    # - writer: asyncio.StreamWriter
+    # - stats: ServerStats 计数器
+    # - cache: 共享的 DedupCache，为 None 时不支持去重
+    addr = writer.get_extra_info('peername')
+    stats.connection_opened()
+    opened = time.perf_counter()
+    codec = None
+    try:
+        log.info(f"[连接] 来自 {addr}")
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # 接收初始化报文（5 字节：1 字节类型 + 4 字节总块数）
+        packet_type, total_chunks = HEADER.unpack(await reader.readexactly(HEADER.size))
+        if packet_type == TYPE_INIT:
+            caps = 0
+            writer.write(struct.pack('!B', TYPE_AGREE))
+        elif packet_type == TYPE_INIT_EXT:
+            caps = negotiate_caps(UINT.unpack(await reader.readexactly(UINT.size))[0], cache)
+            writer.write(HEADER.pack(TYPE_AGREE_EXT, caps))
+        else:
+            log.warning("收到错误类型的初始化报文")
+            stats.error()
+            return
+
+        log.info(f"[{addr}] 任务总块数: {total_chunks}，能力位: {caps:#x}")
+        codec = FrameCodec(caps) if caps & CAP_COMPRESS else None
+
+        # 严格按接收顺序处理请求
+        done = 0
+        while done < total_chunks:
+            packet_type, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+            if length > MAX_FRAME:
+                # 长度字段来自对端，超长时不接收报文体（readexactly 会按长度分配缓冲区），直接断开
+                log.warning(f"[错误] {addr} 报文长度 {length} 超过上限 {MAX_FRAME}")
+                stats.error()
+                return
+            body = await reader.readexactly(length)
+            started = time.perf_counter()
+            if codec is not None:
+                packet_type, body = codec.decode(packet_type, body)
+            buffers, count, nbytes = build_response(packet_type, body, caps, cache)
+            if buffers is None:
+                log.warning("收到错误类型的数据请求")
+                stats.error()
+                return
+            if codec is not None:
+                buffers = codec.encode(buffers)
+            writer.writelines(buffers)
+            await writer.drain()# 发送缓冲区过满时等待，防止内存无限增长
+            stats.request_seconds.observe(time.perf_counter() - started)
+            done += count
+            stats.add_chunks(count, nbytes)
+            log.debug("[%s] 已处理 %d 个数据块（%d 字节），进度 %d/%d", addr, count, nbytes, done, total_chunks)
+
+    except asyncio.IncompleteReadError:
+        log.warning(f"[错误] {addr} 连接意外关闭")
+        stats.error()
+    except Exception as e:
+        log.warning(f"[错误] {e}")
+        stats.error()
+    finally:
+        writer.close()# 关闭客户端连接
+        stats.connection_closed()
+        if codec is not None:
+            stats.add_compression(codec)
+        stats.connection_seconds.observe(time.perf_counter() - opened)
+        log.info(f"[断开] {addr}")
+
+async def serve_async(host, port, backlog, max_connections, stats=None, stop=None, reuse_port=False, listener=None,
+                      cache=None):
+    # 协程模式：单线程事件循环处理所有连接，每个连接只占用一个协程
+    # 参数同 serve_threaded
+    stats = stats if stats is not None else ServerStats()
+
+    async def on_connect(reader, writer):
+        if max_connections and stats.active() >= max_connections:
+            log.warning(f"[拒绝] {writer.get_extra_info('peername')}：并发连接数已达上限 {max_connections}")
+            stats.rejected()
+            writer.close()
+            return
+        await handle_client_async(reader, writer, stats, cache)
+
+    sock = listener if listener is not None else create_listener(host, port, backlog, reuse_port)
+    port = sock.getsockname()[1]
+    server = await asyncio.start_server(on_connect, sock=sock)
+    log.info(f"[启动] TCP服务端（协程模式）监听端口 {port}，等待客户端连接...")
+    async with server:
+        if stop is None:
+            await server.serve_forever()
+        # 等待停止信号，然后不再接受新连接，给已有连接留出处理时间
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        server.close()
+        deadline = time.monotonic() + STOP_GRACE
+        while stats.active() > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+def run_async_server(host, port, backlog, max_connections, use_uvloop=False, stats=None, stop=None, reuse_port=False,
+                     listener=None, cache=None):
+    # 启动协程模式服务器
+    # - use_uvloop: 为 True 且已安装 uvloop 时使用 uvloop 事件循环，否则使用标准 asyncio
+    # - 其余参数同 serve_threaded
+    coro = serve_async(host, port, backlog, max_connections, stats, stop, reuse_port, listener, cache)
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            log.warning("未安装 uvloop，使用标准 asyncio 事件循环")
+        else:
+            uvloop.run(coro)
+            return
+    asyncio.run(coro)
+
+def worker_main(host, port, engine, backlog, max_connections, values, cache_bytes=0):
+    # 预分叉模式下的工作进程入口：以 SO_REUSEPORT 绑定同一端口，独立处理连接
+    # SIGTERM 触发优雅退出；SIGINT 交给主进程统一处理
+    # - cache_bytes: 本进程去重缓存的大小，0 为不支持去重
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stats = ServerStats(values)
+    cache = DedupCache(cache_bytes) if cache_bytes else None
+    if engine == 'thread':
+        serve_threaded(host, port, backlog, max_connections, stats, stop, reuse_port=True, cache=cache)
+    else:
+        run_async_server(host, port, backlog, max_connections, engine == 'uvloop', stats, stop, reuse_port=True,
+                         cache=cache)
+
+def serve_prefork(host, port, engine, backlog, max_connections, workers, report_interval=5.0, metrics_port=None,
+                  cache_bytes=0):
+    # 预分叉模式：启动 workers 个工作进程，各自绑定同一端口；
+    # 主进程负责重启意外退出的工作进程、定期汇总统计、收到 Ctrl+C/SIGTERM 后优雅停止
+    # - metrics_port: 不为 None 时由主进程提供指标接口，导出所有工作进程的计数之和（不含时延直方图和去重缓存统计）
+    # - cache_bytes: 每个工作进程的去重缓存大小，0 为不支持去重
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        log.error("错误：当前平台不支持 SO_REUSEPORT，无法使用多进程模式")
+        return
+    retired = [0] * len(ServerStats.FIELDS)# 已退出工作进程的累计计数
+    slots = []# 每个工作进程的 (进程, 共享计数数组)
+
+    def spawn():
+        values = multiprocessing.RawArray('q', len(ServerStats.FIELDS))
+        proc = multiprocessing.Process(target=worker_main, daemon=True,
+                                       args=(host, port, engine, backlog, max_connections, values, cache_bytes))
+        proc.start()
+        return proc, values
+
+    def totals():
+        result = list(retired)
+        for _, values in slots:
+            for i, v in enumerate(values):
+                result[i] += v
+        return dict(zip(ServerStats.FIELDS, result))
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    for _ in range(workers):
+        slots.append(spawn())
+    log.info(f"[启动] 预分叉模式：{workers} 个工作进程（{engine}）监听端口 {port}")
+    metrics_server = start_metrics_server(build_registry(totals), metrics_port) if metrics_port is not None else None
+
+    last_report = time.monotonic()
+    last_totals = None
+    try:
+        while not stopping.is_set():
+            time.sleep(0.5)
+            # 重启意外退出的工作进程，计数并入 retired（活动连接数除外）
+            for i, (proc, values) in enumerate(slots):
+                if not proc.is_alive():
+                    for k, field in enumerate(ServerStats.FIELDS):
+                        if field != 'active':
+                            retired[k] += values[k]
+                    log.warning(f"[重启] 工作进程 {proc.pid} 已退出（退出码 {proc.exitcode}），启动新的工作进程")
+                    slots[i] = spawn()
+            if time.monotonic() - last_report >= report_interval:
+                last_report = time.monotonic()
+                current = totals()
+                if current != last_totals:
+                    last_totals = current
+                    log.info(f"[统计] 工作进程 {len(slots)}，累计连接 {current['connections']}，"
+                             f"活动连接 {current['active']}，块数 {current['chunks']}，字节 {current['bytes']}")
+    except KeyboardInterrupt:
+        pass
+
+    # 优雅停止：通知所有工作进程，等待其处理完已有连接
+    log.info("[停止] 正在停止工作进程...")
+    if metrics_server is not None:
+        metrics_server.stop()
+    for proc, _ in slots:
+        proc.terminate()
+    for proc, _ in slots:
+        proc.join(STOP_GRACE + 2)
+        if proc.is_alive():
+            proc.kill()
+    final = totals()
+    print(f"[统计] 累计连接 {final['connections']}，块数 {final['chunks']}，字节 {final['bytes']}")
+
+class ReverseServer:
+    # 在当前进程的后台线程中运行的服务器（线程模式或协程模式），可启动和停止，用于测试和基准
+    # 用法：
+    #   server = ReverseServer(port=0)         # 端口为 0 时由系统分配
+    #   host, port = server.start()
+    #   ...
+    #   server.stop()
+    def __init__(self, host='127.0.0.1', port=0, engine='thread', backlog=128, max_connections=0, metrics_port=None,
+                 cache_bytes=DEDUP_CACHE_BYTES):
+        # 参数：
+        # - engine: thread/asyncio/uvloop
+        # - metrics_port: 不为 None 时同时启动指标接口（0 为自动分配）
+        # - cache_bytes: 去重缓存大小（字节），0 为不支持去重；缓存见 self.cache
+        # - 其余参数同 serve_threaded
+        if engine not in ('thread', 'asyncio', 'uvloop'):
+            raise ValueError(f"未知的服务器模式 {engine}")
+        self.engine = engine
+        self.max_connections = max_connections
+        self.stats = ServerStats()
+        self.cache = DedupCache(cache_bytes) if cache_bytes else None
+        self.listener = create_listener(host, port, backlog)# 在构造时绑定，start 之前即可取得实际端口
+        self.address = self.listener.getsockname()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # 启动后台线程，返回监听地址
+        if self.metrics_port is not None:
+            registry = self.stats.registry()
+            if self.cache is not None:
+                self.cache.register(registry)
+            self.metrics_server = start_metrics_server(registry, self.metrics_port)
+        host, port = self.address
+        if self.engine == 'thread':
+            target = serve_threaded
+            args = (host, port, 0, self.max_connections, self.stats, self.stop_event, False, self.listener, self.cache)
+        else:
+            target = run_async_server
+            args = (host, port, 0, self.max_connections, self.engine == 'uvloop', self.stats, self.stop_event,
+                    False, self.listener, self.cache)
+        self.thread = threading.Thread(target=target, args=args, daemon=True)
+        self.thread.start()
+        return self.address
+
+    def stop(self, timeout=None):
+        # 停止接受新连接，等待已有连接处理完毕（最多 STOP_GRACE 秒）后返回
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args(argv):
+    # 解析命令行参数；--config 指定的 JSON 文件提供默认值（键为选项名），命令行参数优先
+    parser = argparse.ArgumentParser(description="反转协议 TCP 服务器（不带参数运行时交互式输入配置）")
+    parser.add_argument('--config', help="JSON 配置文件，例如 {\"port\": 12345, \"engine\": \"asyncio\"}")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=12345, help="监听端口，0 为自动分配")
+    parser.add_argument('--engine', choices=['thread', 'asyncio', 'uvloop'], default='thread', help="服务器模式")
+    parser.add_argument('--backlog', type=int, default=128, help="监听队列大小")
+    parser.add_argument('--max-connections', type=int, default=0, help="最大并发连接数，0 表示不限制")
+    parser.add_argument('--workers', type=int, default=1, help="工作进程数，1 为单进程，0 为每个CPU核心一个")
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'], default='info',
+                        help="日志级别，debug 输出逐帧日志")
+    parser.add_argument('--log-sample', type=int, default=1, help="debug 日志每 N 条输出 1 条")
+    parser.add_argument('--metrics-port', type=int, help="监控指标HTTP端口，0 为自动分配，不指定则不启用")
+    parser.add_argument('--dedup-cache-mb', type=float, default=DEDUP_CACHE_BYTES >> 20,
+                        help="去重缓存大小（MB，多进程模式下为每个进程），0 为不支持去重")
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            parser.set_defaults(**{k.replace('-', '_'): v for k, v in json.load(f).items()})
+        args = parser.parse_args(argv)
+    return args
+
+def prompt_args():
+    # 交互式输入配置，返回与 parse_args 相同的参数对象
+    port = int(input("请输入服务端监听端口号（如12345）：").strip())
+    engine = input("请选择服务器模式 thread/asyncio/uvloop（直接回车为thread）：").strip() or 'thread'
+    backlog_text = input("请输入监听队列大小（直接回车为128）：").strip()
+    backlog = int(backlog_text) if backlog_text else 128
+    max_text = input("请输入最大并发连接数（直接回车为0，不限制）：").strip()
+    max_connections = int(max_text) if max_text else 0
+    workers_text = input("请输入工作进程数（直接回车为1，单进程；0 为每个CPU核心一个）：").strip()
+    workers = int(workers_text) if workers_text else 1
+    level = input("请输入日志级别 debug/info/warning（直接回车为info；debug 输出逐帧日志）：").strip() or 'info'
+    sample = 1
+    if level == 'debug':
+        sample_text = input("逐帧日志采样：每N条输出1条（直接回车为1，全部输出）：").strip()
+        sample = int(sample_text) if sample_text else 1
+    metrics_text = input("请输入监控指标HTTP端口（直接回车不启用，0 为自动分配）：").strip()
+    metrics_port = int(metrics_text) if metrics_text else None
+    cache_text = input(f"请输入去重缓存大小MB（直接回车为{DEDUP_CACHE_BYTES >> 20}，0 为不支持去重）：").strip()
+    cache_mb = float(cache_text) if cache_text else DEDUP_CACHE_BYTES >> 20
+    host = '0.0.0.0' # 监听所有 IP 地址
+    return argparse.Namespace(host=host, port=port, engine=engine, backlog=backlog,
+                              max_connections=max_connections, workers=workers, log_level=level,
+                              log_sample=sample, metrics_port=metrics_port, dedup_cache_mb=cache_mb)
+
+def main(argv=None):
+    # 主函数，启动 TCP 服务器
+    # 带命令行参数时按参数（和配置文件）运行，否则交互式输入配置
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv) if argv else prompt_args()
+    setup_logging('reversetcpserver', args.log_level, args.log_sample)
+
+    if args.engine not in ('thread', 'asyncio', 'uvloop'):
+        print(f"错误：未知的服务器模式 {args.engine}")
+        return
+    cache_bytes = int(args.dedup_cache_mb * (1 << 20))
+    if args.workers != 1:
+        serve_prefork(args.host, args.port, args.engine, args.backlog, args.max_connections,
+                      args.workers or os.cpu_count(), metrics_port=args.metrics_port, cache_bytes=cache_bytes)
+        return
+    stats = ServerStats()
+    cache = DedupCache(cache_bytes) if cache_bytes else None
+    metrics_server = None
+    if args.metrics_port is not None:
+        registry = stats.registry()
+        if cache is not None:
+            cache.register(registry)
+        metrics_server = start_metrics_server(registry, args.metrics_port)
+    try:
+        if args.engine == 'thread':
+            serve_threaded(args.host, args.port, args.backlog, args.max_connections, stats, cache=cache)
+        else:
+            run_async_server(args.host, args.port, args.backlog, args.max_connections,
+                             use_uvloop=(args.engine == 'uvloop'), stats=stats, cache=cache)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        if cache is not None:
+            log.info(cache.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import argparse
+import struct
+import time
+import timeit
+
+from codec import HEADER, TIMESTAMP, TIMESTAMP_OFFSET, FLAG_SACK, encode_into, decode, now_us
+
+# 报文编解码微基准：比较原来的实现（每次按格式字符串打包、time.time()、拼接首部和数据、
+# 解析为字典并复制数据）与 codec 模块（预编译 Struct、pack_into 写入复用缓冲区、命名元组 + memoryview）
+# 用法示例：python bench_codec.py --number 200000
+
+PAYLOAD = b'X' * 80
+
+
+def old_create_packet(seq, ack, syn, fin, data):
+    # 原来的 _create_packet
+    flags = (syn << 1) | fin
+    timestamp = int(time.time())
+    header = struct.pack('!IIBI', seq, ack, flags, timestamp)
+    return header + data
+
+
+def old_parse_packet(packet_data):
+    # 原来的 _parse_packet
+    header = packet_data[:13]
+    seq, ack, flags, timestamp = struct.unpack('!IIBI', header)
+    syn = (flags & 0x02) >> 1
+    fin = flags & 0x01
+    sack = (flags & 0x04) >> 2
+    return {
+        'seq': seq,
+        'ack': ack,
+        'syn': syn,
+        'fin': fin,
+        'sack': sack,
+        'timestamp': timestamp,
+        'data': packet_data[13:]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP 报文编解码微基准")
+    parser.add_argument('--number', type=int, default=200000, help="每项测试的执行次数")
+    parser.add_argument('--repeat', type=int, default=5, help="重复次数，取最快的一次")
+    args = parser.parse_args()
+
+    buf = bytearray(HEADER.size + len(PAYLOAD))
+    wire = old_create_packet(7, 3, 0, 0, PAYLOAD)
+    wire_view = memoryview(bytearray(wire))  # 接收时数据位于 recvfrom_into 的缓冲区中
+    env = dict(globals(), buf=buf, wire=wire, wire_view=wire_view)
+    # 原实现在 _create_packet 内部读取时钟，新实现由调用方传入时间戳，因此时钟单独列出
+    cases = [
+        ('时钟：int(time.time())（原实现）', "int(time.time())"),
+        ('时钟：now_us()', "now_us()"),
+        ('编码：数据包（原实现）', "old_create_packet(7, 3, 0, 0, PAYLOAD)"),
+        ('编码：数据包（encode_into）', "encode_into(buf, 7, 3, 0, now_us(), PAYLOAD)"),
+        ('编码：重传只改时间戳（pack_into）', "TIMESTAMP.pack_into(buf, TIMESTAMP_OFFSET, now_us())"),
+        ('编码：确认包（原实现）', "old_create_packet(0, 7, 0, 0, b'')"),
+        ('编码：确认包（encode_into，回送时间戳）', "encode_into(buf, 0, 7, FLAG_SACK, 12345)"),
+        ('解码（原实现，字典 + 复制数据）', "old_parse_packet(wire)"),
+        ('解码（decode，命名元组 + memoryview）', "decode(wire_view)"),
+    ]
+    # 各项交替测量，每项取最快的一次，减少机器负载波动对比较的影响
+    timers = [timeit.Timer(stmt, globals=env) for _, stmt in cases]
+    best = [float('inf')] * len(cases)
+    for _ in range(args.repeat):
+        for i, timer in enumerate(timers):
+            best[i] = min(best[i], timer.timeit(args.number))
+    print(f"每项执行 {args.number} 次，交替重复 {args.repeat} 轮，取最快的一次")
+    for (name, _), t in zip(cases, best):
+        print(f"{name:<36}{t / args.number * 1e9:>10.0f} ns/包")
+
+
+if __name__ == "__main__":
+    main()
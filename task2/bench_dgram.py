@@ -0,0 +1,175 @@
+import argparse
+import multiprocessing
+import socket
+import struct
+import time
+
+from dgramio import DatagramIO
+
+# 数据报 I/O 基准测试：比较逐个收发与批量收发（合并确认、可选 UDP GSO）的包速率和系统调用次数
+# 发送端按 GBN 方式发送带 13 字节首部和 80 字节数据的报文，接收端返回累计确认
+# 用法示例：python bench_dgram.py --count 200000 --window 64 --mode all
+
+HEADER = struct.Struct('!IIBI')  # 与 udpclient/udpserver 相同的首部
+PAYLOAD = b'X' * 80
+STOP = 0  # 序号为 0 的报文表示测试结束
+
+
+def receiver(ready, results, batched, ack_every):
+    # 接收端（子进程）：按序接收并返回累计确认
+    # 参数：
+    # - ready: 用于把接收端口告诉发送端的队列
+    # - results: 用于返回统计信息的队列
+    # - batched: 是否使用批量 I/O 与延迟确认
+    # - ack_every: 批量模式下每按序收到多少个报文至少确认一次
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind(('127.0.0.1', 0))
+    ready.put(sock.getsockname()[1])
+    expected = 1
+    if batched:
+        io = DatagramIO(sock)
+        done = False
+        while not done:
+            io.wait(None)
+            owed = 0
+            peer = None
+            for data, peer in io.drain():
+                seq = HEADER.unpack_from(data)[0]
+                if seq == STOP:
+                    done = True
+                    break
+                if seq == expected:
+                    expected += 1
+                    owed += 1
+                    if owed < ack_every:
+                        continue
+                io.send(HEADER.pack(0, expected - 1, 0, 0), peer)# 乱序报文立即确认
+                owed = 0
+            if owed:
+                io.send(HEADER.pack(0, expected - 1, 0, 0), peer)# 本轮剩余的按序报文合并确认
+            io.flush()
+        stats = io.stats()
+    else:
+        stats = {'recv_calls': 0, 'received': 0, 'send_calls': 0, 'sent': 0}
+        while True:
+            data, peer = sock.recvfrom(2048)
+            stats['recv_calls'] += 1
+            stats['received'] += 1
+            seq = HEADER.unpack_from(data)[0]
+            if seq == STOP:
+                break
+            if seq == expected:
+                expected += 1
+            sock.sendto(HEADER.pack(0, expected - 1, 0, 0), peer)
+            stats['send_calls'] += 1
+            stats['sent'] += 1
+    sock.close()
+    results.put(stats)
+
+
+def sender(port, count, window, batched, gso):
+    # 发送端：GBN 发送 count 个报文，返回 (用时, 统计信息)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', port)
+    slots = [bytearray(HEADER.size + len(PAYLOAD)) for _ in range(window)]# 预分配的环形窗口
+    for slot in slots:
+        slot[HEADER.size:] = PAYLOAD
+    if batched:
+        io = DatagramIO(sock, gso=gso)
+    else:
+        sock.settimeout(0.05)
+        stats = {'recv_calls': 0, 'received': 0, 'send_calls': 0, 'sent': 0}
+
+    base = next_seq = 1
+    last_progress = time.perf_counter()
+    start = last_progress
+    while base <= count:
+        while next_seq < base + window and next_seq <= count:
+            packet = slots[next_seq % window]
+            HEADER.pack_into(packet, 0, next_seq, 0, 0, 0)
+            if batched:
+                io.send(packet, address)
+            else:
+                sock.sendto(packet, address)
+                stats['send_calls'] += 1
+                stats['sent'] += 1
+            next_seq += 1
+
+        acks = []
+        if batched:
+            io.flush()
+            if io.wait(0.05):
+                acks = [HEADER.unpack_from(data)[1] for data, _ in io.drain()]
+        else:
+            try:
+                data, _ = sock.recvfrom(2048)
+                stats['recv_calls'] += 1
+                stats['received'] += 1
+                acks = [HEADER.unpack_from(data)[1]]
+            except socket.timeout:
+                pass
+        for ack in acks:
+            if ack >= base:
+                base = ack + 1
+                last_progress = time.perf_counter()
+        if time.perf_counter() - last_progress > 0.1:
+            next_seq = base# 超时，从 base 开始重发整个窗口
+            last_progress = time.perf_counter()
+    elapsed = time.perf_counter() - start
+
+    stop_packet = HEADER.pack(STOP, 0, 0, 0)
+    for _ in range(3):
+        sock.sendto(stop_packet, address)
+    if batched:
+        stats = io.stats()
+        io.close()
+    sock.close()
+    return elapsed, stats
+
+
+def run(mode, count, window, ack_every):
+    # 运行一种模式，返回结果字典
+    batched = mode != 'single'
+    ready = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=receiver, args=(ready, results, batched, ack_every))
+    proc.start()
+    try:
+        port = ready.get(timeout=10)
+        elapsed, send_stats = sender(port, count, window, batched, mode == 'gso')
+        recv_stats = results.get(timeout=10)
+    finally:
+        proc.join(5)
+        if proc.is_alive():
+            proc.terminate()
+    return {
+        'mode': mode,
+        'pps': count / elapsed,
+        'sender_calls_per_packet': (send_stats['send_calls'] + send_stats['recv_calls']) / count,
+        'receiver_calls_per_packet': (recv_stats['send_calls'] + recv_stats['recv_calls']) / count,
+        'acks': recv_stats['sent'],
+        'sent': send_stats['sent'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP 数据报 I/O 包速率基准测试")
+    parser.add_argument('--count', type=int, default=100000, help="发送的报文个数")
+    parser.add_argument('--window', type=int, default=64, help="发送窗口大小")
+    parser.add_argument('--ack-every', type=int, default=16, help="批量模式下每按序收到多少个报文至少确认一次")
+    parser.add_argument('--mode', choices=['single', 'batch', 'gso', 'all'], default='all',
+                        help="single：逐个收发；batch：批量收发与合并确认；gso：batch 加 UDP GSO 发送")
+    args = parser.parse_args()
+
+    modes = ['single', 'batch', 'gso'] if args.mode == 'all' else [args.mode]
+    print(f"报文数: {args.count}，窗口: {args.window}，合并确认: 每 {args.ack_every} 个")
+    print(f"{'模式':<8}{'包/秒':>12}{'发送端调用/包':>16}{'接收端调用/包':>16}{'确认数':>10}{'发送数':>10}")
+    for mode in modes:
+        r = run(mode, args.count, args.window, args.ack_every)
+        print(f"{r['mode']:<8}{r['pps']:>12.0f}{r['sender_calls_per_packet']:>16.3f}"
+              f"{r['receiver_calls_per_packet']:>16.3f}{r['acks']:>10}{r['sent']:>10}")
+
+
+if __name__ == "__main__":
+    main()
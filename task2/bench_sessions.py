@@ -0,0 +1,94 @@
+import argparse
+import multiprocessing
+import tempfile
+import time
+
+from metrics import setup_logging
+from netem import NetEmulator, PROFILES
+from stats import LatencyStats
+from udpclient import UDPClient
+from udpserver import UDPServer
+
+# 短会话基准测试：对同一服务器依次建立大量短连接，每个连接只传输少量数据包，
+# 比较普通握手/四次挥手与快速打开（数据随 SYN 发出，FIN 捎带在最后的确认中）的会话速率和会话用时
+# 服务器（以及可选的网络损伤代理）运行在子进程中，不与客户端争用解释器
+# 会话用时从开始握手到发送最终 ACK，不含 TIME_WAIT（默认关闭，见 --time-wait）
+# 用法示例：python bench_sessions.py --sessions 500 --packets 4
+#           python bench_sessions.py --sessions 50 --profile wan    （经 netem 代理，往返时延约 80 ms）
+
+
+def server_main(ready, loss_rate, profile, seed):
+    # 子进程：运行服务器和可选的网络损伤代理，把客户端应连接的地址告诉父进程，之后一直运行到被终止
+    setup_logging('udpserver', 'warning')
+    server = UDPServer(loss_rate=loss_rate, seed=seed, output_dir=tempfile.mkdtemp(prefix='bench_sessions_'))
+    address = server.start()
+    if profile:
+        address = NetEmulator(address, profile=profile, seed=seed).start()
+    ready.put(address)
+    server.thread.join()
+
+
+def run(fast_open, address, args):
+    # 依次运行 args.sessions 个会话，返回结果字典
+    session_ms = LatencyStats()
+    failures = 0
+    retransmits = 0
+    start = time.perf_counter()
+    for _ in range(args.sessions):
+        client = UDPClient(args.window, args.packets, payload_size=args.payload_size, server_address=address,
+                           fast_open=fast_open, time_wait=args.time_wait)
+        try:
+            result = client.run()
+        except ConnectionError:
+            failures += 1
+            continue
+        session_ms.add(result['session_s'] * 1000)
+        retransmits += result['retransmits']
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': '快速打开' if fast_open else '普通握手',
+        'sessions_per_s': args.sessions / elapsed,
+        'p50_ms': session_ms.percentile(50),
+        'p99_ms': session_ms.percentile(99),
+        'mean_ms': session_ms.mean,
+        'retransmits': retransmits,
+        'failures': failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP 短会话速率基准测试（普通握手 vs 快速打开）")
+    parser.add_argument('--sessions', type=int, default=300, help="每种模式的会话个数")
+    parser.add_argument('--packets', type=int, default=4, help="每个会话发送的数据包个数")
+    parser.add_argument('--payload-size', type=int, default=80, help="每包数据长度")
+    parser.add_argument('--window', type=int, default=64, help="最大滑动窗口大小")
+    parser.add_argument('--loss', type=float, default=0.0, help="服务器模拟丢包率")
+    parser.add_argument('--profile', choices=list(PROFILES), help="经 netem 代理连接服务器时使用的损伤场景")
+    parser.add_argument('--seed', type=int, default=1, help="丢包和损伤的随机种子")
+    parser.add_argument('--time-wait', type=float, default=0.0,
+                        help="客户端 TIME_WAIT 秒数（在后台线程中进行，不计入会话用时）")
+    parser.add_argument('--mode', choices=['classic', 'fast', 'all'], default='all',
+                        help="classic：三次握手和四次挥手；fast：快速打开；all：两者都测")
+    args = parser.parse_args()
+    setup_logging('udpclient', 'warning')
+
+    ready = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=server_main, args=(ready, args.loss, args.profile, args.seed), daemon=True)
+    proc.start()
+    try:
+        address = ready.get(timeout=10)
+        modes = [False, True] if args.mode == 'all' else [args.mode == 'fast']
+        print(f"会话数: {args.sessions}，每会话 {args.packets} 个数据包（每包 {args.payload_size} 字节），"
+              f"丢包率: {args.loss}，损伤场景: {args.profile or '无'}")
+        print(f"{'模式':<10}{'会话/秒':>10}{'p50 ms':>10}{'p99 ms':>10}{'平均 ms':>10}{'重传':>8}{'失败':>6}")
+        for fast_open in modes:
+            r = run(fast_open, address, args)
+            print(f"{r['mode']:<10}{r['sessions_per_s']:>10.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+                  f"{r['mean_ms']:>10.2f}{r['retransmits']:>8}{r['failures']:>6}")
+    finally:
+        proc.terminate()
+        proc.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import struct
+import time
+from collections import namedtuple
+
+# UDP 协议报文编解码，客户端和服务器共用
+# 首部格式：4 字节 seq + 4 字节 ack + 1 字节 flags + 4 字节时间戳，大端序
+# 时间戳为发送方单调时钟的微秒数（取低 32 位，约 71 分钟回绕一次），
+# 确认包的时间戳字段回送触发它的数据包的时间戳，发送方据此直接计算 RTT
+
+HEADER = struct.Struct('!IIBI')  # 预编译的首部格式
+TIMESTAMP = struct.Struct('!I')  # 首部中的时间戳字段
+TIMESTAMP_OFFSET = 9  # 时间戳字段在首部中的偏移
+TIMESTAMP_MASK = 0xFFFFFFFF
+
+# 标志位
+FLAG_FIN = 0x01  # 第 0 位：结束
+FLAG_SYN = 0x02  # 第 1 位：同步
+FLAG_SACK = 0x04  # 第 2 位：选择确认
+FLAG_FEC = 0x08  # 第 3 位：前向纠错（SYN 中请求、SYN+ACK 中同意；数据阶段表示校验包；确认中表示由校验包恢复）
+FLAG_ZLIB = 0x10  # 第 4 位：压缩（SYN 中请求、SYN+ACK 中同意；数据阶段表示数据部分经 zlib 压缩）
+FLAG_FAST = 0x20  # 第 5 位：快速打开（SYN 中请求、SYN+ACK 中同意；数据随 SYN 一起发出，服务器收齐后在确认中捎带 FIN）
+
+_tuple_new = tuple.__new__
+_monotonic_ns = time.monotonic_ns
+_packers = {}  # 数据长度 -> 首部加定长数据的预编译 Struct，一次 pack_into 写完整个报文
+_PACKERS_MAX = 1024  # 缓存的 Struct 个数上限
+
+
+class Packet(namedtuple('Packet', 'seq ack flags timestamp data')):
+    # 解析后的报文：轻量的命名元组，data 是接收缓冲区上的 memoryview，不复制
+    # 注意：data 只在接收缓冲区被复用之前有效，需要保留时应复制为 bytes
+    __slots__ = ()
+
+    @property
+    def syn(self):
+        return (self.flags & FLAG_SYN) >> 1
+
+    @property
+    def fin(self):
+        return self.flags & FLAG_FIN
+
+    @property
+    def sack(self):
+        return (self.flags & FLAG_SACK) >> 2
+
+    @property
+    def fec(self):
+        return (self.flags & FLAG_FEC) >> 3
+
+    @property
+    def zlib(self):
+        return (self.flags & FLAG_ZLIB) >> 4
+
+    @property
+    def fast(self):
+        return (self.flags & FLAG_FAST) >> 5
+
+
+def make_flags(syn=0, fin=0, sack=0, fec=0, zlib=0, fast=0):
+    # 组合标志位：fast 占第 5 位，zlib 占第 4 位，fec 占第 3 位，sack 占第 2 位，syn 占第 1 位，fin 占第 0 位
+    return (fast << 5) | (zlib << 4) | (fec << 3) | (sack << 2) | (syn << 1) | fin
+
+
+def now_us():
+    # 当前单调时钟的微秒数（低 32 位），用作报文时间戳
+    return (_monotonic_ns() // 1000) & TIMESTAMP_MASK
+
+
+def elapsed_us(stamp, now=None):
+    # 从时间戳 stamp 到 now（默认当前时刻）经过的微秒数，处理 32 位回绕
+    if now is None:
+        now = now_us()
+    return (now - stamp) & TIMESTAMP_MASK
+
+
+def encode_into(buf, seq, ack, flags, timestamp, data=b''):
+    # 把报文直接写入预分配的缓冲区（bytearray 或可写 memoryview），不产生新对象
+    # 返回：报文长度
+    if not data:
+        HEADER.pack_into(buf, 0, seq, ack, flags, timestamp)
+        return HEADER.size
+    n = len(data)
+    packer = _packers.get(n)
+    if packer is None:
+        packer = struct.Struct(f'!IIBI{n}s')
+        if len(_packers) < _PACKERS_MAX:
+            _packers[n] = packer
+    try:
+        packer.pack_into(buf, 0, seq, ack, flags, timestamp, data)
+    except struct.error:
+        HEADER.pack_into(buf, 0, seq, ack, flags, timestamp)# 's' 格式不接受 memoryview，分两步写入
+        buf[HEADER.size:HEADER.size + n] = data
+    return HEADER.size + n
+
+
+def encode(seq, ack, flags, timestamp=None, data=b''):
+    # 创建一个新的报文（用于握手、挥手等不频繁的控制报文）
+    # 参数：
+    # - timestamp: 时间戳，默认为当前时刻
+    # 返回：bytes
+    if timestamp is None:
+        timestamp = now_us()
+    return HEADER.pack(seq, ack, flags, timestamp) + data
+
+
+def decode(buf):
+    # 解析报文，返回 Packet；长度不足首部时抛出 struct.error
+    # buf 为 memoryview 时数据部分不复制
+    if not isinstance(buf, memoryview):
+        buf = memoryview(buf)
+    return _tuple_new(Packet, HEADER.unpack_from(buf) + (buf[HEADER.size:],))
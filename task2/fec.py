@@ -0,0 +1,110 @@
+import struct
+
+# 前向纠错（FEC）：每 K 个连续数据包附加一个 XOR 校验包，组内丢失任意一个包时接收方直接恢复，
+# 不必等待超时重传（高 RTT、有丢包的链路上省去一个 RTO 加一个 RTT）；组内丢失两个及以上时仍由重传兜底
+# 分组：序号 seq 属于第 (seq-1)//K 组，即每组覆盖 组号*K+1 到 组号*K+K，最后一组可能不足 K 个
+# 校验包：首部 seq 为组内第一个序号，ack 为组内数据包个数，flags 置 FLAG_FEC；
+#         数据为 2 字节的各包长度异或值，后接各包数据（短包末尾补零）的异或值
+# 异或用 Python 大整数计算：int.from_bytes 按小端序转换，短包相当于末尾补零，每包只有一次 C 级运算
+
+LENGTH = struct.Struct('!H')  # 校验数据开头的长度异或值
+MAX_K = 255  # 每组最多的数据包个数，在 SYN 的 ack 字段中协商
+
+
+class ParityEncoder:
+    # 发送端：按序号顺序加入首次发送的数据包，组满（或到达最后一个包）时生成校验数据
+    def __init__(self, k):
+        self.k = k
+        self.acc = 0  # 本组数据的异或值
+        self.length = 0  # 本组各包长度的异或值
+        self.size = 0  # 本组最长的数据长度，即校验数据的长度
+        self.count = 0
+
+    def add(self, data, last=False):
+        # 加入下一个数据包的数据，last 为 True 表示这是最后一个数据包
+        # 返回：本组结束时为 (组内数据包个数, 校验数据)，否则为 None
+        self.acc ^= int.from_bytes(data, 'little')
+        self.length ^= len(data)
+        self.size = max(self.size, len(data))
+        self.count += 1
+        if self.count < self.k and not last:
+            return None
+        parity = LENGTH.pack(self.length) + self.acc.to_bytes(self.size, 'little')
+        count = self.count
+        self.acc = self.length = self.size = self.count = 0
+        return count, parity
+
+
+class ParityDecoder:
+    # 接收端：每个未完成的分组记录已收到数据的异或值和收到的序号（位掩码），
+    # 收到校验包且组内恰好缺一个包时恢复该包；分组在其全部数据包按序交付后释放，
+    # 传输的最后一组可能不满 K 个，按校验包中的个数判断；校验包迟到时在收到它时释放，没有收到时由 clear 释放
+    def __init__(self, k):
+        self.k = k
+        self.blocks = {}  # 组号 -> [数据异或, 长度异或, 已收到序号的位掩码, 校验包 (个数, 数据异或, 长度异或) 或 None]
+        self.recovered = 0  # 恢复的数据包个数
+
+    def add(self, seq, data):
+        # 记录一个首次收到的数据包（不包括由本对象恢复的包）
+        # 返回：可以恢复组内缺失的包时为 (序号, 数据)，否则为 None
+        index = (seq - 1) // self.k
+        block = self.blocks.get(index)
+        if block is None:
+            block = self.blocks[index] = [0, 0, 0, None]
+        block[0] ^= int.from_bytes(data, 'little')
+        block[1] ^= len(data)
+        block[2] |= 1 << (seq - 1 - index * self.k)
+        return self._recover(index, block)
+
+    def add_parity(self, seq, count, data, expected_seq):
+        # 记录一个校验包
+        # 参数：
+        # - seq, count: 组内第一个序号和数据包个数（校验包首部的 seq 和 ack）
+        # - data: 校验数据
+        # - expected_seq: 接收方期望的下一个序号，整组都已交付的迟到校验包直接忽略并释放该组
+        # 返回：同 add
+        if (seq - 1) % self.k or not 1 <= count <= self.k or len(data) < LENGTH.size:
+            return None
+        index = (seq - 1) // self.k
+        if seq + count <= expected_seq:
+            self.blocks.pop(index, None)
+            return None
+        block = self.blocks.get(index)
+        if block is None:
+            block = self.blocks[index] = [0, 0, 0, None]
+        block[3] = (count, int.from_bytes(data[LENGTH.size:], 'little'), LENGTH.unpack_from(data)[0])
+        return self._recover(index, block)
+
+    def release(self, seq):
+        # 序号 seq 已按序交付；组内最后一个序号交付后释放该组
+        index = (seq - 1) // self.k
+        block = self.blocks.get(index)
+        if block is None:
+            return
+        last = index * self.k + (block[3][0] if block[3] is not None else self.k)
+        if seq >= last:
+            del self.blocks[index]
+
+    def clear(self):
+        # 连接关闭：释放所有未完成的分组
+        self.blocks.clear()
+
+    def _recover(self, index, block):
+        acc, length, mask, parity = block
+        if parity is None:
+            return None
+        count = parity[0]
+        received = bin(mask).count('1')
+        if received == count:
+            del self.blocks[index]  # 已全部收到，校验包没有用到
+            return None
+        if received != count - 1:
+            return None
+        missing = (~mask & (mask + 1)).bit_length() - 1  # 最低的 0 位
+        del self.blocks[index]
+        try:
+            data = (acc ^ parity[1]).to_bytes(length ^ parity[2], 'little')
+        except OverflowError:
+            return None  # 长度与数据不一致（校验包损坏），交给重传
+        self.recovered += 1
+        return index * self.k + missing + 1, data
@@ -0,0 +1,432 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import selectors
+import socket
+import threading
+import time
+
+# 网络损伤模拟器：位于客户端和服务器之间的本机 UDP 代理，两个方向分别施加丢包、时延、乱序、重复和限速
+# 客户端把报文发到代理的监听地址，代理为每个客户端地址开一个上游套接字转发给服务器，
+# 因此服务器看到的每个客户端地址仍然不同；服务器的回复经同一个上游套接字返回代理，再转发给客户端
+# 所有随机决策使用按方向分开的带种子随机数生成器，同样的种子和报文序列得到同样的丢包/时延序列
+# 用法示例：
+#   python netem.py --server 127.0.0.1:8000 --listen 127.0.0.1:9000 --profile bursty --seed 1
+#   python netem.py --server 127.0.0.1:8000 --profile wan --set up.loss=0.05 --set rate_kbps=2000
+#   python netem.py --server 127.0.0.1:8000 --profile my_profile.json
+# 也可以在同一进程中使用（监听端口为 0 时由系统分配）：
+#   emu = NetEmulator(('127.0.0.1', 8000), profile='bursty', seed=1)
+#   emu.start(); ...客户端连接 emu.address...; emu.stop(); print(emu.stats())
+
+UP = 'up'  # 客户端 -> 服务器
+DOWN = 'down'  # 服务器 -> 客户端
+MAX_DATAGRAM = 65536
+UPSTREAM_IDLE = 120.0  # 上游套接字超过该时间没有报文则关闭（秒）
+
+# 单个方向的损伤参数及默认值（全部为 0 表示不做任何损伤）
+DEFAULTS = {
+    'loss': 0.0,  # 独立丢包率（未启用 Gilbert-Elliott 模型时使用）
+    'ge_p': 0.0,  # Gilbert-Elliott：每个报文从好状态转入坏状态的概率，大于 0 时启用该模型
+    'ge_r': 0.0,  # Gilbert-Elliott：每个报文从坏状态回到好状态的概率，平均突发长度为 1/ge_r
+    'ge_loss_good': 0.0,  # 好状态下的丢包率
+    'ge_loss_bad': 1.0,  # 坏状态下的丢包率
+    'delay_ms': 0.0,  # 固定单向时延（毫秒）
+    'jitter_ms': 0.0,  # 时延抖动，在 [0, jitter_ms] 内均匀分布
+    'reorder': 0.0,  # 报文被额外延迟 reorder_ms 的概率，使其落到后续报文之后
+    'reorder_ms': 0.0,  # 乱序报文的额外时延（毫秒）
+    'keep_order': False,  # 为 True 时抖动不导致乱序（到达时刻不早于前一个报文）
+    'duplicate': 0.0,  # 报文被复制一份的概率
+    'rate_kbps': 0.0,  # 令牌桶限速（千比特/秒），0 表示不限速
+    'burst_bytes': 16384,  # 令牌桶容量（字节）
+    'queue_ms': 200.0,  # 限速队列的最大排队时延，超过则尾部丢弃（毫秒）
+}
+
+# 预置的损伤场景；up/down 为各方向参数，both 同时作用于两个方向，
+# phases 按时间（相对模拟器启动，秒）依次覆盖参数，用于模拟链路状况的变化
+PROFILES = {
+    'clean': {},
+    'lossy': {'up': {'loss': 0.2}},  # 与服务器原来内置的 20% 接收丢包相同
+    'bursty': {'both': {'ge_p': 0.01, 'ge_r': 0.25, 'delay_ms': 5}},  # 突发丢包，平均约 3.8%，突发长度 4
+    'wan': {'both': {'delay_ms': 40, 'jitter_ms': 10, 'keep_order': True, 'loss': 0.01, 'rate_kbps': 10000}},
+    'reorder': {'both': {'delay_ms': 5, 'reorder': 0.05, 'reorder_ms': 20, 'duplicate': 0.01}},
+    'congested': {'both': {'delay_ms': 20, 'rate_kbps': 2000, 'burst_bytes': 8192, 'queue_ms': 100}},
+    'flaky': {  # 前 5 秒正常，之后 5 秒突发丢包，然后恢复
+        'both': {'delay_ms': 10},
+        'phases': [{'at': 5, 'both': {'ge_p': 0.05, 'ge_r': 0.2}}, {'at': 10, 'both': {'ge_p': 0.0}}],
+    },
+}
+
+
+def load_profile(profile):
+    # 把场景名、JSON 文件路径或字典统一为字典
+    if profile is None:
+        return {}
+    if isinstance(profile, dict):
+        return profile
+    if profile in PROFILES:
+        return PROFILES[profile]
+    if os.path.isfile(profile):
+        with open(profile, encoding='utf-8') as f:
+            return json.load(f)
+    raise ValueError(f"未知的损伤场景: {profile}（可选 {', '.join(PROFILES)}，或 JSON 文件路径）")
+
+
+def direction_params(spec, direction):
+    # 从场景（或其中一个阶段）中取出某方向的参数：both 先生效，up/down 覆盖
+    params = dict(spec.get('both', {}))
+    params.update(spec.get(direction, {}))
+    unknown = set(params) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的损伤参数: {', '.join(sorted(unknown))}")
+    return params
+
+
+def parse_overrides(items):
+    # 解析命令行的 --set 参数，形如 delay_ms=20（两个方向）或 up.loss=0.1
+    # 返回：可合并到场景中的 {'both'|'up'|'down': {参数: 值}}
+    spec = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        direction, _, name = key.rpartition('.')
+        direction = direction or 'both'
+        if direction not in ('both', UP, DOWN) or name not in DEFAULTS:
+            raise ValueError(f"无法识别的参数: {item}")
+        default = DEFAULTS[name]
+        if isinstance(default, bool):
+            value = value.lower() in ('1', 'true', 'yes', 'y')
+        else:
+            value = type(default)(value)
+        spec.setdefault(direction, {})[name] = value
+    return spec
+
+
+class GilbertElliott:
+    # 两状态马尔可夫链突发丢包模型：好状态下以 loss_good 丢包，坏状态下以 loss_bad 丢包，
+    # 每个报文之前按 p（好 -> 坏）和 r（坏 -> 好）转移状态
+    def __init__(self, rng, p, r, loss_good=0.0, loss_bad=1.0):
+        self.rng = rng
+        self.p = p
+        self.r = r
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.bad = False
+
+    def lost(self):
+        # 推进一步，返回当前报文是否丢失
+        if self.bad:
+            if self.rng.random() < self.r:
+                self.bad = False
+        elif self.rng.random() < self.p:
+            self.bad = True
+        return self.rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+class TokenBucket:
+    # 令牌桶限速：令牌按 rate 字节/秒补充，最多积累 burst 字节；
+    # 令牌可以透支，透支量对应报文在队列中的等待时间，超过 max_wait 时丢弃报文
+    def __init__(self, rate, burst, max_wait):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def admit(self, size, now):
+        # 返回报文需要排队的时间（秒），队列已满时返回 None
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        wait = max(0.0, (size - self.tokens) / self.rate)
+        if wait > self.max_wait:
+            return None
+        self.tokens -= size
+        return wait
+
+
+class Impairment:
+    # 单个方向的损伤：对每个报文给出 0 个（丢弃）、1 个或 2 个（复制）发送时刻
+    def __init__(self, seed, params=None):
+        self.rng = random.Random(seed)
+        self.params = dict(DEFAULTS)
+        self.loss_model = None
+        self.bucket = None
+        self.last_departure = 0.0
+        # 统计
+        self.packets = 0
+        self.bytes = 0
+        self.delivered = 0
+        self.lost = 0
+        self.queue_drops = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.update(params or {})
+
+    def update(self, params):
+        # 修改参数（阶段切换时调用）；丢包模型和令牌桶只在相应参数变化时重建
+        old = self.params
+        self.params = dict(old, **params)
+        p = self.params
+        if p['ge_p'] > 0:
+            if self.loss_model is None or any(old[k] != p[k] for k in ('ge_p', 'ge_r', 'ge_loss_good', 'ge_loss_bad')):
+                bad = self.loss_model.bad if self.loss_model is not None else False
+                self.loss_model = GilbertElliott(self.rng, p['ge_p'], p['ge_r'], p['ge_loss_good'], p['ge_loss_bad'])
+                self.loss_model.bad = bad
+        else:
+            self.loss_model = None
+        if p['rate_kbps'] > 0:
+            if self.bucket is None or any(old[k] != p[k] for k in ('rate_kbps', 'burst_bytes', 'queue_ms')):
+                self.bucket = TokenBucket(p['rate_kbps'] * 125.0, p['burst_bytes'], p['queue_ms'] / 1000)
+        else:
+            self.bucket = None
+
+    def schedule(self, size, now):
+        # 返回报文的发送时刻列表
+        p = self.params
+        self.packets += 1
+        self.bytes += size
+        if self.loss_model is not None:
+            lost = self.loss_model.lost()
+        else:
+            lost = p['loss'] > 0 and self.rng.random() < p['loss']
+        if lost:
+            self.lost += 1
+            return []
+        departure = now
+        if self.bucket is not None:
+            wait = self.bucket.admit(size, now)
+            if wait is None:
+                self.queue_drops += 1
+                return []
+            departure += wait
+        departure += (p['delay_ms'] + p['jitter_ms'] * self.rng.random()) / 1000
+        if p['keep_order']:
+            departure = max(departure, self.last_departure)
+        if departure < self.last_departure:
+            self.reordered += 1# 抖动使其早于前一个报文
+        self.last_departure = max(self.last_departure, departure)
+        if p['reorder'] > 0 and self.rng.random() < p['reorder']:
+            departure += p['reorder_ms'] / 1000# 不计入 last_departure，后续报文不必等它
+            self.reordered += 1
+        times = [departure]
+        if p['duplicate'] > 0 and self.rng.random() < p['duplicate']:
+            self.duplicated += 1
+            times.append(departure + (p['jitter_ms'] * self.rng.random()) / 1000)
+        self.delivered += len(times)
+        return times
+
+    def stats(self):
+        return {
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'delivered': self.delivered,
+            'lost': self.lost,
+            'queue_drops': self.queue_drops,
+            'duplicated': self.duplicated,
+            'reordered': self.reordered,
+        }
+
+
+class NetEmulator:
+    def __init__(self, server_address, listen_address=('127.0.0.1', 0), profile=None, seed=None):
+        # 参数：
+        # - server_address: 被测服务器地址 (ip, port)
+        # - listen_address: 代理的监听地址，客户端连接到这里；端口为 0 时由系统分配
+        # - profile: 场景名、JSON 文件路径或字典，见 PROFILES
+        # - seed: 随机种子，默认取场景中的 seed（没有则为 1）；两个方向分别使用 seed*2 和 seed*2+1
+        spec = load_profile(profile)
+        self.server_address = server_address
+        self.seed = seed if seed is not None else spec.get('seed', 1)
+        self.links = {
+            UP: Impairment(self.seed * 2, direction_params(spec, UP)),
+            DOWN: Impairment(self.seed * 2 + 1, direction_params(spec, DOWN)),
+        }
+        self.phases = sorted(spec.get('phases', []), key=lambda phase: phase['at'])
+        for phase in self.phases:
+            direction_params(phase, UP)# 提前检查参数名
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(listen_address)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)# 代理自身不应成为丢包来源
+        except OSError:
+            pass
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
+        self.upstreams = {}  # 客户端地址 -> 上游套接字
+        self.last_seen = {}  # 上游套接字 -> 最近一次收发报文的时刻
+        self.queue = []  # 待发送报文的最小堆：(发送时刻, 序号, 套接字, 数据, 目的地址)
+        self.count = 0
+        self.buffer = bytearray(MAX_DATAGRAM)
+        self.started = None
+        self.running = False
+        self.thread = None
+        # 用于唤醒事件循环的自连接套接字，stop 时写入
+        self.waker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.waker.bind(('127.0.0.1', 0))
+        self.waker.setblocking(False)
+        self.selector.register(self.waker, selectors.EVENT_READ, False)
+
+    def start(self):
+        # 在后台线程中运行，返回监听地址
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        # 停止后台线程并关闭所有套接字
+        self.running = False
+        self.waker.sendto(b'', self.waker.getsockname())
+        if self.thread is not None:
+            self.thread.join()
+        self.close()
+
+    def run(self):
+        # 事件循环：接收两个方向的报文，按损伤模型排入发送队列，到时发送
+        self.running = True
+        self.started = time.monotonic()
+        next_phase = 0
+        next_sweep = self.started + UPSTREAM_IDLE
+        while self.running:
+            now = time.monotonic()
+            while next_phase < len(self.phases) and now - self.started >= self.phases[next_phase]['at']:
+                phase = self.phases[next_phase]
+                for direction, link in self.links.items():
+                    link.update(direction_params(phase, direction))
+                next_phase += 1
+            timeout = None
+            if self.queue:
+                timeout = max(0.0, self.queue[0][0] - now)
+            if next_phase < len(self.phases):
+                phase_due = self.started + self.phases[next_phase]['at'] - now
+                timeout = phase_due if timeout is None else min(timeout, phase_due)
+            timeout = min(timeout, 1.0) if timeout is not None else 1.0
+            for key, _ in self.selector.select(timeout):
+                if key.data is False:
+                    self._drain(key.fileobj)
+                else:
+                    self._receive(key.fileobj, key.data)
+            self._transmit(time.monotonic())
+            if now >= next_sweep:
+                self._sweep(now)
+                next_sweep = now + UPSTREAM_IDLE
+
+    def _receive(self, sock, client_address):
+        # 读取一个套接字上所有已到达的报文
+        # client_address 为 None 表示监听套接字（上行），否则是该上游套接字对应的客户端（下行）
+        while True:
+            try:
+                n, address = sock.recvfrom_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionResetError:
+                continue
+            now = time.monotonic()
+            data = bytes(self.buffer[:n])
+            if client_address is None:
+                upstream = self._upstream(address)
+                self.last_seen[upstream] = now
+                self._enqueue(self.links[UP], upstream, data, self.server_address, now)
+            else:
+                self.last_seen[sock] = now
+                self._enqueue(self.links[DOWN], self.sock, data, client_address, now)
+
+    def _drain(self, sock):
+        # 清空唤醒套接字
+        while True:
+            try:
+                sock.recv(1)
+            except (BlockingIOError, InterruptedError):
+                return
+
+    def _upstream(self, client_address):
+        # 取得（必要时创建）某个客户端对应的上游套接字
+        upstream = self.upstreams.get(client_address)
+        if upstream is None:
+            upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            upstream.bind((self.address[0], 0))
+            upstream.setblocking(False)
+            self.selector.register(upstream, selectors.EVENT_READ, client_address)
+            self.upstreams[client_address] = upstream
+        return upstream
+
+    def _enqueue(self, link, sock, data, address, now):
+        for departure in link.schedule(len(data), now):
+            self.count += 1
+            heapq.heappush(self.queue, (departure, self.count, sock, data, address))
+
+    def _transmit(self, now):
+        # 发送所有到期的报文
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            _, _, sock, data, address = heapq.heappop(queue)
+            try:
+                sock.sendto(data, address)
+            except OSError:
+                pass  # 发送缓冲区满或上游已关闭，相当于网络丢包
+
+    def _sweep(self, now):
+        # 关闭长时间空闲的上游套接字
+        for client_address, upstream in list(self.upstreams.items()):
+            if now - self.last_seen.get(upstream, now) > UPSTREAM_IDLE:
+                self.selector.unregister(upstream)
+                upstream.close()
+                del self.upstreams[client_address]
+                self.last_seen.pop(upstream, None)
+
+    def stats(self):
+        # 返回两个方向的统计信息
+        return {direction: link.stats() for direction, link in self.links.items()}
+
+    def close(self):
+        for upstream in self.upstreams.values():
+            upstream.close()
+        self.upstreams.clear()
+        self.selector.close()
+        self.sock.close()
+        self.waker.close()
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP 网络损伤模拟代理")
+    parser.add_argument('--server', required=True, help="被测服务器地址，如 127.0.0.1:8000")
+    parser.add_argument('--listen', default='127.0.0.1:0', help="代理监听地址，客户端连接到这里")
+    parser.add_argument('--profile', default='clean',
+                        help=f"损伤场景：{', '.join(PROFILES)}，或 JSON 文件路径")
+    parser.add_argument('--seed', type=int, help="随机种子，默认取场景中的 seed（没有则为 1）")
+    parser.add_argument('--set', action='append', default=[], metavar='[up.|down.]参数=值',
+                        help=f"覆盖场景参数，可重复；参数: {', '.join(DEFAULTS)}")
+    args = parser.parse_args()
+
+    try:
+        spec = json.loads(json.dumps(load_profile(args.profile)))# 复制一份，避免修改预置场景
+        for direction, params in parse_overrides(args.set).items():
+            spec.setdefault(direction, {}).update(params)
+        emulator = NetEmulator(parse_address(args.server), parse_address(args.listen), spec, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"网络损伤代理已启动: {emulator.address[0]}:{emulator.address[1]} -> "
+          f"{args.server}，场景: {args.profile}，种子: {emulator.seed}")
+    for direction, link in emulator.links.items():
+        changed = {k: v for k, v in link.params.items() if v != DEFAULTS[k]}
+        print(f"  {direction}: {changed or '无损伤'}")
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        print("\n程序被用户中断")
+    finally:
+        for direction, s in emulator.stats().items():
+            print(f"{direction}: 收到 {s['packets']} 个报文（{s['bytes']} 字节），送出 {s['delivered']} 个，"
+                  f"丢包 {s['lost']}，队列丢弃 {s['queue_drops']}，复制 {s['duplicated']}，乱序 {s['reordered']}")
+        emulator.close()
+
+
+if __name__ == "__main__":
+    main()
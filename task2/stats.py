@@ -0,0 +1,135 @@
+import math
+from collections import deque
+
+# 流式统计：每个样本 O(1) 更新、内存有界，替代把全部样本存进列表再用 pandas 计算
+# - RunningStats：Welford 算法在线计算均值和方差，同时记录最小/最大值
+# - LogHistogram：HDR 风格的对数-线性直方图，用于 p50/p99/p999 等分位数，相对误差约 1/2^(bits-1)
+# - LatencyStats：以上两者的组合，用于 RTT
+# - IntervalMeter：按固定时间间隔统计有效吞吐量和重传率
+
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # 与均值之差的平方和
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def variance(self):
+        # 样本方差（除以 n-1，与 pandas 的 std 相同），样本少于 2 个时为 nan
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+
+class LogHistogram:
+    # 数值先按 unit 换算为非负整数，小于 2^bits 的值各占一个桶（精确），
+    # 更大的值按二进制数量级分组，每组 2^(bits-1) 个等宽桶，桶宽与数值的比例不超过 1/2^(bits-1)
+    # 桶数组按需增长，例如 bits=8 时覆盖到 1 小时（以微秒计）也只需约 3300 个桶
+    def __init__(self, unit=1e-3, bits=8):
+        # 参数：
+        # - unit: 最小分辨率，例如以毫秒记录、unit=1e-3 表示精确到微秒
+        # - bits: 精度位数，越大误差越小、桶越多
+        self.unit = unit
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.counts = []
+        self.count = 0
+
+    def _index(self, v):
+        if v < 2 * self.half:
+            return v
+        shift = v.bit_length() - self.bits
+        return self.half * shift + (v >> shift)
+
+    def _lower(self, index):
+        # 桶 index 覆盖的最小整数值
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        return (index - self.half * shift) << shift
+
+    def add(self, x):
+        index = self._index(max(int(x / self.unit), 0))
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+
+    def percentile(self, q):
+        # 第 q 百分位数（最近秩法），返回所在桶的中点；没有样本时为 nan
+        if not self.count:
+            return math.nan
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                low = self._lower(index)
+                high = self._lower(index + 1)
+                return (low + high - 1) / 2 * self.unit
+        return math.nan
+
+
+class LatencyStats(RunningStats):
+    def __init__(self, unit=1e-3, bits=8):
+        super().__init__()
+        self.histogram = LogHistogram(unit, bits)
+
+    def add(self, x):
+        super().add(x)
+        self.histogram.add(x)
+
+    def percentile(self, q):
+        return self.histogram.percentile(q)
+
+
+class IntervalMeter:
+    # 每隔 interval 秒结算一次：该间隔内新确认的字节数（有效吞吐量）和重传占发送的比例
+    # 只保留最近 history 个间隔，每次 on_send/on_ack 为 O(1)，tick 在间隔结束时才做结算
+    def __init__(self, interval=1.0, history=3600):
+        self.interval = interval
+        self.samples = deque(maxlen=history)  # (间隔结束时刻, 有效吞吐量 B/s, 重传率)
+        self.goodput = RunningStats()  # 所有已结算间隔的吞吐量统计（不受 history 限制）
+        self.retransmit_rate = RunningStats()
+        self.start = None
+        self.sent = 0
+        self.retransmitted = 0
+        self.acked_bytes = 0
+
+    def on_send(self, is_retransmit):
+        self.sent += 1
+        if is_retransmit:
+            self.retransmitted += 1
+
+    def on_ack(self, nbytes):
+        self.acked_bytes += nbytes
+
+    def tick(self, now, final=False):
+        # 到达间隔边界时结算；final 为 True 时结算不足一个间隔的剩余部分
+        if self.start is None:
+            self.start = now
+            return
+        elapsed = now - self.start
+        if elapsed < self.interval and not (final and elapsed > 0 and self.sent):
+            return
+        goodput = self.acked_bytes / elapsed
+        rate = self.retransmitted / self.sent if self.sent else 0.0
+        self.samples.append((now, goodput, rate))
+        self.goodput.add(goodput)
+        self.retransmit_rate.add(rate)
+        self.start = now
+        self.sent = self.retransmitted = self.acked_bytes = 0
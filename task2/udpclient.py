@@ -1,222 +1,926 @@
+import argparse
+import json
+import logging
+import sys
 import socket
 import time
 import struct
+import random
+import os
+import hashlib
+import threading
+import zlib
 
-import pandas as pd
+from codec import (HEADER, TIMESTAMP, TIMESTAMP_OFFSET, FLAG_FEC, FLAG_ZLIB, make_flags, encode, encode_into, decode,
+                   now_us, elapsed_us)
+from dgramio import DatagramIO
+from fec import ParityEncoder, LENGTH as FEC_LENGTH, MAX_K as FEC_MAX_K
+from stats import LatencyStats, IntervalMeter
+from metrics import setup_logging
+
+CONN_ID = struct.Struct('!I')  #SYN数据部分携带的4字节连接ID
+FILE_INFO = struct.Struct('!IIQ')  #文件传输模式的SYN数据：连接ID + 每包数据长度 + 文件大小，后接UTF-8文件名
+FAST_INFO = struct.Struct('!II')  #合成数据模式快速打开的SYN数据：连接ID + 数据包总数
+MAX_PAYLOAD = 65507 - HEADER.size  #UDP数据报最大65507字节，减去首部
+DEFAULT_PAYLOAD = 80  #合成数据模式每包80字节
+FILE_PAYLOAD = 1400  #文件传输模式默认每包数据长度，不超过以太网MTU
+COMPRESS_MIN = 64  #数据短于该长度的包不压缩（zlib 头尾约11字节，短包很难变小）
+
+RTO_MIN = 0.05  #重传超时下限（秒），取几个定时轮tick，避免本机RTT很小时过早重传
+RTO_MAX = 10.0  #重传超时上限（秒），指数退避不超过该值
+DUP_ACK_THRESHOLD = 3  #连续收到3个重复累计确认时快速重传
+HANDSHAKE_RETRIES = 8  #SYN最多重传次数，超过后放弃连接（抛出ConnectionError）
+CLOSE_RETRIES = 8  #挥手时FIN最多重传次数，超过后不再等待服务器的FIN
+TIME_WAIT = 2.0  #发送最终ACK后在后台保持套接字的时间（秒），覆盖服务器的一次FIN重传（其间隔不超过1秒）
+
+#日志：连接事件为INFO，逐包发送/确认为DEBUG；作为模块导入且未调用 setup_logging 时只输出警告
+log = logging.getLogger('udpclient')
+
+
+class TimerWheel:
+    #定时轮：按tick把定时器分到环形槽中，设置定时器O(1)，推进时只检查到期的槽
+    #取消定时器采用惰性方式：到期时由调用者判断该定时器是否仍然有效
+    def __init__(self, tick=0.01, slots=256):
+        #参数：
+        # -tick: 每个槽代表的时间长度（秒），也是定时器的精度
+        # -slots: 槽的数量，超过一圈的定时器留在槽中等待后续轮次
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = int(time.monotonic() / tick)#下一个待检查的tick序号
+
+    def schedule(self, key, deadline):
+        #设置定时器，deadline为time.monotonic()时刻
+        t = max(int(deadline / self.tick), self.current)
+        self.slots[t % len(self.slots)].append((deadline, key))
+
+    def expire(self, now):
+        #推进到now，返回所有已到期的(deadline, key)
+        expired = []
+        target = int(now / self.tick)
+        while self.current < target:
+            index = self.current % len(self.slots)
+            bucket = self.slots[index]
+            if bucket:
+                keep = [entry for entry in bucket if entry[0] > now]#后续轮次的定时器
+                if len(keep) != len(bucket):
+                    expired.extend(entry for entry in bucket if entry[0] <= now)
+                    self.slots[index] = keep
+            self.current += 1
+        return expired
+
+
+class FixedWindow:
+    #固定窗口：拥塞窗口始终等于最大窗口，不做拥塞控制（原有行为）
+    name = 'fixed'
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.cwnd = float(max_window)
+        self.ssthresh = float(max_window)
+
+    def on_ack(self, acked, rtt):
+        pass
+
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+class RenoController(FixedWindow):
+    #Reno风格拥塞控制：慢启动 + 加性增/乘性减（AIMD）
+    #- 慢启动：每确认一个包窗口加1，每个RTT翻倍，直到达到慢启动阈值
+    #- 拥塞避免：每确认一个包窗口加1/cwnd，每个RTT约加1
+    #- 重复确认（快速重传）：阈值和窗口减半；超时：阈值减半，窗口回到1
+    name = 'reno'
+
+    def __init__(self, max_window):
+        #参数：
+        # -max_window: 窗口上限（环形缓冲区大小）
+        self.max_window = max_window
+        self.cwnd = 1.0
+        self.ssthresh = float(max_window)
+
+    def on_ack(self, acked, rtt):
+        #参数：
+        # -acked: 本次确认新确认的数据包个数
+        # -rtt: 有效的RTT样本（秒），按Karn规则无效时为None
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_loss(self):
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = 1.0
+
+
+class DelayController(RenoController):
+    #基于时延的拥塞控制（Vegas风格）：比较期望速率 cwnd/最小RTT 与实际速率 cwnd/RTT，
+    #估算排队中的包数 diff = cwnd * (1 - 最小RTT/RTT)，
+    #diff < alpha 时加性增，diff > beta 时加性减，在队列堆积之前就停止增长；丢包时按Reno处理
+    name = 'delay'
+    alpha = 2.0
+    beta = 4.0
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.base_rtt = None#观测到的最小RTT，近似传播时延
+
+    def on_ack(self, acked, rtt):
+        if rtt is None:
+            return
+        if self.base_rtt is None or rtt < self.base_rtt:
+            self.base_rtt = rtt
+        diff = self.cwnd * (1 - self.base_rtt / rtt) if rtt > 0 else 0.0
+        if self.cwnd < self.ssthresh and diff < 1:
+            self.cwnd += acked#慢启动，队列开始堆积时提前退出
+        elif diff < self.alpha:
+            self.cwnd += acked / self.cwnd
+        elif diff > self.beta:
+            self.cwnd = max(self.cwnd - acked / self.cwnd, 2.0)
+            self.ssthresh = min(self.ssthresh, self.cwnd)
+        self.cwnd = min(self.cwnd, self.max_window)
+
+
+CONGESTION_CONTROLLERS = {cls.name: cls for cls in (FixedWindow, RenoController, DelayController)}
 
 
 class UDPClient:
     #初始化UDP客户端
-    def __init__(self):
+    def __init__(self, buffer_size=64, total_packets=30, selective_repeat=False, congestion='reno', gso=False,
+                 file_path=None, payload_size=None, server_address=None, fec=0, compress=0, fast_open=False,
+                 time_wait=TIME_WAIT):
+        #参数：
+        # -buffer_size: 最大滑动窗口大小，最多存储多少个未确认数据包；实际窗口由拥塞控制决定
+        # -total_packets: 总共要发送的数据包数量
+        # -selective_repeat: 是否请求选择重传（SR）模式，需服务器在握手中同意
+        # -congestion: 拥塞控制算法，CONGESTION_CONTROLLERS 中的名称（fixed/reno/delay）
+        # -gso: 是否用UDP GSO把一个窗口的数据包合并为一次发送（仅Linux）
+        # -file_path: 要发送的文件路径，None 时发送合成数据
+        # -payload_size: 每个数据包的数据长度（字节），默认合成数据80，文件传输1400，最大MAX_PAYLOAD
+        # -server_address: 服务器地址 (ip, port)，也可以在 run 时给出
+        # -fec: 前向纠错分组大小K，每K个数据包附加一个XOR校验包，0为不使用；需服务器在握手中同意
+        # -compress: zlib压缩级别（1-9），0为不压缩；需服务器在握手中同意
+        #  每个包单独压缩（丢包和乱序时接收方仍能独立解压），压缩后不变小的包按原样发送
+        # -fast_open: 快速打开：SYN与第一批数据包一起发出，不等待握手；服务器收齐数据后在确认中捎带FIN，
+        #  省去握手和挥手的各一个RTT；服务器必须支持快速打开并同意请求的各项选项
+        # -time_wait: 发送最终ACK后在后台线程中保持套接字的秒数，期间重发的FIN再次确认；0为立即关闭
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) #创建UDP套接字
-        self.client_socket.settimeout(0.3)  #设置300ms超时，用于检测数据包是否丢失
+        self.timeout = 0.3  #300ms超时，用于握手/挥手，也是数据传输的初始RTO
+        self.client_socket.settimeout(self.timeout)
         self.base = 1 #滑动窗口的基序号，表示最早未确认的数据包
         self.next_seq = 1#下一个要发送的数据包序号
-        self.buffer_size = 5#滑动窗口大小，最多存储 5 个未确认数据包
-        self.window = {} #字典，存储已发送但未确认的数据包（键：序号，值：发送时间和数据）
-        self.rtt_data = [] #列表，存储每次确认的往返时延（RTT）
-        self.total_packets = 30  #总共要发送的数据包数量
+        self.buffer_size = buffer_size#最大滑动窗口大小
+        self.congestion = congestion#拥塞控制算法名称
+        self.file_path = file_path#文件传输模式下要发送的文件
+        self.payload_size = payload_size or (FILE_PAYLOAD if file_path else DEFAULT_PAYLOAD)#每包数据长度
+        self.file = None#打开的文件，按序号顺序读取
+        self.file_size = 0
+        self.digest = None#文件的SHA-256，首次发送时按序计算，随FIN发送给服务器
+        self.transfer_time = 0.0#数据传输阶段用时（秒）
+        self._init_window()
+        self.rtt_stats = LatencyStats()#往返时延（RTT，毫秒）的流式统计：均值/方差/分位数，不保存样本
+        self.meter = IntervalMeter()#每秒的有效吞吐量和重传率
+        self.total_packets = total_packets  #总共要发送的数据包数量
         self.total_attempts = 0   #总发送尝试次数（包括重传）
-        self.server_address = None #服务器地址（IP 和端口）
+        self.server_address = server_address #服务器地址（IP 和端口）
+        self.stopping = False#stop() 置位后传输循环提前结束
+        self.digest_ok = None#文件校验结果：True/False，未校验为None
+        self.selective_repeat = selective_repeat#请求的重传模式
+        self.selective = False#握手后实际使用的模式：True为SR，False为GBN
+        self.conn_id = random.getrandbits(32)#连接ID，服务器据此区分同一地址上的新旧会话
+        self.gso = gso
+        self.io = None#数据传输阶段的批量数据报I/O
+        self.fec_k = fec#请求的FEC分组大小
+        self.fec = 0#握手后实际使用的FEC分组大小，0为不使用
+        self.fec_encoder = None
+        self.parity_sent = 0#发送的校验包个数
+        self.fec_recovered = 0#服务器确认由校验包恢复的数据包个数
+        self.compress_level = compress#请求的压缩级别
+        self.compress = 0#握手后实际使用的压缩级别，0为不压缩
+        self.compressed_packets = 0#压缩后发送的数据包和校验包个数
+        self.logical_bytes = 0#首次发送的数据包和校验包压缩前的数据字节数
+        self.wire_bytes = 0#同上，实际发送的数据字节数
+        self.fast_open = fast_open
+        self.syn_packet = None#快速打开时的SYN包，收到服务器的任何回复之前随超时重传
+        self.syn_pending = False#快速打开时是否还没有收到服务器的回复
+        self.syn_retries = 0
+        self.peer_fin = None#服务器捎带在确认中的FIN：(seq, 数据)
+        self.time_wait = time_wait
+        self.time_wait_thread = None#TIME_WAIT后台线程，未进入TIME_WAIT时为None
+        self.session_time = 0.0#从开始握手到挥手完成的用时（秒，不含TIME_WAIT）
+        #RFC 6298 重传超时估计
+        self.srtt = None#平滑RTT（秒）
+        self.rttvar = None#RTT偏差（秒）
+        self.rto = self.timeout#由RTT估计得到的重传超时（秒）
+        self.backoff = 1#超时退避倍数，累计确认前移时恢复为1
+        self.rtt_sample = None#本次确认得到的有效RTT样本，供拥塞控制使用
+        #丢包检测
+        self.dup_acks = 0#连续重复累计确认的个数
+        self.recover = 0#本轮丢包恢复结束的序号，恢复期间不重复减小窗口
+        self.timeouts = 0#超时事件次数
+        self.fast_retransmits = 0#快速重传次数
+        self.cwnd_sum = 0.0#每次确认时的窗口之和，用于计算平均窗口
+        self.cwnd_samples = 0
+        self.cwnd_max = 0.0
+
+    def _init_window(self):
+        #按buffer_size分配环形窗口：序号seq的数据包存放在第seq % buffer_size个槽中，
+        #窗口前移时只需修改base，不需要逐个删除
+        self.packets = [bytearray(HEADER.size + self.payload_size) for _ in range(self.buffer_size)]#预分配的数据包缓冲区
+        self.packet_views = [memoryview(packet) for packet in self.packets]
+        self.lengths = [0] * self.buffer_size#每个槽中数据包的实际长度（最后一个包可能较短）
+        self.send_times = [0.0] * self.buffer_size#每个槽最近一次发送的时刻
+        self.send_stamps = [0] * self.buffer_size#每个槽最近一次发送时写入报文的微秒时间戳
+        self.deadlines = [0.0] * self.buffer_size#每个槽当前有效的超时时刻
+        self.acked = [False] * self.buffer_size#SR模式下每个槽是否已被单独确认
+        self.retransmitted = [False] * self.buffer_size#每个槽是否重传过（Karn规则：不用于RTT估计）
+        self.timers = TimerWheel()#每个数据包一个重传定时器
+        self.cc = CONGESTION_CONTROLLERS[self.congestion](self.buffer_size)#拥塞控制器
 
     def start(self):
-        #主方法，控制客户端的运行流程
+        #交互式运行：输入配置，完成传输并打印统计信息
         #获取用户输入的服务器IP和端口
         server_ip = input("请输入服务器IP地址: ")
         server_port = int(input("请输入服务器端口号: "))
         self.server_address = (server_ip, server_port)#设置服务器地址
+        buffer_text = input(f"请输入最大滑动窗口大小（直接回车为{self.buffer_size}）: ").strip()
+        if buffer_text:
+            self.buffer_size = int(buffer_text)
+        file_text = input("请输入要发送的文件路径（直接回车为发送合成数据）: ").strip()
+        if file_text:
+            self.file_path = file_text
+            payload_text = input(f"请输入每个数据包的数据长度（最大{MAX_PAYLOAD}字节，直接回车为{FILE_PAYLOAD}）: ").strip()
+            self.payload_size = int(payload_text) if payload_text else FILE_PAYLOAD
+        else:
+            total_text = input(f"请输入要发送的数据包总数（直接回车为{self.total_packets}）: ").strip()
+            if total_text:
+                self.total_packets = int(total_text)
+        mode_text = input("是否使用选择重传（SR）模式？(y/N): ").strip().lower()
+        if mode_text:
+            self.selective_repeat = mode_text == 'y'
+        fec_text = input(f"每多少个数据包附加一个FEC校验包（1-{FEC_MAX_K}，直接回车为不使用）: ").strip()
+        if fec_text:
+            self.fec_k = int(fec_text)
+        compress_text = input("请输入zlib压缩级别（1-9，直接回车为不压缩）: ").strip()
+        if compress_text:
+            self.compress_level = int(compress_text)
+        fast_text = input("是否使用快速打开（数据随SYN发出，最后的确认捎带FIN）？(y/N): ").strip().lower()
+        if fast_text:
+            self.fast_open = fast_text == 'y'
+        names = '/'.join(CONGESTION_CONTROLLERS)
+        cc_text = input(f"请选择拥塞控制算法（{names}，直接回车为{self.congestion}）: ").strip().lower()
+        if cc_text in CONGESTION_CONTROLLERS:
+            self.congestion = cc_text
+        gso_text = input("是否启用UDP GSO合并发送（仅Linux）？(y/N): ").strip().lower()
+        if gso_text:
+            self.gso = gso_text == 'y'
+        setup_logging('udpclient', 'debug')#交互模式逐包输出
+        try:
+            self.run()
+        except KeyboardInterrupt:
+            print("\n程序被用户中断")
+        except (ValueError, OSError) as e:
+            print(error_message(e))
+            return
+        self._print_summary() # 打印传输统计信息
+        if self.time_wait_thread is not None:
+            self.time_wait_thread.join()#进程退出前完成TIME_WAIT
+
+    def stop(self):
+        #请求结束传输（可从其他线程调用）：传输循环在下一轮退出，之后照常挥手
+        self.stopping = True
+
+    def run(self, server_address=None):
+        #非交互式运行：按构造参数完成握手、传输和挥手，返回统计结果（见 results）
+        #Ctrl+C 或 stop() 会提前结束传输，但仍然关闭连接
+        if server_address is not None:
+            self.server_address = server_address
+        if not 0 <= self.fec_k <= FEC_MAX_K:
+            raise ValueError(f"FEC分组大小必须在0到{FEC_MAX_K}之间")
+        if not 0 <= self.compress_level <= 9:
+            raise ValueError("压缩级别必须在0到9之间")
+        if self.file_path:
+            self._open_file()
+        self._init_window()
 
-        #模拟TCP三次握手，建立连接
-        self._establish_connection()
+        #建立连接：普通模式下模拟TCP三次握手；快速打开时SYN在传输循环的第一轮与数据包一起发出
+        #没有数据要发送时快速打开没有意义（SYN无从捎带），改用普通握手
+        session_start = time.perf_counter()
+        self.fast_open = self.fast_open and self.total_packets > 0
+        if not self.fast_open:
+            try:
+                self._establish_connection()
+            except ConnectionError:
+                self.client_socket.close()
+                raise
+        start_time = time.perf_counter()
+        self.meter.tick(time.monotonic())
 
-        #数据传输循环
+        #数据传输循环：套接字改为非阻塞，等待时间为定时轮的tick，以便及时处理到期的定时器
+        #发送的数据包先排队，每轮统一发送；收到确认时一次取完所有已到达的确认
+        self.io = DatagramIO(self.client_socket, gso=self.gso)
+        if self.fast_open:
+            self._open_fast()
         try:
-            while self.base <= self.total_packets:#直到所有数据包被确认
-                # 发送窗口内的数据包（最多 5 个）
-                while self.next_seq < self.base + self.buffer_size and self.next_seq <= self.total_packets:
+            while self.base <= self.total_packets and not self.stopping:#直到所有数据包被确认
+                # 发送窗口内的数据包：窗口为拥塞窗口（不超过环形缓冲区大小）
+                window = min(self.buffer_size, max(int(self.cc.cwnd), 1))
+                while self.next_seq < self.base + window and self.next_seq <= self.total_packets:
                     self._send_packet(self.next_seq)#发送新数据包
                     self.next_seq += 1#增加下一个发送序号
+                self.io.flush()
 
                 #等待服务器的确认包
-                try:
-                    data, addr = self.client_socket.recvfrom(1024)#接收数据包（最大 1024 字节）
-                    #提取头部信息
-                    ack_packet = self._parse_packet(data)#解析确认包
-                    if ack_packet['ack'] >= self.base:#如果确认序号 >= 窗口基序号
-                        seq_acknowledged = ack_packet['ack']#获取确认的序号
-                        if seq_acknowledged in self.window:
-                            #计算RTT（单位：毫秒）
-                            send_time = self.window[seq_acknowledged]['send_time']
-                            rtt = (time.time() - send_time) * 1000  # 转换为毫秒
-                            self.rtt_data.append(rtt)
-
-                            #打印确认信息
-                            start_byte = (seq_acknowledged - 1) * 80 + 1 #数据起始字节
-                            end_byte = seq_acknowledged * 80#数据结束字节
-                            print(
-                                f"第{seq_acknowledged}个（第{start_byte}-{end_byte}字节），server端已经收到，RTT是 {rtt:.2f} ms")
-
-                            #移除已确认的数据包
-                            for seq in list(self.window.keys()):
-                                if seq <= seq_acknowledged:# 删除所有 <= 确认序号的包（GBN 累计确认）
-                                    del self.window[seq]
-
-                            #滑动窗口，更新基序号
-                            self.base = seq_acknowledged + 1
-                except socket.timeout:
-                    #超时处理：重传窗口内最早未确认的数据包
-                    seq_to_retransmit = self.base
-                    if seq_to_retransmit in self.window:
-                        self._send_packet(seq_to_retransmit, is_retransmit=True)
+                if self.io.wait(self.timers.tick):
+                    for data, addr in self.io.drain():
+                        self._handle_ack(decode(data))#解析并处理确认包
+
+                #超时处理：重传定时器已到期且仍未确认的数据包
+                for deadline, seq in self.timers.expire(time.monotonic()):
+                    slot = seq % self.buffer_size
+                    if self.base <= seq < self.next_seq and self.deadlines[slot] == deadline and not self.acked[slot]:
+                        #窗口最早的包超时或新一轮丢包：视为一次超时事件，RTO指数退避并减小窗口
+                        if seq == self.base or seq > self.recover:
+                            self._on_timeout()
+                        self._send_packet(seq, is_retransmit=True)
+                self.io.flush()#在下一轮复用窗口槽之前发出本轮的重传
+                self.meter.tick(time.monotonic())
 
-        except KeyboardInterrupt:
-            print("\n程序被用户中断")
         finally:
             # 无论如何都执行连接关闭和统计
-            self._close_connection() # 模拟 TCP 四次挥手
-            self._print_summary() # 打印传输统计信息
-            self.client_socket.close()# 关闭套接字
+            self.transfer_time = time.perf_counter() - start_time
+            self.meter.tick(time.monotonic(), final=True)
+            self.io.close()
+            if self.file is not None:
+                self.file.close()
+                #全部数据已按序读完时才有完整的校验值
+                self.digest = self.digest.digest() if self.next_seq > self.total_packets else None
+            self.client_socket.settimeout(self.timeout)#恢复为阻塞并带超时，用于四次挥手
+            self._close_connection() # 模拟 TCP 四次挥手，套接字在其中关闭或交给TIME_WAIT线程
+            self.session_time = time.perf_counter() - session_start
+        return self.results()
+
+    def _open_file(self):
+        #文件传输模式：打开文件，按文件大小和每包数据长度计算数据包总数
+        limit = MAX_PAYLOAD - FEC_LENGTH.size if self.fec_k else MAX_PAYLOAD#校验包比数据包多2字节
+        if not 0 < self.payload_size <= limit:
+            raise ValueError(f"每包数据长度必须在1到{limit}之间")
+        self.file = open(self.file_path, 'rb')
+        self.file_size = os.fstat(self.file.fileno()).st_size
+        self.total_packets = (self.file_size + self.payload_size - 1) // self.payload_size
+        self.digest = hashlib.sha256()
+        #大数据包时增大发送缓冲区，避免一个窗口的突发被内核丢弃
+        try:
+            self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 << 20)
+        except OSError:
+            pass
+
+    def _byte_range(self, seq):
+        #返回序号seq的数据包对应的（起始字节，结束字节），从1开始计数
+        start_byte = (seq - 1) * self.payload_size + 1
+        end_byte = seq * self.payload_size
+        if self.file is not None:
+            end_byte = min(end_byte, self.file_size)
+        return start_byte, end_byte
+
+    def _handle_ack(self, ack_packet):
+        # 处理确认包
+        # 快速打开：syn 标志的报文为SYN+ACK，fin 标志的确认表示服务器已收齐数据（数据为服务器的校验值）
+        # GBN：ack 为累计确认序号
+        # SR：ack 仍为累计确认序号，seq 为触发该确认的数据包序号（逐包确认），
+        #     数据部分为 SACK 位图，第 i 位表示序号 ack+2+i 已收到，用于弥补丢失的确认包
+        # 时间戳字段回送触发该确认的数据包的时间戳
+        # FEC：置 fec 标志的确认表示服务器刚由校验包恢复了序号为 seq 的数据包，该包实际没有到达，不计算RTT
+        if ack_packet.syn:
+            if self.fast_open:
+                self._on_syn_ack(ack_packet)
+            return#普通模式下迟到的SYN+ACK重传，忽略
+        self.syn_pending = False
+        if ack_packet.fin:
+            self.peer_fin = ack_packet.seq, bytes(ack_packet.data)
+        seq_acknowledged = ack_packet.ack#获取累计确认的序号
+        newly_acked = 0#本次新确认的数据包个数
+        self.rtt_sample = None
+        if ack_packet.fec:
+            self.fec_recovered += 1
+        if self.selective and ack_packet.sack:
+            if ack_packet.fec:
+                newly_acked += self._mark_acked(ack_packet.seq, sample_rtt=False)
+            else:
+                newly_acked += self._mark_acked(ack_packet.seq, echo=ack_packet.timestamp)
+            for i, byte in enumerate(ack_packet.data):
+                while byte:
+                    bit = byte & -byte#取最低位的 1
+                    newly_acked += self._mark_acked(seq_acknowledged + 2 + i * 8 + bit.bit_length() - 1, sample_rtt=False)
+                    byte ^= bit
+        elif self.base <= seq_acknowledged < self.next_seq:#确认了窗口内已发送的数据包
+            self._mark_acked(seq_acknowledged, echo=ack_packet.timestamp)
+
+        if self.base <= seq_acknowledged < self.next_seq:
+            #累计确认覆盖的、尚未单独确认的包也计入新确认
+            if self.selective:
+                newly_acked += sum(1 for seq in range(self.base, seq_acknowledged + 1)
+                                   if not self.acked[seq % self.buffer_size])
+            else:
+                newly_acked += seq_acknowledged + 1 - self.base
+            #滑动窗口（累计确认）：<= 确认序号的槽全部释放，O(1)
+            self.base = seq_acknowledged + 1
+            self.dup_acks = 0
+            self.backoff = 1#有新数据被确认，取消退避（否则Karn规则下可能长时间没有有效样本）
+        elif seq_acknowledged == self.base - 1 and self.base < self.next_seq:
+            #重复的累计确认：base 之后的包已到达而 base 仍缺失，连续3次时快速重传 base
+            self.dup_acks += 1
+            if self.dup_acks == DUP_ACK_THRESHOLD and self.base > self.recover:
+                self.recover = self.next_seq - 1
+                self.fast_retransmits += 1
+                self.cc.on_loss()
+                self._send_packet(self.base, is_retransmit=True)
+
+        if newly_acked:
+            self.meter.on_ack(newly_acked * self.payload_size)
+            self.cc.on_ack(newly_acked, self.rtt_sample)
+            self.cwnd_sum += self.cc.cwnd
+            self.cwnd_samples += 1
+            self.cwnd_max = max(self.cwnd_max, self.cc.cwnd)
+
+    def _on_timeout(self):
+        # 超时事件：RTO 加倍（RFC 6298 5.5），通知拥塞控制，并开始新一轮丢包恢复
+        # 快速打开时还没有收到服务器的回复则SYN可能丢失，先于重传的数据包重发SYN；
+        # 此时RTO不加倍，与普通握手一样按固定间隔重传，最多 HANDSHAKE_RETRIES 次
+        self.timeouts += 1
+        if self.syn_pending:
+            self.syn_retries += 1
+            if self.syn_retries > HANDSHAKE_RETRIES:
+                raise ConnectionError(f"连接失败：重传SYN {HANDSHAKE_RETRIES} 次仍未收到服务器的回复")
+            self.io.send(self.syn_packet, self.server_address)
+        else:
+            self.backoff = min(self.backoff * 2, int(RTO_MAX / RTO_MIN))
+        self.recover = self.next_seq - 1
+        self.dup_acks = 0
+        self.cc.on_timeout()
+
+    def _update_rto(self, rtt):
+        # 按 RFC 6298 用新的 RTT 样本（秒）更新 SRTT、RTTVAR 和 RTO
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        # 时钟粒度 G 取定时轮的tick
+        self.rto = min(max(self.srtt + max(self.timers.tick, 4 * self.rttvar), RTO_MIN), RTO_MAX)
+
+    def _mark_acked(self, seq, sample_rtt=True, echo=None):
+        # 记录一个数据包已被确认，并计算 RTT、打印确认信息
+        # 参数：
+        # -seq: 被确认的数据包序号
+        # -sample_rtt: 是否用该确认计算 RTT（由位图推断的确认不计算）
+        # -echo: 确认包回送的时间戳
+        # 返回：是否为新确认的包（1 或 0）
+        slot = seq % self.buffer_size
+        if not (self.base <= seq < self.next_seq) or self.acked[slot]:
+            return 0
+        if self.selective:
+            self.acked[slot] = True#SR模式下已确认的包不再重传
+        if not sample_rtt:
+            return 1
+        #计算RTT（单位：毫秒）
+        #回送的时间戳等于该包最近一次发送的时间戳时，确认一定由这次发送触发，直接用时间戳计算
+        if echo == self.send_stamps[slot]:
+            rtt = elapsed_us(echo) / 1000
+            ambiguous = False
+        else:
+            #旧服务器不回送时间戳：按Karn规则，确认可能对应任一次发送的包不用于RTO估计
+            #GBN的累计确认覆盖 base..seq，其中任一包重传过都不能确定该确认由哪次发送触发
+            rtt = (time.monotonic() - self.send_times[slot]) * 1000  # 转换为毫秒
+            if self.selective:
+                ambiguous = self.retransmitted[slot]
+            else:
+                ambiguous = any(self.retransmitted[s % self.buffer_size] for s in range(self.base, seq + 1))
+        self.rtt_stats.add(rtt)
+
+        if not ambiguous:
+            self.rtt_sample = rtt / 1000
+            self._update_rto(self.rtt_sample)
+
+        #打印确认信息
+        if log.isEnabledFor(logging.DEBUG):
+            start_byte, end_byte = self._byte_range(seq)#数据起始、结束字节
+            log.debug("第%d个（第%d-%d字节），server端已经收到，RTT是 %.2f ms", seq, start_byte, end_byte, rtt)
+        return 1
+
+    def _syn_packet(self):
+        # 构造 SYN 包（序列号=0，syn=1，数据为连接ID），请求SR模式时同时置 sack 标志，
+        # 请求FEC时置 fec 标志，ack 字段为分组大小K；请求压缩时置 zlib 标志，快速打开时置 fast 标志
+        # 文件传输模式下数据还包括每包数据长度、文件大小和文件名；合成数据模式快速打开时数据为连接ID和数据包总数
+        if self.file is not None:
+            syn_data = (FILE_INFO.pack(self.conn_id, self.payload_size, self.file_size)
+                        + os.path.basename(self.file_path).encode('utf-8'))
+        elif self.fast_open:
+            syn_data = FAST_INFO.pack(self.conn_id, self.total_packets)
+        else:
+            syn_data = CONN_ID.pack(self.conn_id)
+        return encode(0, self.fec_k, make_flags(syn=1, sack=int(self.selective_repeat), fec=int(self.fec_k > 0),
+                                                zlib=int(self.compress_level > 0), fast=int(self.fast_open)),
+                      data=syn_data)
 
     def _establish_connection(self):
         # 模拟 TCP 三次握手，建立可靠连接
-        # 1. 发送 SYN 包（序列号=0，syn=1）
-        syn_packet = self._create_packet(seq=0, ack=0, syn=1, fin=0, data=b'')
+        # 1. 发送 SYN 包（见 _syn_packet）
+        syn_packet = self._syn_packet()
         self.client_socket.sendto(syn_packet, self.server_address)
 
-        # 2. 等待服务器的 SYN+ACK 包
+        # 2. 等待服务器的 SYN+ACK 包，超时重传SYN，最多重传 HANDSHAKE_RETRIES 次
+        retries = 0
         while True:
             try:
                 data, addr = self.client_socket.recvfrom(1024)
-                packet = self._parse_packet(data)
-                if packet['syn'] and packet['ack']:# 检查是否为 SYN+ACK 包
+                packet = decode(data)
+                if packet.syn and packet.ack:# 检查是否为 SYN+ACK 包
+                    # 服务器在 SYN+ACK 中回送 sack 标志表示同意使用SR模式，旧服务器不会回送
+                    self.selective = self.selective_repeat and bool(packet.sack)
+                    # 同理，回送 fec 标志表示同意使用FEC，回送 zlib 标志表示同意压缩
+                    self.fec = self.fec_k if packet.fec else 0
+                    self.compress = self.compress_level if packet.zlib else 0
                     break
             except socket.timeout:
                 # 超时重传SYN
+                retries += 1
+                if retries > HANDSHAKE_RETRIES:
+                    raise ConnectionError(f"连接失败：重传SYN {HANDSHAKE_RETRIES} 次仍未收到SYN+ACK")
                 self.client_socket.sendto(syn_packet, self.server_address)
 
         # 3. 发送 ACK 包（序列号=1，确认号=1）
-        ack_packet = self._create_packet(seq=1, ack=1, syn=0, fin=0, data=b'')
+        ack_packet = encode(1, 1, 0)
         self.client_socket.sendto(ack_packet, self.server_address)
-        print("连接已建立")
+        self.fec_encoder = ParityEncoder(self.fec) if self.fec else None
+        log.info(f"连接已建立，重传模式: {'SR' if self.selective else 'GBN'}，"
+                 f"FEC: {f'每{self.fec}个数据包1个校验包' if self.fec else '关闭'}，"
+                 f"压缩: {f'zlib 级别{self.compress}' if self.compress else '关闭'}")
+
+    def _open_fast(self):
+        # 快速打开：SYN 排在第一批数据包之前，由传输循环的第一轮一起发出，不等待SYN+ACK
+        # 服务器收到SYN即进入ESTABLISHED，因此直接按请求的选项（SR、FEC、压缩）发送，SYN+ACK只用于核对；
+        # 收到服务器的任何报文之前，每次超时事件重发一次SYN（见 _on_timeout）
+        self.syn_packet = self._syn_packet()
+        self.syn_pending = True
+        self.io.send(self.syn_packet, self.server_address)
+        self.selective = self.selective_repeat
+        self.fec = self.fec_k
+        self.compress = self.compress_level
+        self.fec_encoder = ParityEncoder(self.fec) if self.fec else None
+        log.info(f"快速打开，重传模式: {'SR' if self.selective else 'GBN'}，"
+                 f"FEC: {f'每{self.fec}个数据包1个校验包' if self.fec else '关闭'}，"
+                 f"压缩: {f'zlib 级别{self.compress}' if self.compress else '关闭'}")
+
+    def _on_syn_ack(self, packet):
+        # 快速打开时收到 SYN+ACK：服务器回送的标志应与已经在使用的选项一致，否则已发出的数据无法被正确处理
+        self.syn_pending = False
+        if not (packet.fast and packet.sack == int(self.selective) and packet.fec == int(self.fec > 0)
+                and packet.zlib == int(self.compress > 0)):
+            raise ConnectionError("服务器不支持快速打开或不同意请求的选项，请改用普通握手")
 
     def _close_connection(self):
-        # 模拟TCP四次挥手，关闭连接
-        # 1. 发送FIN包（序列号=total_packets+1，fin=1）
-        fin_packet = self._create_packet(seq=self.total_packets + 1, ack=0, syn=0, fin=1, data=b'')
-        self.client_socket.sendto(fin_packet, self.server_address)
+        # 关闭连接：快速打开且服务器已在最后的确认中捎带FIN时直接发送最终ACK，否则模拟TCP四次挥手
+        # 1. 发送FIN包（序列号=total_packets+1，fin=1），文件传输模式下数据为文件的SHA-256
+        # 2. 等待服务器的FIN包（服务器同时发送ACK和FIN），超时重传FIN，最多重传 CLOSE_RETRIES 次
+        # 3. 发送最终ACK包，之后进入TIME_WAIT（见 _time_wait）
+        # 返回时套接字已关闭，或交给TIME_WAIT线程在到期后关闭
+        if self.syn_pending:
+            log.warning("没有收到服务器的任何回复，连接未建立")
+            self.client_socket.close()
+            return
+        fin = self.peer_fin
+        if fin is None:
+            fin_packet = encode(self.total_packets + 1, 0, make_flags(fin=1), data=self.digest or b'')
+            self.client_socket.sendto(fin_packet, self.server_address)
+            retries = 0
+            while fin is None:
+                try:
+                    data, addr = self.client_socket.recvfrom(1024)
+                except socket.timeout:
+                    retries += 1
+                    if retries > CLOSE_RETRIES:
+                        log.warning(f"重传FIN {CLOSE_RETRIES} 次仍未收到服务器的FIN，放弃挥手")
+                        self.client_socket.close()
+                        return
+                    self.client_socket.sendto(fin_packet, self.server_address)# 超时重传 FIN 包
+                    continue
+                if len(data) >= HEADER.size:
+                    packet = decode(data)
+                    if packet.fin:# 检查是否为 FIN 包（之前的ACK和数据阶段迟到的确认直接忽略）
+                        fin = packet.seq, bytes(packet.data)
+        self._check_digest(fin[1])
 
-        # 2. 等待服务器的ACK包
-        while True:
-            try:
-                data, addr = self.client_socket.recvfrom(1024)
-                packet = self._parse_packet(data)
-                if packet['ack']: # 检查是否为ACK包
-                    break
-            except socket.timeout:
-                # 超时重传 FIN 包
-                self.client_socket.sendto(fin_packet, self.server_address)
+        # 发送最终 ACK 包
+        ack_packet = encode(self.total_packets + 2, fin[0] + 1, 0)
+        self.client_socket.sendto(ack_packet, self.server_address)
+        log.info("连接已关闭")
+        if self.time_wait > 0:
+            self.time_wait_thread = threading.Thread(target=self._time_wait, args=(ack_packet,), daemon=True)
+            self.time_wait_thread.start()
+        else:
+            self.client_socket.close()
 
-        # 3. 等待服务器的 FIN 包
-        while True:
-            try:
-                data, addr = self.client_socket.recvfrom(1024)
-                packet = self._parse_packet(data)
-                if packet['fin']:# 检查是否为 FIN 包
+    def _time_wait(self, ack_packet):
+        # TIME_WAIT（后台线程）：最终ACK丢失时服务器会重传FIN，期间收到FIN就重发最终ACK，
+        # 保持 time_wait 秒后关闭套接字；run 不等待它结束，命令行运行时在退出前等待
+        deadline = time.monotonic() + self.time_wait
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
                     break
-            except socket.timeout:
-                pass# 忽略超时，继续等待
+                self.client_socket.settimeout(remaining)
+                try:
+                    data, addr = self.client_socket.recvfrom(1024)
+                except socket.timeout:
+                    break
+                if len(data) >= HEADER.size and decode(data).fin:
+                    self.client_socket.sendto(ack_packet, self.server_address)
+        except OSError:
+            pass
+        finally:
+            self.client_socket.close()
 
-        # 4. 发送最终 ACK 包
-        ack_packet = self._create_packet(seq=self.total_packets + 2, ack=packet['seq'] + 1, syn=0, fin=0, data=b'')
-        self.client_socket.sendto(ack_packet, self.server_address)
-        print("连接已关闭")
+    def _check_digest(self, server_digest):
+        # 比较服务器在 FIN 中返回的、按实际写入的数据计算的 SHA-256，验证端到端正确性
+        if self.file is None:
+            return
+        if not self.digest:
+            log.warning("传输未完成，不做校验")
+        elif not server_digest:
+            log.warning("服务器未返回校验值，无法验证")
+        elif server_digest == self.digest:
+            self.digest_ok = True
+            log.info(f"文件校验通过，SHA-256: {self.digest.hex()}")
+        else:
+            self.digest_ok = False
+            log.warning(f"文件校验失败！本地 {self.digest.hex()}，服务器 {server_digest.hex()}")
 
     def _send_packet(self, seq_num, is_retransmit=False):
         # 发送数据包并记录发送时间
         # 参数：
         # -seq_num: 数据包序列号
         # -is_retransmit: 是否为重传包
-        start_byte = (seq_num - 1) * 80 + 1#计算数据起始字节
-        end_byte = seq_num * 80 #计算数据结束字节
-        data = f"Data from byte {start_byte} to {end_byte}".ljust(80, 'X').encode()# 生成 80 字节数据
-        packet = self._create_packet(seq=seq_num, ack=0, syn=0, fin=0, data=data) #创建数据包
-
-        #记录发送时间和数据
-        self.window[seq_num] = {
-            'send_time': time.time(),
-            'data': data
-        }
+        start_byte, end_byte = self._byte_range(seq_num)#计算数据起始、结束字节
+        slot = seq_num % self.buffer_size
+        packet = self.packets[slot]#该序号对应的预分配缓冲区
+        stamp = now_us()#微秒时间戳，服务器在确认中回送
+        parity = None#本组的FEC校验数据，首次发送组内最后一个数据包时生成
+        if is_retransmit:
+            #重传时数据不变，只更新时间戳
+            TIMESTAMP.pack_into(packet, TIMESTAMP_OFFSET, stamp)
+            self.retransmitted[slot] = True
+        else:
+            if self.file is not None:
+                #文件数据直接读入缓冲区；首次发送按序号递增，因此顺序读取文件并增量计算校验值
+                HEADER.pack_into(packet, 0, seq_num, 0, 0, stamp)
+                payload = self.packet_views[slot][HEADER.size:HEADER.size + end_byte - start_byte + 1]
+                self.file.readinto(payload)
+                self.digest.update(payload)
+                self.lengths[slot] = HEADER.size + len(payload)
+            else:
+                #首次发送：直接在缓冲区中填写首部和合成数据
+                payload = f"Data from byte {start_byte} to {end_byte}".ljust(self.payload_size, 'X').encode()[:self.payload_size]
+                self.lengths[slot] = encode_into(packet, seq_num, 0, 0, stamp, payload)
+            if self.fec_encoder is not None:
+                parity = self.fec_encoder.add(payload, last=seq_num == self.total_packets)#校验覆盖压缩前的数据
+            if self.compress:
+                self._compress_slot(slot, seq_num, stamp, payload)
+            self.acked[slot] = False
+            self.retransmitted[slot] = False
+
+        #记录发送时间并设置重传定时器
+        now = time.monotonic()
+        self.send_times[slot] = now
+        self.send_stamps[slot] = stamp
+        self.deadlines[slot] = now + min(self.rto * self.backoff, RTO_MAX)
+        self.timers.schedule(seq_num, self.deadlines[slot])
 
-        #发送数据包
-        self.client_socket.sendto(packet, self.server_address)
+        #发送数据包（排队，由传输循环批量发出）
+        self.io.send(self.packet_views[slot][:self.lengths[slot]], self.server_address)
         self.total_attempts += 1#增加发送尝试计数
+        self.meter.on_send(is_retransmit)
+        if parity is not None:
+            self._send_parity(seq_num, *parity)#本组最后一个数据包之后紧接着发送校验包
 
         #打印发送信息
         if is_retransmit:
-            print(f"重传第{seq_num}个（第{start_byte}-{end_byte}字节）数据包")
+            log.debug("重传第%d个（第%d-%d字节）数据包", seq_num, start_byte, end_byte)
         else:
-            print(f"已发送第{seq_num}个（第{start_byte}-{end_byte}字节）数据包")
+            log.debug("已发送第%d个（第%d-%d字节）数据包", seq_num, start_byte, end_byte)
 
-    def _create_packet(self, seq, ack, syn, fin, data):
-        #创建自定义协议数据包
-        #参数：
-        # -seq: 序列号（4字节）
-        # -ack: 确认号（4字节）
-        # -syn: 同步标志（1位）
-        # -fin: 结束标志（1位）
-        # -data: 数据部分
-        #首部格式：4字节seq+4字节ack+1字节flags+4字节timestamp
-        flags = (syn << 1) | fin #组合标志位：syn占第1位，fin占第0位
-        #获取当前时间戳（整数，4 字节）
-        timestamp = int(time.time())
-        #使用大端序打包首部
-        header = struct.pack('!IIBI', seq, ack, flags, timestamp)
-        #拼接首部和数据
-        return header + data
-
-    def _parse_packet(self, packet_data):
-        #解析接收到的数据包
-        #参数：
-        #-packet_data: 接收到的字节数据
-        #返回：包含seq、ack、syn、fin、timestamp的字典
-        header = packet_data[:13] # 提取前 13 字节作为首部
-        #2. 按大端序(!)解包首部：4字节seq+4字节ack+1字节flags+4字节timestamp
-        seq, ack, flags, timestamp = struct.unpack('!IIBI', header) #大端序解包
-        syn = (flags & 0x02) >> 1#提取syn标志（第1位）
-        fin = flags & 0x01#提取fin标志（第0位）
+    def _compress(self, data):
+        # 按协商的级别压缩一个包的数据，并累计压缩前后的字节数
+        # 返回：压缩后更短时为压缩数据，否则为None（按原样发送）
+        compressed = None
+        if len(data) >= COMPRESS_MIN:
+            compressed = zlib.compress(data, self.compress)
+            if len(compressed) >= len(data):
+                compressed = None
+        self.logical_bytes += len(data)
+        self.wire_bytes += len(data) if compressed is None else len(compressed)
+        if compressed is not None:
+            self.compressed_packets += 1
+        return compressed
+
+    def _compress_slot(self, slot, seq_num, stamp, payload):
+        # 首次发送：槽中的数据压缩后更短时就地改写为压缩数据并置 zlib 标志，重传直接复用槽中的报文
+        compressed = self._compress(payload)
+        if compressed is None:
+            return
+        HEADER.pack_into(self.packets[slot], 0, seq_num, 0, FLAG_ZLIB, stamp)
+        self.packet_views[slot][HEADER.size:HEADER.size + len(compressed)] = compressed
+        self.lengths[slot] = HEADER.size + len(compressed)
+
+    def _send_parity(self, last_seq, count, parity):
+        # 发送一个FEC校验包：seq 为组内第一个序号，ack 为组内数据包个数；校验包不占序号、不重传
+        # 协商了压缩时校验数据同样单独压缩，服务器解压后再参与恢复
+        first_seq = last_seq - count + 1
+        flags = FLAG_FEC
+        if self.compress:
+            compressed = self._compress(parity)
+            if compressed is not None:
+                parity = compressed
+                flags |= FLAG_ZLIB
+        buf = self.io.reserve(HEADER.size + len(parity))
+        encode_into(buf, first_seq, count, flags, now_us(), parity)
+        self.io.send(buf, self.server_address)
+        self.parity_sent += 1
+        log.debug("已发送第%d-%d个数据包的校验包", first_seq, last_seq)
+
+    def _acked_bytes(self):
+        #已被确认的字节数
+        nbytes = (self.base - 1) * self.payload_size
+        return min(nbytes, self.file_size) if self.file is not None else nbytes
+
+    def results(self):
+        #返回传输统计结果字典，供脚本和基准测试使用
+        rtt = self.rtt_stats
+        nbytes = self._acked_bytes()
+        sampled = rtt.count > 0
         return {
-            'seq': seq,#序列号
-            'ack': ack,#确认号
-            'syn': syn,#同步标志
-            'fin': fin,#结束标志
-            'timestamp': timestamp#时间戳
+            'mode': 'SR' if self.selective else 'GBN',
+            'congestion': self.cc.name,
+            'window': self.buffer_size,
+            'payload_size': self.payload_size,
+            'packets': self.total_packets,
+            'acked_packets': self.base - 1,
+            'attempts': self.total_attempts,
+            'retransmits': self.total_attempts - (self.next_seq - 1),
+            'timeouts': self.timeouts,
+            'fast_retransmits': self.fast_retransmits,
+            'fec': {'k': self.fec, 'parity_sent': self.parity_sent, 'recovered': self.fec_recovered},
+            'compression': {'level': self.compress, 'packets': self.compressed_packets,
+                            'logical_bytes': self.logical_bytes, 'wire_bytes': self.wire_bytes},
+            'bytes': nbytes,
+            'elapsed_s': self.transfer_time,
+            'mb_per_s': nbytes / self.transfer_time / 1e6 if self.transfer_time > 0 else 0.0,
+            'rtt_ms': {
+                'count': rtt.count,
+                'mean': rtt.mean if sampled else None,
+                'std': rtt.std() if rtt.count > 1 else None,
+                'min': rtt.min if sampled else None,
+                'max': rtt.max if sampled else None,
+                'p50': rtt.percentile(50) if sampled else None,
+                'p99': rtt.percentile(99) if sampled else None,
+                'p999': rtt.percentile(99.9) if sampled else None,
+            },
+            'srtt_ms': self.srtt * 1000 if self.srtt is not None else None,
+            'rto_ms': self.rto * 1000,
+            'cwnd_mean': self.cwnd_sum / self.cwnd_samples if self.cwnd_samples else None,
+            'digest_ok': self.digest_ok,
+            'fast_open': self.fast_open,
+            'session_s': self.session_time,
+            'io': self.io.stats() if self.io is not None else None,
         }
 
     def _print_summary(self):
         # 打印传输统计信息
-        if not self.rtt_data:
+        rtt = self.rtt_stats
+        if not rtt.count:
             print("没有收到任何确认，无法计算统计信息")
             return
 
         #计算丢包率
         packet_loss_rate = (self.total_attempts - self.total_packets) / self.total_attempts * 100
 
-        #使用pandas计算RTT统计量
-        rtt_series = pd.Series(self.rtt_data)
-        max_rtt = rtt_series.max()#最大RTT
-        min_rtt = rtt_series.min()#最小RTT
-        avg_rtt = rtt_series.mean()#平均RTT
-        std_rtt = rtt_series.std()#RTT标准差
-
         #打印汇总信息
         print("\n【汇总】")
         print(f"- 丢包率：{packet_loss_rate:.2f}%")
-        print(f"- 最大RTT：{max_rtt:.2f} ms")
-        print(f"- 最小RTT：{min_rtt:.2f} ms")
-        print(f"- 平均RTT：{avg_rtt:.2f} ms")
-        print(f"- RTT的标准差：{std_rtt:.2f} ms")
+        print(f"- 最大RTT：{rtt.max:.2f} ms")
+        print(f"- 最小RTT：{rtt.min:.2f} ms")
+        print(f"- 平均RTT：{rtt.mean:.2f} ms")
+        print(f"- RTT的标准差：{rtt.std():.2f} ms")
+        print(f"- RTT分位数：p50 {rtt.percentile(50):.2f} ms，p99 {rtt.percentile(99):.2f} ms，"
+              f"p999 {rtt.percentile(99.9):.2f} ms（{rtt.count} 个样本）")
+        if self.srtt is not None:
+            print(f"- SRTT：{self.srtt * 1000:.2f} ms，RTTVAR：{self.rttvar * 1000:.2f} ms，最终RTO：{self.rto * 1000:.2f} ms")
+        print(f"- 拥塞控制：{self.cc.name}，最大窗口 {self.buffer_size}")
+        if self.cwnd_samples:
+            print(f"- 拥塞窗口：平均 {self.cwnd_sum / self.cwnd_samples:.2f}，最大 {self.cwnd_max:.2f}，"
+                  f"最终 {self.cc.cwnd:.2f}，慢启动阈值 {self.cc.ssthresh:.2f}")
+        print(f"- 超时事件：{self.timeouts} 次，快速重传：{self.fast_retransmits} 次")
+        if self.fec:
+            print(f"- FEC：每 {self.fec} 个数据包 1 个校验包，发送校验包 {self.parity_sent} 个，"
+                  f"由校验包恢复 {self.fec_recovered} 个数据包，重传 {self.total_attempts - (self.next_seq - 1)} 个")
+        if self.compress and self.wire_bytes:
+            print(f"- 压缩：zlib 级别 {self.compress}，{self.compressed_packets} 个包压缩后发送，"
+                  f"数据 {self.logical_bytes} -> {self.wire_bytes} 字节（压缩比 {self.logical_bytes / self.wire_bytes:.2f}）")
+        if self.transfer_time > 0:
+            nbytes = self._acked_bytes()
+            print(f"- 传输 {nbytes} 字节（每包 {self.payload_size} 字节），用时 {self.transfer_time:.3f} s，"
+                  f"有效吞吐量 {nbytes / self.transfer_time / 1e6:.2f} MB/s")
+        if self.session_time > 0:
+            print(f"- 会话用时（含握手和挥手）：{self.session_time * 1000:.2f} ms，快速打开：{'开启' if self.fast_open else '关闭'}")
+        meter = self.meter
+        if meter.goodput.count:
+            print(f"- 每 {meter.interval:g} s 吞吐量：最小 {meter.goodput.min / 1e6:.2f}，平均 {meter.goodput.mean / 1e6:.2f}，"
+                  f"最大 {meter.goodput.max / 1e6:.2f} MB/s；重传率：平均 {meter.retransmit_rate.mean * 100:.1f}%，"
+                  f"最大 {meter.retransmit_rate.max * 100:.1f}%")
+            if len(meter.samples) <= 20:
+                print("  " + "，".join(f"{goodput / 1e6:.2f} MB/s（重传 {rate * 100:.0f}%）"
+                                       for _, goodput, rate in meter.samples))
+        if self.io is not None:
+            stats = self.io.stats()
+            print(f"- 发送 {stats['sent']} 个数据报用了 {stats['send_calls']} 次系统调用，"
+                  f"收到 {stats['received']} 个确认用了 {stats['recv_calls']} 次系统调用"
+                  f"（GSO: {'开启' if self.io.gso else '关闭'}）")
+
+
+def parse_args(argv):
+    #解析命令行参数；--config 指定的 JSON 文件提供默认值（键为选项名），命令行参数优先
+    parser = argparse.ArgumentParser(description="UDP 可靠传输客户端（不带参数运行时交互式输入配置）")
+    parser.add_argument('--config', help="JSON 配置文件，例如 {\"port\": 12345, \"window\": 64}")
+    parser.add_argument('--host', default='127.0.0.1', help="服务器地址")
+    parser.add_argument('--port', type=int, default=12345, help="服务器端口")
+    parser.add_argument('--window', type=int, default=64, help="最大滑动窗口大小")
+    parser.add_argument('--packets', type=int, default=30, help="合成数据模式下发送的数据包总数")
+    parser.add_argument('--file', help="要发送的文件，不指定则发送合成数据")
+    parser.add_argument('--payload-size', type=int,
+                        help=f"每包数据长度（最大{MAX_PAYLOAD}），默认合成数据{DEFAULT_PAYLOAD}、文件{FILE_PAYLOAD}")
+    parser.add_argument('--sr', action='store_true', help="请求选择重传（SR）模式")
+    parser.add_argument('--congestion', choices=list(CONGESTION_CONTROLLERS), default='reno', help="拥塞控制算法")
+    parser.add_argument('--gso', action='store_true', help="启用UDP GSO合并发送（仅Linux）")
+    parser.add_argument('--fec', type=int, default=0, metavar='K', help=f"每K个数据包附加一个XOR校验包（1-{FEC_MAX_K}），0为不使用")
+    parser.add_argument('--compress', type=int, default=0, metavar='LEVEL', help="逐包zlib压缩，级别1-9，0为不压缩")
+    parser.add_argument('--fast-open', action='store_true', help="快速打开：数据随SYN发出，服务器收齐后在确认中捎带FIN")
+    parser.add_argument('--time-wait', type=float, default=TIME_WAIT, help="发送最终ACK后的TIME_WAIT秒数，0为立即关闭")
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'], default='info',
+                        help="日志级别，debug 输出逐包日志")
+    parser.add_argument('--log-sample', type=int, default=1, help="debug 日志每 N 条输出 1 条")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出统计结果，不打印汇总")
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            parser.set_defaults(**{k.replace('-', '_'): v for k, v in json.load(f).items()})
+        args = parser.parse_args(argv)
+    return args
+
+
+def error_message(e):
+    #run() 失败时打印的一行说明：参数错误、连接失败（握手或快速打开重传次数用完）、文件或套接字错误
+    if isinstance(e, ValueError):
+        return f"输入错误: {e}"
+    if isinstance(e, ConnectionError) and e.errno is None:
+        return str(e)#客户端自己抛出的连接失败，消息本身已说明原因
+    return f"文件或网络错误: {e}"
+
+
+def main(argv=None):
+    #带命令行参数时按参数（和配置文件）运行，否则交互式输入配置
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        UDPClient().start()
+        return
+    args = parse_args(argv)
+    setup_logging('udpclient', args.log_level, args.log_sample)
+    client = UDPClient(args.window, args.packets, args.sr, args.congestion, args.gso, args.file, args.payload_size,
+                       (args.host, args.port), args.fec, args.compress, args.fast_open, args.time_wait)
+    try:
+        result = client.run()
+    except KeyboardInterrupt:
+        print("\n程序被用户中断")
+        result = client.results()
+    except (ValueError, OSError) as e:
+        print(error_message(e))
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        client._print_summary()
+    if client.time_wait_thread is not None:
+        client.time_wait_thread.join()#进程退出前完成TIME_WAIT
 
 
 if __name__ == "__main__":
-    client = UDPClient()
-    client.start()
\ No newline at end of file
+    main()
@@ -2,181 +2,770 @@ import socket
 import time
 import struct
 import random
+import heapq
+import os
+import hashlib
+import logging
+import threading
+import argparse
+import json
+import re
+import sys
+import zlib
+
+from codec import HEADER, FLAG_SACK, FLAG_FEC, make_flags, encode, encode_into, decode
+from dgramio import DatagramIO
+from fec import ParityDecoder, LENGTH as FEC_LENGTH, MAX_K as FEC_MAX_K
+from metrics import Registry, MetricsServer, setup_logging
+
+SACK_MAX_BYTES = 64  #SACK位图最多64字节，即覆盖累计确认之后的512个序号
+CONN_ID = struct.Struct('!I')  #SYN/SYN+ACK数据部分携带的4字节连接ID
+FILE_INFO = struct.Struct('!IIQ')  #文件传输模式的SYN数据：连接ID + 每包数据长度 + 文件大小，后接UTF-8文件名
+FAST_INFO = struct.Struct('!II')  #合成数据模式快速打开的SYN数据：连接ID + 数据包总数
+MAX_DATAGRAM = 65536  #接收缓冲区大小，能容纳任意UDP数据报
+MAX_PAYLOAD = 65507 - HEADER.size  #每包数据长度上限，与客户端相同（UDP数据报最大65507字节，减去首部）
+MAX_FILE_SIZE = 1 << 40  #文件传输模式接受的最大文件大小（字节），超过则拒绝SYN
+MAX_SEQ = 0xFFFFFFFF - 2  #数据包序号上限：FIN的序号为最后一个序号加1，客户端最终ACK的序号再加1，均需在32位以内
+RECV_WINDOW = 1 << 16  #接收窗口：序号不小于 expected_seq+RECV_WINDOW 的数据包和校验包直接丢弃（远大于客户端的实际窗口），
+                       #合成数据模式没有文件大小限制序号，否则任意序号都会进入重排序缓冲区
+MAX_NAME = 128  #保存的文件名最多字符数
+UNSAFE_NAME = re.compile(r'[^\w.\-]')  #文件名中需要替换为下划线的字符（只保留字母、数字、下划线、点和连字符）
+DEFAULT_PAYLOAD = 80  #合成数据模式每包80字节
+CONTROL_RTO = 1.0  #SYN+ACK和FIN的重传间隔上限（秒），也是没有RTT估计时的间隔
+CONTROL_RTO_MIN = 0.05  #SYN+ACK和FIN的重传间隔下限（秒）
+CONTROL_RTT_FACTOR = 4  #有握手RTT估计时，首次重传间隔为RTT的该倍数，之后每次加倍（不超过CONTROL_RTO）
+CONTROL_RETRIES = 5  #SYN+ACK和FIN最多重传次数，超过后放弃该连接，因此挥手最多等待 CONTROL_RETRIES+1 个间隔
+IDLE_TIMEOUT = 60.0  #已建立的连接超过该时间没有收到任何报文则回收（秒）
+
+#连接状态
+SYN_RCVD = 'SYN_RCVD'#已收到SYN并回复SYN+ACK，等待客户端的ACK
+ESTABLISHED = 'ESTABLISHED'#连接已建立，接收数据
+LAST_ACK = 'LAST_ACK'#已收到FIN并回复ACK和FIN，等待客户端的最终ACK
+
+#日志：连接事件为INFO，逐包接收和模拟丢包为DEBUG（可采样或关闭）
+log = logging.getLogger('udpserver')
+
+
+def _pwrite(f, data, offset):
+    #在指定偏移写入，不移动文件位置；没有 os.pwrite 的平台（Windows）用 seek + write
+    if hasattr(os, 'pwrite'):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def _pread(f, length, offset):
+    #从指定偏移读取 length 字节
+    if hasattr(os, 'pread'):
+        return os.pread(f.fileno(), length, offset)
+    f.seek(offset)
+    return f.read(length)
+
+
+def safe_name(raw):
+    #把客户端给出的文件名清理为只含安全字符的文件名：去掉目录部分，替换其他字符，限制长度，不以点开头
+    name = os.path.basename(raw.decode('utf-8', 'replace').replace('\\', '/'))
+    name = UNSAFE_NAME.sub('_', name)[:MAX_NAME].lstrip('.')
+    return name or 'upload.bin'
+
+
+class FileSink:
+    #文件传输模式的接收端：数据包一到达就按偏移 (seq-1)*payload_size 写入输出文件，
+    #乱序数据不在内存中缓存；按序交付时增量计算 SHA-256，乱序包交付时从文件（页缓存）读回
+    def __init__(self, path, file_size, payload_size):
+        #参数：
+        # -path: 输出文件路径
+        # -file_size: 文件大小（字节）
+        # -payload_size: 每个数据包的数据长度（字节），最后一个包可能较短
+        self.path = path
+        self.file_size = file_size
+        self.payload_size = payload_size
+        self.total_packets = (file_size + payload_size - 1) // payload_size
+        self.file = open(path, 'w+b')
+        try:
+            self.file.truncate(file_size)#预先设定文件大小
+        except (OSError, ValueError, OverflowError):
+            #磁盘空间不足等原因无法预分配：删除已创建的文件，由调用者放弃该连接
+            self.file.close()
+            os.remove(path)
+            raise
+        self.digest = hashlib.sha256()
+
+    def length(self, seq):
+        #序号seq的数据包应有的数据长度
+        return min(self.payload_size, self.file_size - (seq - 1) * self.payload_size)
+
+    def write(self, seq, data):
+        #写入一个数据包，序号或长度不合法时返回False
+        if not 1 <= seq <= self.total_packets or len(data) != self.length(seq):
+            return False
+        _pwrite(self.file, data, (seq - 1) * self.payload_size)
+        return True
+
+    def deliver(self, seq, data=None):
+        #按序交付序号seq的数据包，更新校验值；data为None时从文件读回
+        if data is None:
+            data = _pread(self.file, self.length(seq), (seq - 1) * self.payload_size)
+        self.digest.update(data)
+
+    def close(self):
+        self.file.close()
+
+
+class Connection:
+    #一条连接（一个客户端会话）的状态：握手/挥手状态机和各自的重排序缓冲区
+    __slots__ = ('address', 'conn_id', 'state', 'selective', 'expected_seq', 'buffer',
+                 'control_packets', 'retries', 'deadline', 'last_active', 'ack_owed', 'ack_seq', 'ack_timestamp',
+                 'payload_size', 'sink', 'opened', 'fec', 'compress', 'final_seq', 'rtt')
+
+    def __init__(self, address, conn_id, selective, payload_size=DEFAULT_PAYLOAD, sink=None, fec=None, compress=False):
+        #参数：
+        # -address: 客户端地址（IP和端口）
+        # -conn_id: 客户端在SYN中给出的连接ID，旧客户端不携带时为0
+        # -selective: 是否使用选择重传（SR）模式
+        # -payload_size: 每个数据包的数据长度（字节）
+        # -sink: 文件传输模式的输出文件（FileSink），合成数据模式为None
+        # -fec: 协商了前向纠错时为该连接的 ParityDecoder，否则为None
+        # -compress: 是否同意了压缩（数据包和校验包的数据部分可能经 zlib 压缩）
+        self.address = address
+        self.conn_id = conn_id
+        self.state = SYN_RCVD
+        self.selective = selective
+        self.payload_size = payload_size
+        self.sink = sink
+        self.fec = fec
+        self.compress = compress
+        self.opened = time.monotonic()#收到SYN的时刻，用于统计连接持续时间
+        self.expected_seq = 1  #期望接收的下一个序列号
+        self.buffer = set()  #已接收但尚未按序交付的数据包序号
+        self.control_packets = []#当前状态下需要超时重传的控制报文（SYN+ACK或ACK+FIN）
+        self.retries = 0#控制报文已重传次数
+        self.deadline = 0.0#下一次定时器到期时刻
+        self.last_active = time.monotonic()#最近一次收到报文的时刻
+        self.ack_owed = 0#已按序收到但尚未确认的数据包个数（延迟确认）
+        self.ack_seq = 0#待发送确认的 seq 字段
+        self.ack_timestamp = 0#待发送确认回送的时间戳（触发该确认的数据包的时间戳）
+        self.final_seq = None#快速打开时为最后一个数据包的序号，全部交付后服务器在确认中捎带FIN；否则为None
+        self.rtt = None#由握手估计的RTT（秒），用于控制报文的重传间隔
 
 
 class UDPServer:
-    def __init__(self):
+    def __init__(self, host='127.0.0.1', port=0, loss_rate=0.2, seed=None, ack_every=2, gso=False,
+                 output_dir='received', metrics_port=None):
         #初始化 UDP 服务器
+        #参数：
+        # -host, port: 监听地址，端口为0时由系统分配（见 bind/start 的返回值）
+        # -loss_rate: 模拟丢包率，经 netem.py 代理测试时可设为0
+        # -seed: 模拟丢包的随机种子，None 为不固定
+        # -ack_every: 每按序收到多少个数据包至少确认一次
+        # -gso: 是否用UDP GSO合并发送（仅Linux）
+        # -output_dir: 文件传输模式下接收文件的保存目录
+        # -metrics_port: 监控指标HTTP端口，None 为不启用，0 为自动分配
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)#创建UDP套接字
-        self.buffer = {}  #存储已接收但未按序排列的数据包
-        self.expected_seq = 1  #期望接收的下一个序列号
-        self.loss_rate = 0.2  #丢包率20%
-        self.server_address = None#服务器地址（IP和端口）
+        self.connections = {}#连接表：客户端地址 -> Connection
+        self.timers = []#定时器最小堆：(到期时刻, 序号, 客户端地址)
+        self.timer_count = 0#定时器序号，保证堆中元素可比较
+        self.loss_rate = loss_rate  #模拟丢包率，默认20%
+        self.rng = random.Random(seed)#模拟丢包的随机数生成器，设置种子后丢包序列可复现
+        self.server_address = (host, port)#服务器地址（IP和端口），绑定后为实际地址
+        self.bound = False
+        self.completed = 0#正常关闭的连接数
+        self.aborted = 0#放弃的连接数（超时或输出文件读写失败）
+        self.ack_every = ack_every#每按序收到ack_every个数据包至少确认一次；乱序包立即确认
+        self.gso = gso#是否用UDP GSO合并发送（仅Linux）
+        self.io = None#批量数据报I/O
+        self.delayed_acks = []#本轮收到数据、确认被延迟的连接
+        self.output_dir = output_dir#文件传输模式下接收文件的保存目录
+        self.metrics = self._create_metrics()#监控指标
+        self.metrics_port = metrics_port
+        self.metrics_server = None#指标HTTP接口，未启用时为None
+        self.running = False#事件循环是否继续运行，stop() 时清除
+        self.thread = None#start() 启动的后台线程
+
+    def bind(self):
+        #绑定套接字，返回实际监听地址
+        if not self.bound:
+            self.server_socket.bind(self.server_address)
+            self.server_address = self.server_socket.getsockname()
+            self.bound = True
+        return self.server_address
+
+    def serve_forever(self):
+        #在当前线程运行事件循环，直到 stop() 被调用（或 Ctrl+C）
+        server_ip, server_port = self.bind()
+        log.info(f"服务器已启动，监听地址: {server_ip}:{server_port}")
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, '127.0.0.1', self.metrics_port)
+            host, port = self.metrics_server.start()
+            log.info(f"指标接口: http://{host}:{port}/metrics（JSON: /metrics.json）")
+        self.running = True
+        try:
+            self._serve()
+        finally:
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+                self.metrics_server = None
 
     def start(self):
-        #主方法，控制服务器的运行流程
-        #获取用户输入的服务器IP和端口
-        server_ip = input("请输入服务器IP地址: ")
-        server_port = int(input("请输入服务器端口号: "))
-        self.server_address = (server_ip, server_port)
+        #在后台线程中运行，返回实际监听地址；用于在同一进程中启动多个服务器做测试和基准
+        address = self.bind()
+        self.running = True
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return address
+
+    def stop(self, timeout=None):
+        #停止事件循环并关闭套接字；没有定时器时事件循环可能一直等待，发送一个空数据报唤醒它
+        self.running = False
+        if self.thread is not None:
+            host, port = self.server_address
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as waker:
+                waker.sendto(b'', ('127.0.0.1' if host == '0.0.0.0' else host, port))
+            self.thread.join(timeout)
+            self.thread = None
+        self.close()
 
-        #绑定套接字到指定地址
-        self.server_socket.bind(self.server_address)
-        print(f"服务器已启动，监听地址: {server_ip}:{server_port}")
+    def close(self):
+        #关闭套接字
+        self.server_socket.close()
 
-        #模拟TCP三次握手
-        self._handle_connection_establishment()
+    def print_summary(self):
+        #打印连接和I/O统计
+        print(f"共完成 {self.completed} 个连接，放弃 {self.aborted} 个，当前 {len(self.connections)} 个")
+        if self.io is not None:
+            stats = self.io.stats()
+            print(f"收到 {stats['received']} 个数据报，recv 调用 {stats['recv_calls']} 次；"
+                  f"发送 {stats['sent']} 个数据报，send 调用 {stats['send_calls']} 次")
 
-        #数据接收循环
+    def _create_metrics(self):
+        #创建指标：计数器在处理报文时O(1)更新，已有的统计（连接数、I/O计数）在导出时读取
+        m = Registry('udp_')
+        io_stat = lambda key: (lambda: self.io.stats()[key] if self.io is not None else 0)
+        m.counter('datagrams_received_total', "收到的数据报数", fn=io_stat('received'))
+        m.counter('datagrams_sent_total', "发送的数据报数", fn=io_stat('sent'))
+        m.counter('recv_calls_total', "接收系统调用次数", fn=io_stat('recv_calls'))
+        m.counter('send_calls_total', "发送系统调用次数", fn=io_stat('send_calls'))
+        m.counter('send_dropped_total', "发送缓冲区满而丢弃的数据报数", fn=io_stat('send_dropped'))
+        self.data_packets = m.counter('data_packets_total', "收到的数据包数（不含模拟丢弃的）")
+        self.data_bytes = m.counter('data_bytes_total', "首次收到的数据包的数据字节数")
+        self.duplicates = m.counter('duplicate_packets_total', "重复收到的数据包数（客户端重传或网络复制）")
+        self.out_of_order = m.counter('out_of_order_packets_total', "乱序到达并被缓存的数据包数")
+        self.out_of_window = m.counter('out_of_window_packets_total', "序号超出接收窗口而丢弃的数据包和校验包数")
+        self.dropped = m.counter('dropped_packets_total', "模拟丢弃的数据包数（含校验包）")
+        self.parity_packets = m.counter('fec_parity_packets_total', "收到的FEC校验包数（不含模拟丢弃的）")
+        self.fec_recovered = m.counter('fec_recovered_packets_total', "由FEC校验包恢复、无需重传的数据包数")
+        self.compressed_packets = m.counter('compressed_packets_total', "收到的压缩数据包和校验包数（不含模拟丢弃的）")
+        self.wire_bytes = m.counter('compressed_wire_bytes_total', "压缩包解压前的数据字节数")
+        self.inflated_bytes = m.counter('compressed_logical_bytes_total', "压缩包解压后的数据字节数")
+        self.inflate_errors = m.counter('decompress_errors_total', "解压失败或超长而丢弃的包数")
+        self.acks_sent = m.counter('acks_sent_total', "发送的确认包数")
+        self.control_retransmits = m.counter('control_retransmits_total', "超时重传的SYN+ACK和FIN次数")
+        self.rejected_syns = m.counter('rejected_syn_total', "参数不合法或无法创建输出文件而拒绝的SYN数")
+        self.fast_opens = m.counter('fast_open_connections_total', "快速打开的连接数")
+        self.fast_closes = m.counter('fast_close_total', "数据收齐后在确认中捎带FIN关闭的连接数")
+        m.counter('connections_completed_total', "正常关闭的连接数", fn=lambda: self.completed)
+        m.counter('connections_aborted_total', "放弃的连接数（超时或输出文件读写失败）", fn=lambda: self.aborted)
+        m.gauge('active_connections', "当前连接数", fn=lambda: len(self.connections))
+        self.batch_seconds = m.histogram('batch_seconds', "处理一批已到达报文（含发送确认）的时间（秒）")
+        self.connection_seconds = m.histogram('connection_seconds', "连接从SYN到关闭的持续时间（秒）")
+        return m
+
+    def _serve(self):
+        #事件循环：一个套接字服务所有客户端，按客户端地址把报文分发到各自的连接
+        #套接字可读时一次取完所有已到达的报文，处理完后合并发送确认；没有报文时睡到最近的定时器到期
+        try:
+            #并发会话很多时增大接收缓冲区，减少突发时内核丢包
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        except OSError:
+            pass
+        self.io = DatagramIO(self.server_socket, size=MAX_DATAGRAM, gso=self.gso)
         try:
-            while True:
-                data, client_address = self.server_socket.recvfrom(1024)#接收客户端数据
-                packet = self._parse_packet(data)#解析数据包
-
-                #处理FIN包
-                if packet['fin']:
-                    self._handle_connection_closure(client_address, packet)
-                    break
-
-                #模拟20%丢包率
-                if random.random() < self.loss_rate:
-                    print(f"模拟丢包: 第{packet['seq']}个数据包")
-                    continue
-                # 处理数据包
-                self._handle_packet(client_address, packet)
-
-        except KeyboardInterrupt:
-            print("\n程序被用户中断")
+            while self.running:
+                timeout = max(self.timers[0][0] - time.monotonic(), 0) if self.timers else None
+                if self.io.wait(timeout):
+                    started = time.perf_counter()
+                    while True:
+                        packets = self.io.drain()#接收客户端数据
+                        for data, client_address in packets:
+                            if len(data) >= HEADER.size:
+                                self._dispatch(client_address, decode(data))
+                        if len(packets) < len(self.io.views):
+                            break
+                    self._flush_delayed_acks()
+                    self.batch_seconds.observe(time.perf_counter() - started)
+                self._run_timers(time.monotonic())
+                self.io.flush()
         finally:
-            self.server_socket.close()#关闭套接字
-
-    def _handle_connection_establishment(self):
-        #模拟TCP三次握手
-        #1. 接收客户端的SYN包
-        while True:
-            data, client_address = self.server_socket.recvfrom(1024)
-            packet = self._parse_packet(data)
-            if packet['syn']:#检查是否为SYN包
-                break
-
-        #2. 发送SYN+ACK包
-        syn_ack_packet = self._create_packet(seq=1, ack=packet['seq'] + 1, syn=1, fin=0, data=b'')
-        self.server_socket.sendto(syn_ack_packet, client_address)
-
-        #3. 接收客户端的ACK包
-        while True:
+            self.io.close()
+
+    def _dispatch(self, client_address, packet):
+        #按连接状态处理一个报文
+        conn = self.connections.get(client_address)
+        if packet.syn:
+            self._handle_syn(client_address, packet, conn)
+            return
+        if conn is None:
+            return#不属于任何连接的报文（例如连接已回收后迟到的重传），丢弃
+        conn.last_active = time.monotonic()
+
+        if conn.state == LAST_ACK:
+            if packet.fin or (packet.data and conn.final_seq is not None):
+                #客户端没收到ACK/FIN，重发；快速打开的客户端没收到捎带FIN的确认时会继续重传数据包
+                self._send_control(conn)
+            elif packet.ack:
+                self._close(conn, "连接已关闭", completed=True)#收到最终ACK，四次挥手完成
+            return
+
+        #处理FIN包
+        if packet.fin:
+            self._handle_fin(conn, packet)
+            return
+
+        if not packet.data:
+            #不带数据的ACK：第三次握手
+            if conn.state == SYN_RCVD and packet.ack:
+                self._establish(conn)
+            return
+
+        #数据包：握手的ACK丢失时，收到数据也表示客户端已收到SYN+ACK
+        if conn.state == SYN_RCVD:
+            self._establish(conn)
+        if packet.seq >= conn.expected_seq + RECV_WINDOW:
+            self.out_of_window.inc()
+            return#超出接收窗口，不缓存，客户端窗口前移后会重传
+        #模拟丢包
+        if self.loss_rate > 0 and self.rng.random() < self.loss_rate:
+            self.dropped.inc()
+            log.debug("%s 模拟丢包: 第%d个数据包%s", conn.address, packet.seq, "所在分组的校验包" if packet.fec else "")
+            return
+        # 压缩包先解压，之后的处理与未压缩的包相同
+        if packet.zlib:
+            packet = self._inflate(conn, packet)
+            if packet is None:
+                return
+        # 处理FEC校验包或数据包
+        try:
+            if packet.fec:
+                self._handle_parity(conn, packet)
+            else:
+                self._handle_packet(conn, packet)
+        except OSError as e:
+            #写入或读回输出文件失败（磁盘空间不足、I/O错误等）：只放弃该连接，不影响事件循环和其他连接
+            log.warning(f"{conn.address} 输出文件 {conn.sink.path} 读写失败: {e}")
+            self._close(conn, "输出文件读写失败，已放弃")
+
+    def _handle_syn(self, client_address, packet, conn):
+        #模拟TCP三次握手：收到SYN，回复SYN+ACK
+        #SYN数据部分为4字节连接ID（旧客户端不携带，视为0），同一地址的连接ID不同表示客户端开始了新的会话
+        #文件传输模式下之后还有每包数据长度、文件大小和文件名
+        #快速打开（fast标志）时连接直接进入ESTABLISHED，客户端不发送第三次握手的ACK，数据随SYN一起到达
+        conn_id = CONN_ID.unpack_from(packet.data)[0] if len(packet.data) >= CONN_ID.size else 0
+        if conn is not None and conn.conn_id == conn_id:
+            if conn.state == SYN_RCVD:
+                self._send_control(conn)#SYN重传：客户端没有收到SYN+ACK
+            elif conn.state == ESTABLISHED and conn.control_packets:
+                for control_packet in conn.control_packets:
+                    self.io.send(control_packet, conn.address)#快速打开的SYN重传：只重发SYN+ACK，不设定时器
+            return
+        #SYN中的参数来自未经认证的客户端，先检查再替换旧连接，不合法时只丢弃该SYN
+        reason = self._check_syn(packet)
+        if reason is not None:
+            self.rejected_syns.inc()
+            log.warning(f"{client_address} 拒绝SYN：{reason}")
+            return
+        sink = None
+        if len(packet.data) >= FILE_INFO.size:
+            _, payload_size, file_size = FILE_INFO.unpack_from(packet.data)
+            name = safe_name(bytes(packet.data[FILE_INFO.size:]))
+            path = os.path.join(self.output_dir, f"{conn_id}_{name}")
             try:
-                self.server_socket.settimeout(1.0)#设置1秒超时
-                data, client_address = self.server_socket.recvfrom(1024)
-                packet = self._parse_packet(data)
-                if packet['ack']:#检查是否为ACK包
-                    break
-            except socket.timeout:
-                # 超时重传SYN+ACK
-                self.server_socket.sendto(syn_ack_packet, client_address)
-
-        print("连接已建立")
-
-    def _handle_connection_closure(self, client_address, packet):
+                os.makedirs(self.output_dir, exist_ok=True)
+                sink = FileSink(path, file_size, payload_size)
+            except (OSError, ValueError, OverflowError) as e:
+                self.rejected_syns.inc()
+                log.warning(f"{client_address} 无法创建输出文件 {path}，拒绝SYN：{e}")
+                return
+        if conn is not None:
+            self._close(conn, "旧连接被新的SYN替换")
+
+        #发送SYN+ACK包，客户端请求SR模式时回送sack标志表示同意，并回送连接ID
+        #客户端请求FEC（fec标志，ack字段为分组大小K）且K合法时回送fec标志表示同意，请求压缩（zlib标志）时同样回送
+        compress = bool(packet.zlib)
+        fec = ParityDecoder(packet.ack) if packet.fec and 1 <= packet.ack <= FEC_MAX_K else None
+        if sink is not None:
+            conn = Connection(client_address, conn_id, bool(packet.sack), sink.payload_size, sink, fec, compress)
+            log.info(f"{client_address} 请求发送文件 {name}（{file_size} 字节，每包 {payload_size} 字节），保存到 {sink.path}")
+        else:
+            conn = Connection(client_address, conn_id, bool(packet.sack), fec=fec, compress=compress)
+        self.connections[client_address] = conn
+        conn.control_packets = [encode(1, packet.seq + 1,
+                                       make_flags(syn=1, sack=packet.sack, fec=int(fec is not None), zlib=packet.zlib,
+                                                  fast=packet.fast),
+                                       packet.timestamp, bytes(packet.data[:CONN_ID.size]))]
+        if not packet.fast:
+            self._send_control(conn)
+            return
+        #快速打开：最后一个序号来自文件大小或SYN中的数据包总数，全部交付后由 _fast_close 结束连接
+        if conn.sink is not None:
+            conn.final_seq = conn.sink.total_packets
+        elif len(packet.data) >= FAST_INFO.size:
+            conn.final_seq = FAST_INFO.unpack_from(packet.data)[1]
+        self.fast_opens.inc()
+        for control_packet in conn.control_packets:
+            self.io.send(control_packet, conn.address)
+        self._establish(conn, fast=True)
+        if self._finished(conn):
+            self._fast_close(conn)#没有数据要传输
+
+    def _check_syn(self, packet):
+        #检查SYN数据部分的参数：每包数据长度在1到MAX_PAYLOAD之间，文件不超过MAX_FILE_SIZE，
+        #数据包总数（文件模式由文件大小算出，快速打开的合成数据模式直接给出）不超过MAX_SEQ
+        #返回：不合法时为原因，否则为None
+        if len(packet.data) >= FILE_INFO.size:
+            _, payload_size, file_size = FILE_INFO.unpack_from(packet.data)
+            if not 1 <= payload_size <= MAX_PAYLOAD:
+                return f"每包数据长度 {payload_size} 不在1到{MAX_PAYLOAD}之间"
+            if file_size > MAX_FILE_SIZE:
+                return f"文件大小 {file_size} 超过上限 {MAX_FILE_SIZE}"
+            total_packets = (file_size + payload_size - 1) // payload_size
+        elif packet.fast and len(packet.data) >= FAST_INFO.size:
+            total_packets = FAST_INFO.unpack_from(packet.data)[1]
+        else:
+            return None
+        if total_packets > MAX_SEQ:
+            return f"数据包总数 {total_packets} 超过序号上限 {MAX_SEQ}"
+        return None
+
+    def _establish(self, conn, fast=False):
+        #第三次握手完成，连接进入ESTABLISHED，定时器改为空闲超时检测
+        #SYN+ACK没有重传过时，从收到SYN到此刻的时间即为一个RTT的估计
+        #快速打开（fast）的连接在收到SYN时就进入ESTABLISHED，没有RTT估计，保留SYN+ACK以便客户端重传SYN时回复
+        if not fast:
+            if conn.retries == 0:
+                conn.rtt = time.monotonic() - conn.opened
+            conn.control_packets = []
+        conn.state = ESTABLISHED
+        self._schedule(conn, conn.last_active + IDLE_TIMEOUT)
+        log.info(f"{conn.address} 连接已建立（连接ID {conn.conn_id}），重传模式: {'SR' if conn.selective else 'GBN'}，"
+                 f"FEC: {f'每{conn.fec.k}个数据包1个校验包' if conn.fec else '关闭'}，压缩: {'开启' if conn.compress else '关闭'}，"
+                 f"{'快速打开，' if fast else ''}当前连接数: {len(self.connections)}")
+
+    def _handle_fin(self, conn, packet):
         # 模拟 TCP 四次挥手
         # 1. 发送 ACK 包，确认客户端的 FIN
-        ack_packet = self._create_packet(seq=packet['ack'], ack=packet['seq'] + 1, syn=0, fin=0, data=b'')
-        self.server_socket.sendto(ack_packet, client_address)
+        ack_packet = encode(packet.ack, packet.seq + 1, 0, packet.timestamp)
+        # 2. 发送 FIN 包，文件传输模式下数据为按实际写入的数据计算的 SHA-256
+        digest = self._finish_file(conn, bytes(packet.data)) if conn.sink is not None else b''
+        fin_packet = encode(packet.ack + 1, packet.seq + 1, make_flags(fin=1), packet.timestamp, digest)
+        # 3. 进入LAST_ACK等待客户端的 ACK 包，超时则重传
+        conn.state = LAST_ACK
+        conn.buffer.clear()
+        conn.control_packets = [ack_packet, fin_packet]
+        conn.retries = 0
+        self._send_control(conn)
 
-        # 2. 发送 FIN 包
-        fin_packet = self._create_packet(seq=packet['ack'] + 1, ack=packet['seq'] + 1, syn=0, fin=1, data=b'')
-        self.server_socket.sendto(fin_packet, client_address)
+    def _fast_close(self, conn):
+        # 快速打开的连接已收齐全部数据：FIN 捎带在最后的累计确认中（ack 为最后一个序号，数据为文件的 SHA-256），
+        # 进入LAST_ACK等待客户端的最终ACK，超时重传；不再等待客户端的FIN
+        digest = self._finish_file(conn, None) if conn.sink is not None else b''
+        fin_packet = encode(conn.final_seq + 1, conn.expected_seq - 1, make_flags(fin=1), conn.ack_timestamp, digest)
+        conn.state = LAST_ACK
+        conn.buffer.clear()
+        conn.ack_owed = 0#捎带FIN的确认已覆盖延迟的确认
+        conn.control_packets = [fin_packet]
+        conn.retries = 0
+        self.fast_closes.inc()
+        self._send_control(conn)
 
-        # 3. 接收客户端的 ACK 包
-        while True:
-            try:
-                self.server_socket.settimeout(1.0)
-                data, _ = self.server_socket.recvfrom(1024)
-                packet = self._parse_packet(data)
-                if packet['ack']:# 检查是否为 ACK 包
-                    break
-            except socket.timeout:
-                # 超时重传 FIN 包
-                self.server_socket.sendto(fin_packet, client_address)
-
-        print("连接已关闭")
-
-    def _handle_packet(self, client_address, packet):
-        # 处理接收到的数据包（实现 GBN 协议的累计确认）
+    def _finished(self, conn):
+        # 快速打开的连接是否已按序收到最后一个数据包
+        return conn.final_seq is not None and conn.expected_seq > conn.final_seq and conn.state == ESTABLISHED
+
+    def _finish_file(self, conn, client_digest):
+        # 文件接收结束：关闭文件，与客户端在 FIN 中给出的 SHA-256 比较
+        # client_digest 为 None 表示快速关闭：客户端的 FIN 不再单独发送，由客户端比较服务器返回的校验值
+        # 返回：服务器计算的 SHA-256（数据不完整时为空）
+        sink = conn.sink
+        sink.close()
+        if conn.expected_seq <= sink.total_packets:
+            log.warning(f"{conn.address} 文件 {sink.path} 不完整：收到 {conn.expected_seq - 1}/{sink.total_packets} 个数据包")
+            return b''
+        digest = sink.digest.digest()
+        if client_digest is None:
+            log.info(f"{conn.address} 文件 {sink.path} 接收完成，SHA-256: {digest.hex()}（由客户端校验）")
+        elif digest == client_digest:
+            log.info(f"{conn.address} 文件 {sink.path} 接收完成，校验通过，SHA-256: {digest.hex()}")
+        else:
+            log.warning(f"{conn.address} 文件 {sink.path} 校验失败！客户端 {client_digest.hex()}，服务器 {digest.hex()}")
+        return digest
+
+    def _send_control(self, conn):
+        #发送当前状态的控制报文并设置重传定时器
+        for control_packet in conn.control_packets:
+            self.io.send(control_packet, conn.address)
+        self._schedule(conn, time.monotonic() + self._control_rto(conn))
+
+    def _control_rto(self, conn):
+        #控制报文的重传间隔：有握手RTT估计时从其 CONTROL_RTT_FACTOR 倍开始、每次重传加倍，
+        #限制在 CONTROL_RTO_MIN 到 CONTROL_RTO 之间；没有估计时为 CONTROL_RTO
+        if conn.rtt is None:
+            return CONTROL_RTO
+        return min(max(conn.rtt * CONTROL_RTT_FACTOR, CONTROL_RTO_MIN) * (1 << conn.retries), CONTROL_RTO)
+
+    def _close(self, conn, reason, completed=False):
+        #从连接表中移除连接，其定时器在到期时被忽略
+        #参数：
+        # -reason: 打印的关闭原因
+        # -completed: 是否为正常完成的连接（数据已全部收到）
+        if self.connections.get(conn.address) is conn:
+            del self.connections[conn.address]
+        if conn.sink is not None and conn.state != LAST_ACK:
+            conn.sink.close()#未正常结束的文件传输，保留已写入的部分
+        if completed:
+            self.completed += 1
+        else:
+            self.aborted += 1
+        self.connection_seconds.observe(time.monotonic() - conn.opened)
+        if conn.fec is not None:
+            conn.fec.clear()
+            reason += f"（FEC恢复 {conn.fec.recovered} 个数据包）"
+        log.info(f"{conn.address} {reason}，当前连接数: {len(self.connections)}")
+
+    def _schedule(self, conn, deadline):
+        #设置连接的定时器；每个连接只有最新的定时器有效，旧定时器惰性取消
+        conn.deadline = deadline
+        self.timer_count += 1
+        heapq.heappush(self.timers, (deadline, self.timer_count, conn))
+
+    def _run_timers(self, now):
+        #处理所有已到期的定时器
+        while self.timers and self.timers[0][0] <= now:
+            deadline, _, conn = heapq.heappop(self.timers)
+            if conn.deadline != deadline or self.connections.get(conn.address) is not conn:
+                continue#已被新的定时器取代或连接已移除
+            if conn.state == ESTABLISHED:
+                #空闲超时检测：收到报文时只更新last_active，到期时再判断是否真的空闲
+                if now - conn.last_active >= IDLE_TIMEOUT:
+                    self._close(conn, "连接空闲超时，已回收")
+                else:
+                    self._schedule(conn, conn.last_active + IDLE_TIMEOUT)
+            elif conn.retries < CONTROL_RETRIES:
+                # 超时重传 SYN+ACK 或 FIN
+                conn.retries += 1
+                self.control_retransmits.inc()
+                self._send_control(conn)
+            elif conn.state == LAST_ACK:
+                #最终ACK多次未到达，数据已全部收到，按关闭处理
+                self._close(conn, "未收到最终ACK，连接已关闭", completed=True)
+            else:
+                self._close(conn, "握手超时，已放弃")
+
+    def _handle_packet(self, conn, packet):
+        # 处理接收到的数据包（GBN 累计确认；SR 模式下另加逐包确认和 SACK 位图）
         # 参数：
-        # - client_address: 客户端地址
+        # - conn: 数据包所属的连接
         # - packet: 解析后的数据包
-        seq_num = packet['seq']
-
-        # 情况 1：收到期望的或之前的包（可能是重传
-        if seq_num <= self.expected_seq:
-            # 存储数据包
-            self.buffer[seq_num] = packet# 存储数据包
-
-            # 按序交付：从expected_seq开始连续交付
-            while self.expected_seq in self.buffer:
-                # 处理数据（这里只是打印）
-                start_byte = (self.expected_seq - 1) * 80 + 1 # 数据起始字节
-                end_byte = self.expected_seq * 80 # 数据结束字节
-                print(f"已接收第{self.expected_seq}个（第{start_byte}-{end_byte}字节）数据包")
-                del self.buffer[self.expected_seq]# 删除已交付的数据包
-                self.expected_seq += 1# 更新期望序号
-
-            # 发送累计确认
-            ack_packet = self._create_packet(
-                seq=packet['ack'],
-                ack=self.expected_seq - 1, # 确认最大的连续接收序号
-                syn=0,
-                fin=0,
-                data=b''
-            )
-            self.server_socket.sendto(ack_packet, client_address)
+        seq_num = packet.seq
+
+        # 存储期望的或乱序到达的数据包；已交付过的旧包（重传）不再存储
+        in_order = seq_num == conn.expected_seq
+        self.data_packets.inc()
+        recovered = None
+        if seq_num >= conn.expected_seq and seq_num not in conn.buffer:
+            if not self._store(conn, seq_num, packet.data):
+                return# 序号或长度不合法，丢弃
+            if not in_order:
+                self.out_of_order.inc()
+            if conn.fec is not None:
+                #校验包先于组内最后的数据包到达（乱序）时，此时才能恢复
+                recovered = conn.fec.add(seq_num, packet.data)
         else:
-            # 情况 2：收到乱序数据包，缓存并发送当前确认
-            self.buffer[seq_num] = packet
-
-            # 发送当前的ACK
-            ack_packet = self._create_packet(
-                seq=packet['ack'],
-                ack=self.expected_seq - 1,
-                syn=0,
-                fin=0,
-                data=b''
-            )
-            self.server_socket.sendto(ack_packet, client_address)
-
-    def _create_packet(self, seq, ack, syn, fin, data):
-        # 创建自定义协议数据包
-        # 参数：
-        # - seq: 序列号（4 字节）
-        # - ack: 确认号（4 字节）
-        # - syn: 同步标志（1 位）
-        # - fin: 结束标志（1 位）
-        # - data: 数据部分
-        flags = (syn << 1) | fin# 组合标志位
-        timestamp = int(time.time())# 获取当前时间戳
-        header = struct.pack('!IIBI', seq, ack, flags, timestamp)# 大端序打包首部
-        return header + data# 拼接首部和数据
-
-    def _parse_packet(self, packet_data):
-        # 解析接收到的数据包
-        # 参数：
-        # - packet_data: 接收到的字节数据
-        # 返回：包含 seq、ack、syn、fin、timestamp、data 的字典
-        header = packet_data[:13]# 提取 13 字节首部
-        seq, ack, flags, timestamp = struct.unpack('!IIBI', header)# 大端序解包
-        syn = (flags & 0x02) >> 1# 提取 syn 标志
-        fin = flags & 0x01 # 提取 fin 标志
-        return {
-            'seq': seq,
-            'ack': ack,
-            'syn': syn,
-            'fin': fin,
-            'timestamp': timestamp,
-            'data': packet_data[13:]# 提取数据部分
-        }
+            self.duplicates.inc()
+        if recovered is not None:
+            if self._store(conn, *recovered):
+                self.fec_recovered.inc()
+            else:
+                recovered = None
+        self._deliver(conn, seq_num, packet.data)
+
+        # 延迟确认：按序到达的包每 ack_every 个确认一次，其余在本轮接收结束时合并确认；
+        # 乱序包和重复包立即确认，让客户端及时收到重复确认/SACK 信息
+        conn.ack_seq = seq_num if conn.selective else packet.ack
+        conn.ack_timestamp = packet.timestamp#确认回送该包的时间戳，客户端据此计算RTT
+        if self._finished(conn):
+            self._fast_close(conn)#快速打开：最后的确认捎带FIN
+            return
+        if recovered is not None:
+            self._send_recovered_ack(conn, recovered[0])
+            return
+        if in_order:
+            if conn.ack_owed == 0:
+                self.delayed_acks.append(conn)
+            conn.ack_owed += 1
+            if conn.ack_owed < self.ack_every:
+                return
+        self._send_ack(conn)
+
+    def _inflate(self, conn, packet):
+        # 解压一个压缩包的数据部分，返回数据替换为解压结果的报文
+        # 解压后最长为每包数据长度（校验包再加长度字段；合成数据模式不知道包长，以数据报大小为限），
+        # 超长或损坏的包丢弃，交给重传
+        # 返回：Packet，未协商压缩或解压失败时为None
+        if not conn.compress:
+            return None
+        limit = (conn.payload_size if conn.sink is not None else MAX_DATAGRAM) + FEC_LENGTH.size * packet.fec
+        inflater = zlib.decompressobj()
+        try:
+            data = inflater.decompress(packet.data, limit)
+        except zlib.error:
+            data = None
+        if data is None or not inflater.eof or inflater.unconsumed_tail:
+            self.inflate_errors.inc()
+            log.debug("%s 第%d个%s解压失败，已丢弃", conn.address, packet.seq, "校验包" if packet.fec else "数据包")
+            return None
+        self.compressed_packets.inc()
+        self.wire_bytes.inc(len(packet.data))
+        self.inflated_bytes.inc(len(data))
+        return packet._replace(data=data)
+
+    def _handle_parity(self, conn, packet):
+        # 处理FEC校验包：组内恰好缺一个数据包时直接恢复，不必等待客户端超时重传
+        # seq 为组内第一个序号，ack 为组内数据包个数；未协商FEC的连接忽略校验包
+        if conn.fec is None:
+            return
+        self.parity_packets.inc()
+        recovered = conn.fec.add_parity(packet.seq, packet.ack, packet.data, conn.expected_seq)
+        if recovered is None or not self._store(conn, *recovered):
+            return
+        self.fec_recovered.inc()
+        self._deliver(conn, recovered[0], recovered[1])
+        conn.ack_timestamp = packet.timestamp
+        if self._finished(conn):
+            self._fast_close(conn)
+            return
+        self._send_recovered_ack(conn, recovered[0])
+
+    def _store(self, conn, seq_num, data):
+        # 记录首次收到（或恢复）的数据包；文件传输模式下数据直接写入输出文件的对应偏移
+        # 返回：序号或长度不合法时为 False
+        if conn.sink is not None and not conn.sink.write(seq_num, data):
+            return False
+        conn.buffer.add(seq_num)# 记录已收到的序号
+        self.data_bytes.inc(len(data))
+        return True
+
+    def _deliver(self, conn, seq_num, data):
+        # 按序交付：从expected_seq开始连续交付；data 为序号 seq_num 的数据，其余序号从文件读回
+        while conn.expected_seq in conn.buffer:
+            # 处理数据：文件传输模式下更新校验值，合成数据只打印
+            if conn.sink is not None:
+                conn.sink.deliver(conn.expected_seq, data if conn.expected_seq == seq_num else None)
+            if conn.fec is not None:
+                conn.fec.release(conn.expected_seq)
+            start_byte = (conn.expected_seq - 1) * conn.payload_size + 1 # 数据起始字节
+            end_byte = conn.expected_seq * conn.payload_size # 数据结束字节
+            log.debug("%s 已接收第%d个（第%d-%d字节）数据包", conn.address, conn.expected_seq, start_byte, end_byte)
+            conn.buffer.discard(conn.expected_seq)# 删除已交付的序号
+            conn.expected_seq += 1# 更新期望序号
+
+    def _send_recovered_ack(self, conn, seq_num):
+        # 由校验包恢复了数据包：立即发送置 fec 标志的确认，seq 为恢复的序号，让客户端尽快前移窗口
+        log.debug("%s 由校验包恢复第%d个数据包", conn.address, seq_num)
+        conn.ack_seq = seq_num
+        self._send_ack(conn, FLAG_FEC)
+
+    def _flush_delayed_acks(self):
+        # 本轮接收结束：为仍有未确认数据的连接发送一个合并的确认
+        for conn in self.delayed_acks:
+            if conn.ack_owed and self.connections.get(conn.address) is conn:
+                self._send_ack(conn)
+        self.delayed_acks = []
+
+    def _send_ack(self, conn, flags=0):
+        # 发送确认：ack 为最大的连续接收序号，时间戳字段回送触发确认的数据包的时间戳
+        # SR：seq 字段回送最近收到的序号，数据部分携带已缓存乱序包的位图
+        # flags: 附加的标志位（由校验包恢复时为 FLAG_FEC）
+        conn.ack_owed = 0
+        bitmap = self._sack_bitmap(conn) if conn.selective else b''
+        buf = self.io.reserve(HEADER.size + len(bitmap))#直接编码到发送缓冲区
+        encode_into(buf, conn.ack_seq, conn.expected_seq - 1, (FLAG_SACK if conn.selective else 0) | flags,
+                    conn.ack_timestamp, bitmap)
+        self.io.send(buf, conn.address)
+        self.acks_sent.inc()
+
+    def _sack_bitmap(self, conn):
+        # 生成 SACK 位图：第 i 位表示序号 expected_seq+1+i 已缓存
+        # （expected_seq 本身一定尚未收到，所以从它的下一个开始）
+        bitmap = bytearray()
+        for seq in conn.buffer:
+            i = seq - conn.expected_seq - 1
+            if 0 <= i < SACK_MAX_BYTES * 8:
+                if i // 8 >= len(bitmap):
+                    bitmap.extend(bytes(i // 8 + 1 - len(bitmap)))
+                bitmap[i // 8] |= 1 << (i % 8)
+        return bytes(bitmap)
+
+
+def parse_args(argv):
+    #解析命令行参数；--config 指定的 JSON 文件提供默认值（键为选项名），命令行参数优先
+    parser = argparse.ArgumentParser(description="UDP 可靠传输服务器（不带参数运行时交互式输入配置）")
+    parser.add_argument('--config', help="JSON 配置文件，例如 {\"port\": 12345, \"loss_rate\": 0}")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=12345, help="监听端口，0 为自动分配")
+    parser.add_argument('--loss-rate', type=float, default=0.2, help="模拟丢包率，经 netem.py 测试时设为0")
+    parser.add_argument('--seed', type=int, help="模拟丢包的随机种子")
+    parser.add_argument('--ack-every', type=int, default=2, help="每按序收到多少个数据包至少确认一次")
+    parser.add_argument('--gso', action='store_true', help="启用UDP GSO合并发送（仅Linux）")
+    parser.add_argument('--output-dir', default='received', help="文件传输模式下接收文件的保存目录")
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'], default='info',
+                        help="日志级别，debug 输出逐包日志")
+    parser.add_argument('--log-sample', type=int, default=1, help="debug 日志每 N 条输出 1 条")
+    parser.add_argument('--metrics-port', type=int, help="监控指标HTTP端口，0 为自动分配，不指定则不启用")
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            parser.set_defaults(**{k.replace('-', '_'): v for k, v in json.load(f).items()})
+        args = parser.parse_args(argv)
+    return args
+
+
+def prompt_args():
+    #交互式输入配置，返回与 parse_args 相同的参数对象
+    #获取用户输入的服务器IP和端口
+    server_ip = input("请输入服务器IP地址: ")
+    server_port = int(input("请输入服务器端口号: "))
+    #模拟丢包：经 netem.py 代理测试时可设为0，由代理在两个方向上模拟丢包、时延和乱序
+    loss_text = input("请输入模拟丢包率（直接回车为0.2）: ").strip()
+    seed_text = input("请输入丢包随机种子（直接回车为不固定）: ").strip()
+    #日志与监控：逐包日志为debug级别，大量数据时可采样输出或改为info关闭
+    level = input("请输入日志级别 debug/info/warning（直接回车为debug，逐包输出）: ").strip() or 'debug'
+    sample = 1
+    if level == 'debug':
+        sample_text = input("逐包日志采样：每N条输出1条（直接回车为1，全部输出）: ").strip()
+        sample = int(sample_text) if sample_text else 1
+    metrics_text = input("请输入监控指标HTTP端口（直接回车不启用，0为自动分配）: ").strip()
+    return argparse.Namespace(host=server_ip, port=server_port, loss_rate=float(loss_text) if loss_text else 0.2,
+                              seed=int(seed_text) if seed_text else None, ack_every=2, gso=False,
+                              output_dir='received', log_level=level, log_sample=sample,
+                              metrics_port=int(metrics_text) if metrics_text else None)
+
+
+def main(argv=None):
+    #主函数：带命令行参数时按参数（和配置文件）运行，否则交互式输入配置
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv) if argv else prompt_args()
+    setup_logging('udpserver', args.log_level, args.log_sample)
+    server = UDPServer(args.host, args.port, args.loss_rate, args.seed, args.ack_every, args.gso,
+                       args.output_dir, args.metrics_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n程序被用户中断")
+    finally:
+        server.print_summary()
+        server.close()#关闭套接字
 
 
 if __name__ == "__main__":
-    server = UDPServer()
-    server.start()
\ No newline at end of file
+    main()